@@ -5,17 +5,112 @@ Este agente consulta apenas dados existentes no MongoDB e responde em português
 
 import os
 import re
-from typing import List, Dict, Any, Optional, Tuple
+import calendar
+import queue
+import threading
+import time
+from typing import List, Dict, Any, Optional, Tuple, Callable, Iterator
 from datetime import datetime
 from pymongo import MongoClient
-from langchain_openai import ChatOpenAI, OpenAIEmbeddings
-from langchain_community.vectorstores import FAISS
-from langchain.chains import ConversationalRetrievalChain
-from langchain.memory import ConversationBufferMemory
+# langchain_openai, FAISS, chains e a memória do LangChain são importados
+# nos métodos que os usam: as consultas diretas não dependem deles
 from langchain_core.documents import Document
-from langchain_text_splitters import RecursiveCharacterTextSplitter
-import json
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.retrievers import BaseRetriever
+from database import db_config
 from modules.detector_fraude import DetectorFraude
+from modules.cache_consultas import obter_cache_consultas, gerar_chave_intencao, TODAS_COLECOES
+from modules.rankings_materializados import obter_rankings
+from modules.heavy_hitters import obter_sketches
+from modules.sessoes_conversa import PoolSessoes, SessaoConversa
+from modules.cache_llm import obter_cache_llm, ColetorDocumentos
+from modules.coalescencia import obter_coalescedor
+from modules.planejador_consultas import obter_planejador, ConsultaAST, mesclar_resultados
+from modules.catalogo_colecoes import obter_catalogo
+from modules.corpus_vetorial import obter_construtor_corpus
+from modules.indice_vetorial import criar_vectorstore
+from modules.codificacao_documentos import obter_codificador_documentos, MODO_COMPACTO
+from modules.indice_identificadores import obter_indice_identificadores, extrair_identificadores
+from modules.analise_inconsistencias import obter_analisador_inconsistencias
+from modules.historico_conversas import obter_gerenciador
+from modules.rastreamento import (
+    rastrear, span, registrar_span, obter_registro_metricas, Span, COMPONENTE_AGENTE, METRICA_PERGUNTA
+)
+from modules.renderizacao_respostas import (
+    renderizar, renderizar_tabela, renderizar_resposta, renderizar_aviso, renderizar_nota,
+    AVISO_ERRO, AVISO_ALERTA, AVISO_SUCESSO
+)
+from modules.respostas_estruturadas import (
+    coletar_resposta, coletor_ativo, montar_resposta, registrar_tabela, registrar_resumo, registrar_link
+)
+
+
+class EncaminhadorTokens(BaseCallbackHandler):
+    """Encaminha os tokens gerados pelo LLM para um callback de eventos."""
+    
+    def __init__(self, callback_evento: Callable[[str, Dict[str, Any]], None]):
+        self.callback_evento = callback_evento
+    
+    def on_llm_new_token(self, token: str, **kwargs) -> None:
+        if token:
+            self.callback_evento("token", {"texto": token})
+
+
+class RastreadorChain(BaseCallbackHandler):
+    """Registra spans da recuperação de documentos e de cada chamada ao LLM da chain."""
+    
+    def __init__(self, rastro):
+        self.rastro = rastro
+        self._abertos = {}
+    
+    def _abrir(self, run_id, nome: str):
+        self._abertos[run_id] = Span(COMPONENTE_AGENTE, nome, {}, 1)
+    
+    def _fechar(self, run_id, **atributos):
+        atual = self._abertos.pop(run_id, None)
+        if atual is not None:
+            atual.definir(**atributos)
+            registrar_span(atual, self.rastro)
+    
+    def on_retriever_start(self, serialized, query, *, run_id, **kwargs) -> None:
+        self._abrir(run_id, "recuperacao")
+    
+    def on_retriever_end(self, documents, *, run_id, **kwargs) -> None:
+        self._fechar(run_id, documentos=len(documents))
+    
+    def on_retriever_error(self, error, *, run_id, **kwargs) -> None:
+        self._fechar(run_id, erro=str(error))
+    
+    def on_chat_model_start(self, serialized, messages, *, run_id, **kwargs) -> None:
+        self._abrir(run_id, "llm")
+    
+    def on_llm_start(self, serialized, prompts, *, run_id, **kwargs) -> None:
+        self._abrir(run_id, "llm")
+    
+    def on_llm_end(self, response, *, run_id, **kwargs) -> None:
+        uso = (response.llm_output or {}).get("token_usage") or {}
+        self._fechar(run_id, **{chave: valor for chave, valor in uso.items() if isinstance(valor, int)})
+    
+    def on_llm_error(self, error, *, run_id, **kwargs) -> None:
+        self._fechar(run_id, erro=str(error))
+
+
+class RetrieverComCabecalho(BaseRetriever):
+    """
+    Recupera os documentos do vectorstore e antepõe um cabeçalho único com
+    as chaves abreviadas usadas neles (documentos compactos).
+    """
+    
+    base: Any
+    codificador: Any
+    
+    def _get_relevant_documents(self, query: str, *, run_manager) -> List[Document]:
+        # Sem callbacks: os documentos são registrados uma vez, no fim deste retriever
+        documentos = self.base.invoke(query)
+        cabecalho = self.codificador.cabecalho([doc.page_content for doc in documentos])
+        if not cabecalho:
+            return documentos
+        return [Document(page_content=cabecalho, metadata={"cabecalho": True})] + documentos
 
 
 class MongoDBAgent:
@@ -34,13 +129,44 @@ class MongoDBAgent:
         self.client = None
         self.db = None
         self.vectorstore = None
-        self.qa_chain = None
+        # Tipo, compressão, tamanho e tempos do índice vetorial criado
+        self.info_indice_vetorial = None
         self.embeddings = None
         self.llm = None
+        self.prompt_resposta = None
+        
+        # Sessões de conversa: memória e chain próprias por sessão,
+        # compartilhando vectorstore e LLM (criado em criar_agente)
+        self.sessoes = None
+        # Erro da última tentativa de preparar os modelos ou o índice vetorial (definido pelo aquecimento)
+        self.erro_preparacao = None
+        
+        # Cache para consultas frequentes (chaveado pela intenção canônica)
+        self.cache_consultas = obter_cache_consultas()
+        
+        # Rankings materializados para perguntas de "top N"
+        self.rankings = obter_rankings()
+        
+        # Resumos aproximados (heavy hitters) para coleções muito grandes
+        self.sketches = obter_sketches()
+        
+        # Perguntas idênticas simultâneas compartilham uma única execução
+        self.coalescedor = obter_coalescedor()
+        
+        # Compila consultas combinadas (filtros + período + agrupamento) em um pipeline
+        self.planejador = obter_planejador()
         
-        # Cache para consultas frequentes
-        self.cache_consultas = {}
-        self.cache_max_size = 50  # Máximo 50 consultas em cache
+        # Nomes, contagens estimadas e esquema das coleções em cache
+        self.catalogo = obter_catalogo()
+        
+        # Amostras estratificadas das coleções para o índice vetorial
+        self.construtor_corpus = obter_construtor_corpus()
+        
+        # Texto dos documentos no embedding e no prompt (detalhado ou compacto)
+        self.codificador_documentos = obter_codificador_documentos()
+        
+        # Índice invertido local de SKU, IDUSUARIO, LOJA e ID_DEVOLUCAO
+        self.indice_identificadores = obter_indice_identificadores()
         
         # Inicializar detector de fraude
         self.detector_fraude = None
@@ -174,6 +300,62 @@ class MongoDBAgent:
             ]
         }
         
+    # Rankings diretos por tipo de pergunta:
+    # (campo, coluna da tabela, rótulo do item, título, artigo, descrição)
+    RANKINGS_POR_TIPO = {
+        'top_sku': ('SKU', 'SKU', 'SKU', 'SKUs', 'Os', 'SKUs'),
+        'top_loja': ('LOJA', 'Loja', 'Loja', 'Lojas', 'As', 'lojas'),
+        'top_usuario': ('IDUSUARIO', 'ID Usuário', 'Usuário', 'Usuários', 'Os', 'usuários')
+    }
+    
+    # Dimensões que podem ser filtradas ("loja 12") ou agrupadas ("top 5 SKUs"):
+    # campo -> (palavras na pergunta, título no plural)
+    DIMENSOES_CONSULTA = {
+        'SKU': (['sku', 'skus', 'produto', 'produtos'], 'SKUs'),
+        'LOJA': (['loja', 'lojas', 'filial', 'filiais'], 'Lojas'),
+        'IDUSUARIO': (['usuario', 'usuário', 'usuarios', 'usuários'], 'Usuários')
+    }
+    
+    PALAVRAS_RANKING = ['top', 'mais', 'ranking', 'maiores', 'frequentes', 'principais']
+    
+    # Tipos de consulta de data: coleções candidatas, campo de data e palavras na pergunta
+    TIPOS_CONSULTA_DATA = {
+        'devolução': {
+            'colecoes': ['DEVOLUCAO', 'DEVOLUCOES', 'DEVOLUCAO_2025'],
+            'campo_data': 'DATA_DEVOLUCAO',
+            'tipo': 'devoluções',
+            'variacoes': ['devolução', 'devolucao', 'devoluções', 'devolucoes']
+        },
+        'cancelamento': {
+            'colecoes': ['CANCELAMENTO', 'CANCELAMENTOS', 'CANCELAMENTO_2025'],
+            'campo_data': 'DATACANCELAMENTO',
+            'tipo': 'cancelamentos',
+            'variacoes': ['cancelamento', 'cancelamentos']
+        },
+        'ajuste': {
+            'colecoes': ['AJUSTES ESTOQUE', 'AJUSTES', 'ESTOQUE', 'INVENTARIO', 'AJUSTES_ESTOQUE_2025'],
+            'campo_data': 'DATA',
+            'tipo': 'ajustes de estoque',
+            'variacoes': ['ajuste', 'ajustes', 'estoque', 'inventario', 'inventário']
+        }
+    }
+    
+    # Meses por extenso ("em janeiro", "março de 2025")
+    MESES = {
+        'janeiro': 1, 'fevereiro': 2, 'março': 3, 'marco': 3, 'abril': 4, 'maio': 5, 'junho': 6,
+        'julho': 7, 'agosto': 8, 'setembro': 9, 'outubro': 10, 'novembro': 11, 'dezembro': 12
+    }
+    
+    # Agrupamento de períodos: granularidade -> (padrão na pergunta, título)
+    GRANULARIDADES_PERIODO = {
+        'dia': (r'\b(?:por|cada)\s+dia\b|\bdi[áa]ri[oa]s?\b', 'Dia'),
+        'semana': (r'\b(?:por|cada)\s+semana\b|\bsemana(?:l|is)\b', 'Semana'),
+        'mes': (r'\b(?:por|cada)\s+m[êe]s\b|\bmensa(?:l|is)\b', 'Mês')
+    }
+    
+    # Palavras que indicam que o usuário aceita um ranking aproximado
+    PALAVRAS_APROXIMACAO = ['aproximado', 'aproximada', 'aproximadamente', 'estimativa', 'estimado', 'estimada', 'rápido', 'rapido', 'por alto']
+    
     def _interpretar_pergunta(self, pergunta: str) -> Dict[str, Any]:
         """
         Interpreta a pergunta do usuário e identifica o tipo de consulta.
@@ -185,6 +367,9 @@ class MongoDBAgent:
         tipo_pergunta = None
         quantidade = 10  # padrão
         
+        # Identificadores citados ("sku 123456", "usuário 987", "loja 12")
+        identificadores = extrair_identificadores(pergunta_lower)
+        
         # Verificar padrões específicos com prioridade
         if any(palavra in pergunta_lower for palavra in ['quais dados', 'que dados', 'dados disponiveis', 'dados disponíveis', 'colecoes disponiveis', 'coleções disponíveis', 'tabelas disponiveis', 'tabelas disponíveis', 'o que tem', 'que tem', 'listar dados', 'mostrar dados', 'ver dados', 'acesso a dados']):
             tipo_pergunta = "listar_colecoes"
@@ -194,12 +379,17 @@ class MongoDBAgent:
             tipo_pergunta = "consulta_periodo_datas"
         elif re.search(r'\d{1,2}/\d{1,2}(?:/\d{2,4})?', pergunta_lower):
             tipo_pergunta = "consulta_data_especifica"
+        elif self._extrair_mes(pergunta_lower)[0]:
+            tipo_pergunta = "consulta_periodo_datas"
         elif any(palavra in pergunta_lower for palavra in ['inconsistência', 'inconsistencia', 'discrepância', 'discrepancia', 'problema', 'erro', 'dados inconsistentes', 'verificar dados']):
             tipo_pergunta = "inconsistencia"
         elif any(palavra in pergunta_lower for palavra in ['quantos', 'quantas', 'total', 'contar', 'count', 'soma', 'número', 'numero']):
             tipo_pergunta = "contagem"
         elif any(palavra in pergunta_lower for palavra in ['mais', 'top', 'melhor', 'pior', 'maior', 'menor', 'frequente', 'frequentes']):
             tipo_pergunta = "ranking"
+        elif identificadores:
+            # Sem contagem, ranking ou período: busca dos registros do identificador
+            tipo_pergunta = "busca_identificador"
         elif any(palavra in pergunta_lower for palavra in ['exemplo', 'amostra', 'dados', 'registros']):
             tipo_pergunta = "exemplo"
         else:
@@ -235,13 +425,20 @@ class MongoDBAgent:
             'tipo': tipo_pergunta,
             'quantidade': quantidade,
             'formato_tabela': formato_tabela,
+            'aproximado': self._permite_aproximacao(pergunta),
             'pergunta_original': pergunta,
-            'colecoes_especificas': colecoes_especificas
+            'colecoes_especificas': colecoes_especificas,
+            'identificadores': identificadores
         }
         
         print(f" Interpretação final: {resultado}")
         return resultado
         
+    def _permite_aproximacao(self, pergunta: str) -> bool:
+        """Indica se o usuário aceita um ranking aproximado."""
+        pergunta_lower = pergunta.lower()
+        return any(palavra in pergunta_lower for palavra in self.PALAVRAS_APROXIMACAO)
+        
     def conectar_mongodb(self):
         """Conecta ao MongoDB local."""
         try:
@@ -250,7 +447,7 @@ class MongoDBAgent:
             print(f"Conectado ao MongoDB: {self.database_name}")
             
             # Listar coleções disponíveis
-            colecoes = self.db.list_collection_names()
+            colecoes = self.catalogo.nomes()
             print(f"Coleções disponíveis: {colecoes}")
             
             # Criar índices para otimizar consultas
@@ -301,8 +498,9 @@ class MongoDBAgent:
     
     def carregar_dados_mongo(self, colecoes: List[str] = None) -> List[Document]:
         """
-        Carrega dados das coleções do MongoDB e converte para documentos LangChain.
-        Agora carrega dados de TODAS as coleções disponíveis no banco.
+        Carrega amostras das coleções do MongoDB e converte para documentos LangChain.
+        As coleções são amostradas em paralelo, com os próprios campos e
+        estratificadas por loja ou mês (ver modules.corpus_vetorial).
         
         Args:
             colecoes: Lista de nomes das coleções. Se None, carrega todas.
@@ -312,66 +510,33 @@ class MongoDBAgent:
         """
         if self.db is None:
             self.conectar_mongodb()
-            
-        documentos = []
         
-        # Se não especificou coleções, carrega todas
+        # Se não especificou coleções, carrega todas (exceto as internas)
         if not colecoes:
-            colecoes = self.db.list_collection_names()
+            colecoes = self.catalogo.nomes()
         
         print(f" Carregando dados das coleções: {colecoes}")
         
-        for colecao_nome in colecoes:
-            colecao = self.db[colecao_nome]
-            
-            # OTIMIZAÇÃO: Usar agregação com $sample para amostra representativa
-            # Mas primeiro verificar se a coleção tem dados
-            total_docs = colecao.count_documents({})
-            if total_docs == 0:
-                print(f" Coleção '{colecao_nome}' está vazia, pulando...")
-                continue
-                
-            # Usar amostra menor para coleções grandes
-            sample_size = min(500, total_docs)
-            
-            pipeline = [
-                {"$sample": {"size": sample_size}},  # Amostra aleatória
-                {"$project": {  # Selecionar apenas campos importantes
-                    "SKU": 1,
-                    "LOJA": 1, 
-                    "IDUSUARIO": 1,
-                    "DATA_DEVOLUCAO": 1,
-                    "DIFERENCA_VALOR": 1,
-                    "TIPOMOVIMENTACAO": 1,
-                    "VALORDEVPRODUTO": 1,
-                    "VALORVENDAPRODUTO": 1,
-                    "_id": 1
-                }}
-            ]
-            docs_mongo = list(colecao.aggregate(pipeline))
-            
-            print(f" Coleção '{colecao_nome}': {len(docs_mongo)} documentos")
-            
-            for doc in docs_mongo:
-                # Converter documento MongoDB para Document LangChain
-                conteudo = self._formatar_documento(doc, colecao_nome)
-                
-                documento_langchain = Document(
-                    page_content=conteudo,
-                    metadata={
-                        "colecao": colecao_nome,
-                        "id": str(doc.get("_id", "")),
-                        "fonte": "mongodb_local"
-                    }
-                )
-                documentos.append(documento_langchain)
+        corpus = self.construtor_corpus.construir(self._formatar_documento, colecoes)
+        documentos = [
+            Document(
+                page_content=item["texto"],
+                metadata={
+                    "colecao": item["colecao"],
+                    "id": item["id"],
+                    "fonte": "mongodb_local"
+                }
+            )
+            for item in corpus
+        ]
         
         print(f" Total de documentos carregados: {len(documentos)}")
         return documentos
     
     def _formatar_documento(self, doc: Dict, colecao: str) -> str:
         """
-        Formata um documento MongoDB para texto legível.
+        Formata um documento MongoDB para o embedding e o contexto do prompt,
+        no modo do codificador (ver modules.codificacao_documentos).
         
         Args:
             doc: Documento MongoDB
@@ -380,24 +545,18 @@ class MongoDBAgent:
         Returns:
             Texto formatado do documento
         """
-        # Remover _id se existir
-        doc_copy = doc.copy()
-        if "_id" in doc_copy:
-            del doc_copy["_id"]
-        
-        # Criar texto estruturado
-        texto = f"Dados da coleção '{colecao}':\n"
-        
-        for chave, valor in doc_copy.items():
-            if isinstance(valor, (dict, list)):
-                texto += f"{chave}: {json.dumps(valor, ensure_ascii=False, indent=2)}\n"
-            else:
-                texto += f"{chave}: {valor}\n"
-        
-        return texto
+        return self.codificador_documentos.codificar(doc, colecao)
     
     def criar_agente(self):
-        """Cria o agente de IA usando LangChain."""
+        """Cria o agente de IA usando LangChain (modelos e índice vetorial)."""
+        self.criar_modelos()
+        self.criar_indice_vetorial()
+    
+    def criar_modelos(self):
+        """Cria os modelos do LangChain (embeddings, LLMs e prompt da resposta)."""
+        from langchain_openai import ChatOpenAI, OpenAIEmbeddings
+        from langchain_core.prompts import PromptTemplate
+        
         try:
             # Configurar OpenAI (usar variável de ambiente)
             openai_api_key = os.getenv("OPENAI_API_KEY")
@@ -414,42 +573,23 @@ class MongoDBAgent:
                 openai_api_key=openai_api_key,
                 model_name="gpt-4o-mini",
                 temperature=0.1,  # Baixa temperatura para respostas mais precisas
-                max_tokens=1000
-            )
-            
-            # Carregar dados do MongoDB
-            documentos = self.carregar_dados_mongo()
-            
-            if not documentos:
-                raise ValueError("Nenhum documento encontrado no MongoDB")
-            
-            # Criar vetorstore com FAISS
-            print(" Criando índice de vetores com FAISS...")
-            self.vectorstore = FAISS.from_documents(documentos, self.embeddings)
-            
-            # Configurar memória para conversas
-            memory = ConversationBufferMemory(
-                memory_key="chat_history",
-                return_messages=True,
-                output_key="answer"
+                max_tokens=1000,
+                streaming=True,  # Permite encaminhar os tokens da resposta via SSE
+                # Respostas persistidas por modelo, prompt e documentos de contexto
+                cache=obter_cache_llm() or False
             )
             
-            # Criar chain de recuperação conversacional
-            self.qa_chain = ConversationalRetrievalChain.from_llm(
-                llm=self.llm,
-                retriever=self.vectorstore.as_retriever(
-                    search_type="similarity",
-                    search_kwargs={"k": 5}  # Buscar 5 documentos mais relevantes
-                ),
-                memory=memory,
-                return_source_documents=True,
-                verbose=True
+            # LLM sem streaming para reformular a pergunta com o histórico,
+            # para que apenas os tokens da resposta final sejam transmitidos
+            self.llm_condensacao = ChatOpenAI(
+                openai_api_key=openai_api_key,
+                model_name="gpt-4o-mini",
+                temperature=0.1,
+                max_tokens=1000
             )
             
             # Customizar prompt para português e sem alucinações
-            from langchain_core.prompts import PromptTemplate
-            
-            custom_prompt = PromptTemplate(
+            self.prompt_resposta = PromptTemplate(
                 template="""
 Você é um assistente especializado em consultar dados de um banco MongoDB e detectar fraudes.
 
@@ -482,7 +622,34 @@ Resposta em português:""",
                 input_variables=["context", "question"]
             )
             
-            self.qa_chain.combine_docs_chain.llm_chain.prompt = custom_prompt
+            print(" Modelos do agente criados")
+            
+        except Exception as e:
+            print(f" Erro ao criar modelos do agente: {e}")
+            raise
+    
+    def criar_indice_vetorial(self):
+        """
+        Cria o índice vetorial (FAISS) com amostras das coleções e o pool de
+        sessões. Só depois dele o fallback para o LLM fica disponível.
+        """
+        if self.embeddings is None:
+            self.criar_modelos()
+        try:
+            # Carregar dados do MongoDB
+            documentos = self.carregar_dados_mongo()
+            
+            if not documentos:
+                raise ValueError("Nenhum documento encontrado no MongoDB")
+            
+            # Tipo do índice (flat, ivf, hnsw) e compressão pela configuração
+            # ou pelo tamanho do corpus (ver modules.indice_vetorial)
+            print(" Criando índice de vetores com FAISS...")
+            self.vectorstore, self.info_indice_vetorial = criar_vectorstore(documentos, self.embeddings)
+            
+            # Cada sessão ganha sua memória e chain sob demanda; publicado por
+            # último, indica que o fallback para o LLM está pronto
+            self.sessoes = PoolSessoes(self._criar_sessao, db_config.MAX_SESSOES_AGENTE)
             
             print(" Agente criado com sucesso!")
             
@@ -490,6 +657,85 @@ Resposta em português:""",
             print(f" Erro ao criar agente: {e}")
             raise
     
+    @staticmethod
+    def _turno_do_llm(mensagem: Dict[str, Any]) -> bool:
+        """
+        Indica se a resposta persistida veio da chain do LLM. Mensagens salvas
+        antes do campo "caminho" existir são aceitas se não contiverem HTML.
+        """
+        caminho = mensagem.get("caminho")
+        if caminho is not None:
+            return caminho == "llm"
+        return not re.search(r"<[a-zA-Z][^>]*>", mensagem.get("conteudo", ""))
+    
+    def _criar_sessao(self, sessao_id: str) -> SessaoConversa:
+        """
+        Cria o estado de conversa de uma sessão: memória com os últimos turnos,
+        resumo dos anteriores e orçamento de tokens, e uma chain própria sobre
+        o vectorstore e o LLM compartilhados.
+        
+        Args:
+            sessao_id: ID da sessão de conversa
+            
+        Returns:
+            Sessão pronta para ser adicionada ao pool
+        """
+        from langchain.chains import ConversationalRetrievalChain
+        from modules.memoria_conversa import MemoriaResumida
+        
+        memoria = MemoriaResumida(
+            llm=self.llm_condensacao,
+            max_turnos=db_config.MAX_TURNOS_MEMORIA,
+            orcamento_tokens=db_config.ORCAMENTO_TOKENS_MEMORIA,
+            lote_resumo=db_config.RESUMO_LOTE_TURNOS,
+            memory_key="chat_history",
+            return_messages=True,
+            output_key="answer"
+        )
+        
+        # Retomar os últimos turnos persistidos (sessão despejada ou reinício).
+        # Só os turnos respondidos pelo LLM entram na memória: as respostas das consultas
+        # diretas (tabelas HTML) nunca passaram pela chain e só gastariam o orçamento de tokens.
+        try:
+            mensagens = obter_gerenciador().carregar_historico_sessao(sessao_id, renderizar=False)
+            turnos = []
+            pergunta_pendente = None
+            for msg in mensagens:
+                if msg.get("tipo") == "usuario":
+                    pergunta_pendente = msg.get("conteudo", "")
+                elif msg.get("tipo") == "agente" and pergunta_pendente is not None:
+                    if self._turno_do_llm(msg):
+                        turnos.append((pergunta_pendente, msg.get("conteudo", "")))
+                    pergunta_pendente = None
+            for pergunta, resposta in turnos[-db_config.MAX_TURNOS_MEMORIA:]:
+                memoria.save_context({"question": pergunta}, {"answer": resposta})
+        except Exception as e:
+            print(f" Erro ao carregar histórico da sessão {sessao_id}: {e}")
+        
+        retriever = self.vectorstore.as_retriever(
+            search_type="similarity",
+            search_kwargs={"k": 5}  # Buscar 5 documentos mais relevantes
+        )
+        if self.codificador_documentos.modo == MODO_COMPACTO:
+            # Legenda das chaves abreviadas uma vez por contexto
+            retriever = RetrieverComCabecalho(base=retriever, codificador=self.codificador_documentos)
+        
+        chain = ConversationalRetrievalChain.from_llm(
+            llm=self.llm,
+            retriever=retriever,
+            memory=memoria,
+            condense_question_llm=self.llm_condensacao,
+            combine_docs_chain_kwargs={
+                "prompt": self.prompt_resposta,
+                # Documentos compactos ocupam uma linha cada
+                "document_separator": "\n" if self.codificador_documentos.modo == MODO_COMPACTO else "\n\n"
+            },
+            return_source_documents=True,
+            verbose=True
+        )
+        
+        return SessaoConversa(sessao_id, chain, memoria)
+    
     def _detectar_colecao_e_tipo_ranking(self, pergunta: str) -> dict:
         """
         Detecta qual coleção e tipo de ranking o usuário está solicitando.
@@ -562,6 +808,47 @@ Resposta em português:""",
                 'titulo_ranking': 'Lojas'
             }
     
+    def _resolver_ranking(self, pergunta: str) -> Optional[Dict[str, str]]:
+        """
+        Resolve a coleção e o campo de agrupamento de uma pergunta de ranking.
+        
+        Args:
+            pergunta: Pergunta do usuário
+            
+        Returns:
+            Dicionário com coleção, campo e título do ranking, ou None se a
+            coleção não puder ser identificada
+        """
+        colecao_info = self._detectar_colecao_e_tipo_ranking(pergunta)
+        colecao_nome = colecao_info['colecao']
+        tipo_ranking = colecao_info['tipo_ranking']
+        campo_agrupamento = colecao_info['campo_agrupamento']
+        titulo_ranking = colecao_info['titulo_ranking']
+        
+        # Se não detectou coleção específica, usar detecção mais inteligente
+        if colecao_nome is None:
+            colecao_nome = self._detectar_colecao_relevante(pergunta)
+            if not colecao_nome:
+                return None
+            
+            # Atualizar os campos de ranking com a coleção detectada
+            if colecao_nome == 'CANCELAMENTO_2025':
+                campo_agrupamento = 'LOJA' if tipo_ranking == 'lojas' else 'DATACANCELAMENTO'
+                titulo_ranking = 'Lojas' if tipo_ranking == 'lojas' else 'Datas de Cancelamento'
+            elif colecao_nome == 'AJUSTES_ESTOQUE_2025':
+                campo_agrupamento = 'LOJA' if tipo_ranking == 'lojas' else 'DATA'
+                titulo_ranking = 'Lojas' if tipo_ranking == 'lojas' else 'Datas de Ajuste'
+            else:  # DEVOLUCAO
+                campo_agrupamento = 'LOJA' if tipo_ranking == 'lojas' else 'DATA_DEVOLUCAO'
+                titulo_ranking = 'Lojas' if tipo_ranking == 'lojas' else 'Datas de Devolução'
+        
+        return {
+            'colecao': colecao_nome,
+            'tipo_ranking': tipo_ranking,
+            'campo_agrupamento': campo_agrupamento,
+            'titulo_ranking': titulo_ranking
+        }
+    
     def _detectar_colecao_relevante(self, pergunta: str) -> str:
         """
         Detecta qual coleção é mais relevante para a pergunta baseada em palavras-chave.
@@ -569,7 +856,7 @@ Resposta em português:""",
         pergunta_lower = pergunta.lower()
         
         # Obter todas as coleções disponíveis
-        colecoes = self.db.list_collection_names()
+        colecoes = self.catalogo.nomes()
         
         # Mapear palavras-chave para coleções
         mapeamento_colecoes = {
@@ -600,179 +887,234 @@ Resposta em português:""",
             if self.db is None:
                 return "Erro: Conexão com banco de dados não estabelecida."
             
-            colecoes = self.db.list_collection_names()
+            colecoes = self.catalogo.nomes()
             if not colecoes:
                 return "Nenhuma coleção encontrada no banco de dados."
             
-            html = """
-                        <div style="margin: 20px 0; font-family: Arial, sans-serif;">
-                <h3 style="color: #333; margin-bottom: 15px; text-align: center;">Coleções Disponíveis no Banco de Dados</h3>
-                            <div style="background-color: #f8f9fa; padding: 20px; border-radius: 8px; border-left: 4px solid #007bff;">
-                        """
-            
-            for i, colecao in enumerate(colecoes, 1):
+            itens = []
+            for colecao in colecoes:
                 try:
-                    total_registros = self.db[colecao].count_documents({})
-                    html += f"""
-                        <div style="display: flex; justify-content: space-between; align-items: center; padding: 10px 0; border-bottom: 1px solid #dee2e6;">
-                            <span style="font-weight: bold; color: #495057;">{i}. {colecao}</span>
-                            <span style="background: #28a745; color: white; padding: 4px 8px; border-radius: 4px; font-weight: bold;">{total_registros:,} registros</span>
-                                </div>
-                            """
-                except Exception as e:
-                    html += f"""
-                        <div style="display: flex; justify-content: space-between; align-items: center; padding: 10px 0; border-bottom: 1px solid #dee2e6;">
-                            <span style="font-weight: bold; color: #495057;">{i}. {colecao}</span>
-                            <span style="background: #dc3545; color: white; padding: 4px 8px; border-radius: 4px; font-weight: bold;">Erro ao contar</span>
-                        </div>
-                    """
-            
-            html += """
-                            </div>
-                <p style="color: #666; text-align: center; margin-top: 15px;">
-                    <strong>Dica:</strong> Para consultar dados específicos, mencione a coleção desejada (ex: "top 10 lojas de cancelamento", "datas mais frequentes em devolução")
-                </p>
-                        </div>
-                        """
-            
-            return html
+                    total_registros = self.catalogo.contagem(colecao)
+                except Exception:
+                    total_registros = None
+                itens.append({'nome': colecao, 'total': total_registros})
+            
+            registrar_tabela(
+                "Coleções Disponíveis no Banco de Dados",
+                ['Coleção', 'Registros'],
+                [[item['nome'], item['total'] if item['total'] is not None else 'Erro ao contar'] for item in itens]
+            )
+            return renderizar('colecoes.html', colecoes=itens)
             
         except Exception as e:
             return f"Erro ao listar coleções: {e}"
 
-    def _fazer_consulta_direta(self, pergunta: str) -> str:
+    def _fazer_consulta_direta(self, pergunta: str) -> Tuple[Optional[str], bool]:
         """
         Faz consultas diretas ao MongoDB para perguntas específicas de contagem e análise.
         Agora funciona com qualquer coleção do banco.
+        
+        Returns:
+            Tupla (resposta ou None, se a resposta pode ir para o cache: um ranking
+            aproximado que o usuário não pediu, por exceder o orçamento de latência,
+            não deve ser reaproveitado por perguntas que esperam o exato)
         """
         pergunta_lower = pergunta.lower()
         
         try:
             # Detectar tipo de coleção e tipo de ranking de forma inteligente
-            colecao_info = self._detectar_colecao_e_tipo_ranking(pergunta)
+            colecao_info = self._resolver_ranking(pergunta)
             if not colecao_info:
-                return "Não foi possível entender sua solicitação. Por favor, especifique a coleção (devolução, cancelamento, ajuste) e o tipo de ranking (lojas, datas, usuários, etc.)."
+                return "Não foi possível identificar qual coleção consultar. Por favor, especifique se quer dados de devolução, cancelamento ou ajustes de estoque.", True
             
             colecao_nome = colecao_info['colecao']
-            tipo_ranking = colecao_info['tipo_ranking']
             campo_agrupamento = colecao_info['campo_agrupamento']
             titulo_ranking = colecao_info['titulo_ranking']
             
-            # Se não detectou coleção específica, usar detecção mais inteligente
-            if colecao_nome is None:
-                colecao_nome = self._detectar_colecao_relevante(pergunta)
-                if not colecao_nome:
-                    return "Não foi possível identificar qual coleção consultar. Por favor, especifique se quer dados de devolução, cancelamento ou ajustes de estoque."
-                
-                # Atualizar os campos de ranking com a coleção detectada
-                if colecao_nome == 'CANCELAMENTO_2025':
-                    campo_agrupamento = 'LOJA' if tipo_ranking == 'lojas' else 'DATACANCELAMENTO'
-                    titulo_ranking = 'Lojas' if tipo_ranking == 'lojas' else 'Datas de Cancelamento'
-                elif colecao_nome == 'AJUSTES_ESTOQUE_2025':
-                    campo_agrupamento = 'LOJA' if tipo_ranking == 'lojas' else 'DATA'
-                    titulo_ranking = 'Lojas' if tipo_ranking == 'lojas' else 'Datas de Ajuste'
-                else:  # DEVOLUCAO
-                    campo_agrupamento = 'LOJA' if tipo_ranking == 'lojas' else 'DATA_DEVOLUCAO'
-                    titulo_ranking = 'Lojas' if tipo_ranking == 'lojas' else 'Datas de Devolução'
-            
             # Detectar quantidade solicitada
             limite = self._detectar_quantidade(pergunta)
             
             # Usar coleção detectada
             if self.db is None:
-                return " Erro: Conexão com banco de dados não estabelecida."
+                return " Erro: Conexão com banco de dados não estabelecida.", False
             colecao = self.db[colecao_nome]
             if colecao is None:
-                return f"Coleção {colecao_nome} não encontrada no banco de dados."
+                return f"Coleção {colecao_nome} não encontrada no banco de dados.", False
             
             # Executar consulta de ranking
-            pipeline = [
-                {"$group": {
-                    "_id": f"${campo_agrupamento}",
-                    "count": {"$sum": 1}
-                }},
-                {"$sort": {"count": -1}},
-                {"$limit": limite}
-            ]
-            resultado = list(colecao.aggregate(pipeline))
+            aceita_aproximacao = self._permite_aproximacao(pergunta)
+            resultado, aviso, aproximado = self._consultar_ranking(
+                colecao_nome, campo_agrupamento, limite,
+                aproximado=aceita_aproximacao
+            )
+            cacheavel = aceita_aproximacao or not aproximado
             
             if resultado:
                 # Verificar se deve retornar em formato de tabela
                 if any(palavra in pergunta_lower for palavra in ['tabela', 'table', 'formato de tabela']):
-                    return self._formatar_como_tabela(
+                    html = self._formatar_como_tabela(
                         dados=resultado,
                         colunas=['Posição', titulo_ranking, 'Quantidade de Registros'],
                         titulo=f"Top {limite} {titulo_ranking} Mais Frequentes",
                         formata_dados=lambda i, item: [
                             i + 1,
                             item['_id'] if item['_id'] else 'N/A',
-                            f"{item['count']:,}"
+                            self._formatar_contagem(item)
                         ]
                     )
+                    if aviso:
+                        registrar_resumo(aviso)
+                        html += renderizar_nota(aviso)
+                    return html, cacheavel
                 else:
-                    html = f"""
-                    <div style="margin: 20px 0; font-family: Arial, sans-serif;">
-                    <h3 style="color: #333; margin-bottom: 15px; text-align: center;"> Top {limite} {titulo_ranking} Mais Frequentes</h3>
-                        <p style="color: #666; text-align: center; margin-bottom: 20px;">Coleção: <strong>{colecao_nome}</strong></p>
-                    <div style="background-color: #f8f9fa; padding: 20px; border-radius: 8px; border-left: 4px solid #007bff;">
-                    """
-                    for i, item in enumerate(resultado, 1):
-                        item_nome = item['_id'] if item['_id'] else 'N/A'
-                        count = item['count']
-                        html += f"""
-                        <div style="display: flex; justify-content: space-between; align-items: center; padding: 10px 0; border-bottom: 1px solid #dee2e6;">
-                            <span style="font-weight: bold; color: #495057;">{i}. {item_nome}</span>
-                            <span style="background: #007bff; color: white; padding: 4px 8px; border-radius: 4px; font-weight: bold;">{count:,} registros</span>
-                            </div>
-                        """
-                    html += """
-                        </div>
-                    </div>
-                    """
-                    return html
+                    itens = [
+                        {'nome': item['_id'] if item['_id'] else 'N/A', 'contagem': self._formatar_contagem(item)}
+                        for item in resultado
+                    ]
+                    registrar_tabela(
+                        f"Top {limite} {titulo_ranking} Mais Frequentes - {colecao_nome}",
+                        ['Posição', titulo_ranking, 'Quantidade de Registros'],
+                        [[i, item['nome'], item['contagem']] for i, item in enumerate(itens, 1)]
+                    )
+                    registrar_resumo(aviso)
+                    return renderizar(
+                        'ranking.html',
+                        limite=limite,
+                        titulo=titulo_ranking,
+                        colecao=colecao_nome,
+                        itens=itens,
+                        aviso=aviso
+                    ), cacheavel
             else:
-                return f"Não foi possível analisar os {titulo_ranking.lower()} na coleção {colecao_nome}."
+                return f"Não foi possível analisar os {titulo_ranking.lower()} na coleção {colecao_nome}.", True
             
             # Contar total de registros
             if any(palavra in pergunta_lower for palavra in ['quantas linhas', 'quantos registros', 'total de registros', 'quantos documentos']):
-                total = colecao.count_documents({})
-                return f"O total de registros na coleção **{colecao_nome}** é: **{total:,}** registros."
+                total = self.catalogo.contagem(colecao_nome)
+                return f"O total de registros na coleção **{colecao_nome}** é: **{total:,}** registros.", True
             
-            return None  # Não é uma consulta que pode ser respondida diretamente
+            return None, False  # Não é uma consulta que pode ser respondida diretamente
             
         except Exception as e:
             print(f" Erro na consulta direta: {e}")
-            return None
+            return None, False
     
-    def _executar_analise_fraude(self) -> str:
+    def _consultar_ranking(self, colecao_nome: str, campo: str, limite: int, ignorar_nulos: bool = False,
+                           aproximado: bool = False) -> Tuple[List[Dict[str, Any]], Optional[str], bool]:
+        """
+        Retorna os valores mais frequentes de um campo.
+        Usa o ranking materializado (leitura indexada). Enquanto uma dimensão ainda
+        não foi materializada, a construção roda em segundo plano; se o usuário
+        aceitar aproximação ou o tempo exceder ORCAMENTO_RANKING_MS, a resposta
+        vem do resumo Space-Saving da dimensão. Sem resumo, a resposta aguarda o
+        ranking exato: construir o resumo ao mesmo tempo seria uma segunda
+        varredura completa da coleção. O resumo só é construído (em segundo
+        plano) quando a materialização termina sem publicar o ranking.
+        
+        Args:
+            colecao_nome: Nome da coleção
+            campo: Campo de agrupamento
+            limite: Quantidade de itens
+            ignorar_nulos: Se True, descarta valores ausentes
+            aproximado: Se True, aceita o ranking aproximado
+            
+        Returns:
+            Tupla (lista no formato {"_id": valor, "count": quantidade},
+            aviso sobre os limites de erro quando o resultado for aproximado,
+            se o resultado veio do resumo aproximado, pedido ou não)
+        """
+        try:
+            resultado = self.rankings.top_n(colecao_nome, campo, limite, ignorar_nulos)
+            if resultado is not None:
+                return resultado, None, False
+            
+            sketch = self.sketches.obter(colecao_nome, campo)
+            thread = self.rankings.reconstruir_em_segundo_plano(colecao_nome, campo)
+            
+            if sketch is not None and aproximado:
+                return sketch.top_k(limite, ignorar_nulos), self._descrever_aproximacao(sketch), True
+            
+            # Aguardar o ranking exato até o orçamento de latência (sem resumo, até o fim)
+            thread.join(timeout=db_config.ORCAMENTO_RANKING_MS / 1000 if sketch is not None else None)
+            resultado = self.rankings.top_n(colecao_nome, campo, limite, ignorar_nulos)
+            if resultado is not None:
+                return resultado, None, False
+            
+            if sketch is not None:
+                print(f" Ranking exato de {colecao_nome}.{campo} excedeu o orçamento de latência; usando resumo aproximado")
+                return sketch.top_k(limite, ignorar_nulos), self._descrever_aproximacao(sketch), True
+            
+            # A materialização terminou sem publicar (falha): o resumo cobre as próximas consultas
+            # das coleções importadas antes dos resumos, e esta usa a agregação direta
+            self.sketches.construir_em_segundo_plano(colecao_nome, campo)
+        except Exception as e:
+            print(f" Erro no ranking materializado, usando agregação direta: {e}")
+        
+        pipeline = []
+        if ignorar_nulos:
+            pipeline.append({"$match": {campo: {"$exists": True, "$ne": None}}})
+        pipeline.extend([
+            {"$group": {"_id": f"${campo}", "count": {"$sum": 1}}},
+            {"$sort": {"count": -1}},
+            {"$limit": limite}
+        ])
+        return list(self.db[colecao_nome].aggregate(pipeline)), None, False
+    
+    def _descrever_aproximacao(self, sketch) -> str:
+        """Descreve os limites de erro de um ranking aproximado."""
+        return (
+            f"Valores aproximados (Space-Saving, k={sketch.capacidade}): cada contagem pode estar "
+            f"superestimada em no máximo {sketch.erro_maximo:,} registros "
+            f"(garantia teórica N/k = {sketch.erro_teorico:,.0f}, N = {sketch.total:,})."
+        )
+    
+    def _formatar_contagem(self, item: Dict[str, Any]) -> str:
+        """Formata a contagem de um item de ranking, indicando o erro quando aproximada."""
+        if item.get('erro'):
+            return f"~{item['count']:,} (±{item['erro']:,})"
+        return f"{item['count']:,}"
+    
+    def obter_relatorio_fraude(self, callback_evento: Optional[Callable] = None) -> Dict[str, Any]:
+        """
+        Executa a análise completa de fraude, compartilhando a execução entre
+        requisições simultâneas (a análise pode levar minutos).
+        
+        Args:
+            callback_evento: Recebe um evento "progresso" por algoritmo de detecção
+            
+        Returns:
+            Relatório completo retornado pelo detector de fraude
+        """
+        return self.coalescedor.executar(
+            "analise_fraude",
+            lambda difundir: self.detector_fraude.executar_analise_completa_fraude(
+                lambda dados: difundir("progresso", dados)
+            ),
+            callback_evento
+        )
+    
+    def _executar_analise_fraude(self, callback_evento: Optional[Callable] = None) -> str:
         """
         Executa análise completa de fraude e retorna relatório formatado.
         
+        Args:
+            callback_evento: Recebe um evento "progresso" por algoritmo de detecção
+        
         Returns:
             Relatório de análise de fraude em HTML formatado
         """
         try:
             if not self.detector_fraude:
-                return """
-                <div style="margin: 20px 0; padding: 20px; background-color: #f8d7da; border: 1px solid #f5c6cb; border-radius: 8px; text-align: center;">
-                    <h3 style="color: #721c24; margin: 0;"> Erro</h3>
-                    <p style="color: #721c24; margin: 10px 0 0 0;">Detector de fraude não foi inicializado corretamente.</p>
-                </div>
-                """
+                return renderizar_aviso(AVISO_ERRO, " Erro", "Detector de fraude não foi inicializado corretamente.")
             
             print(" Executando análise completa de fraude...")
-            relatorio = self.detector_fraude.executar_analise_completa_fraude()
+            relatorio = self.obter_relatorio_fraude(callback_evento)
             
             return self._formatar_relatorio_fraude(relatorio)
             
         except Exception as e:
             print(f" Erro na análise de fraude: {e}")
-            return f"""
-            <div style="margin: 20px 0; padding: 20px; background-color: #f8d7da; border: 1px solid #f5c6cb; border-radius: 8px; text-align: center;">
-                <h3 style="color: #721c24; margin: 0;"> Erro na Análise de Fraude</h3>
-                <p style="color: #721c24; margin: 10px 0 0 0;">Erro: {str(e)}</p>
-            </div>
-            """
+            return renderizar_aviso(AVISO_ERRO, " Erro na Análise de Fraude", f"Erro: {str(e)}")
     
     
     
@@ -790,157 +1132,61 @@ Resposta em português:""",
         suspeitas_por_tipo = relatorio.get('suspeitas_por_tipo', {})
         suspeitas_por_risco = relatorio.get('suspeitas_por_nivel_risco', {})
         resumo_executivo = relatorio.get('resumo_executivo', {})
-        recomendacoes = resumo_executivo.get('recomendacoes', [])
         detalhes_suspeitas = relatorio.get('detalhes_suspeitas', [])
         
-        # Cabeçalho do relatório
-        html = f"""
-        <div class="fraud-report" style="margin: 20px 0; font-family: Arial, sans-serif;">
-            <div class="fraud-header" style="background-color: #dc3545; padding: 20px; border-radius: 8px; text-align: center;">
-                <h1 style="margin: 0; font-size: 28px; font-weight: bold; color: white;"> RELATÓRIO DE ANÁLISE DE FRAUDE</h1>
-                <p style="margin: 10px 0 0 0; font-size: 16px; color: white !important;">Análise executada em {relatorio.get('timestamp_analise', 'N/A')}</p>
-                <p style="margin: 5px 0 0 0; font-size: 14px; color: white !important;">Tempo de análise: {relatorio.get('tempo_analise_segundos', 0)} segundos</p>
-                
-                <!-- Botão de Download Excel -->
-                <div style="margin-top: 20px;">
-                    <a href="/download-excel-fraude" 
-                       target="_blank"
-                       style="background: linear-gradient(135deg, #28a745, #20c997); 
-                              color: white; 
-                              text-decoration: none;
-                              border: none; 
-                              padding: 12px 24px; 
-                              border-radius: 8px; 
-                              font-size: 16px; 
-                              font-weight: bold; 
-                              cursor: pointer; 
-                              box-shadow: 0 4px 6px rgba(0,0,0,0.1);
-                              transition: all 0.3s ease;
-                              display: inline-block;"
-                       onmouseover="this.style.transform='translateY(-2px)'; this.style.boxShadow='0 6px 12px rgba(0,0,0,0.15)'"
-                       onmouseout="this.style.transform='translateY(0)'; this.style.boxShadow='0 4px 6px rgba(0,0,0,0.1)'">
-                         Baixar Relatório Excel
-                    </a>
-                </div>
-            </div>
-        """
-        
-        # Resumo executivo
-        html += f"""
-            <div class="fraud-summary">
-                <h2 style="color: #007bff; margin: 0 0 15px 0; font-size: 22px;"> RESUMO EXECUTIVO</h2>
-                <div style="display: grid; grid-template-columns: repeat(auto-fit, minmax(200px, 1fr)); gap: 15px; margin-bottom: 20px;">
-                    <div class="stat-card">
-                        <div style="font-size: 24px; font-weight: bold; color: #dc3545;">{total_suspeitas}</div>
-                        <div style="color: #6c757d; font-size: 14px;">Total de Suspeitas</div>
-                    </div>
-                    <div class="stat-card">
-                        <div style="font-size: 24px; font-weight: bold; color: #dc3545;">{suspeitas_por_risco.get('ALTO', 0)}</div>
-                        <div style="color: #6c757d; font-size: 14px;">Alto Risco</div>
-                    </div>
-                    <div class="stat-card">
-                        <div style="font-size: 24px; font-weight: bold; color: #ffc107;">{suspeitas_por_risco.get('MÉDIO', 0)}</div>
-                        <div style="color: #6c757d; font-size: 14px;">Médio Risco</div>
-                    </div>
-                    <div class="stat-card">
-                        <div style="font-size: 24px; font-weight: bold; color: #28a745;">{resumo_executivo.get('percentual_alto_risco', 0)}%</div>
-                        <div style="color: #6c757d; font-size: 14px;">% Alto Risco</div>
-                    </div>
-                </div>
-            </div>
-        """
-        
-        # Tipos de fraude encontrados
-        if suspeitas_por_tipo:
-            html += f"""
-                <div class="fraud-types">
-                    <h2 style="color: #856404; margin: 0 0 15px 0; font-size: 20px;"> TIPOS DE FRAUDE DETECTADOS</h2>
-                    <div style="display: grid; grid-template-columns: repeat(auto-fit, minmax(250px, 1fr)); gap: 10px;">
-            """
-            
-            for tipo, quantidade in suspeitas_por_tipo.items():
-                html += f"""
-                    <div style="background: white; padding: 12px; border-radius: 6px; display: flex; justify-content: space-between; align-items: center; box-shadow: 0 1px 3px rgba(0,0,0,0.1);">
-                        <span style="color: #495057; font-weight: 500;">{tipo}</span>
-                        <span style="background: #dc3545; color: white; padding: 4px 8px; border-radius: 4px; font-weight: bold; font-size: 14px;">{quantidade}</span>
-                    </div>
-                """
-            
-            html += """
-                    </div>
-                </div>
-            """
-        
-        
-        # Detalhes das suspeitas
-        if detalhes_suspeitas:
-            html += f"""
-                <div class="fraud-details">
-                    <h2 style="color: #495057; margin: 0 0 20px 0; font-size: 20px;"> DETALHES DAS SUSPEITAS</h2>
-                    <div style="overflow-x: auto;">
-                        <table style="width: 100%; border-collapse: collapse; background-color: white; box-shadow: 0 2px 4px rgba(0,0,0,0.1); border-radius: 8px; overflow: hidden;">
-                            <thead>
-                                <tr style="background-color: #e9ecef;">
-                                    <th style="padding: 12px 15px; text-align: left; font-weight: bold; color: #495057; border-bottom: 2px solid #dee2e6;">Tipo de Fraude</th>
-                                    <th style="padding: 12px 15px; text-align: left; font-weight: bold; color: #495057; border-bottom: 2px solid #dee2e6;">Nível de Risco</th>
-                                    <th style="padding: 12px 15px; text-align: left; font-weight: bold; color: #495057; border-bottom: 2px solid #dee2e6;">Detalhes</th>
-                                </tr>
-                            </thead>
-                            <tbody>
-            """
-            
-            for i, suspeita in enumerate(detalhes_suspeitas[:20]):  # Limitar a 20 para não sobrecarregar
-                cor_linha = "#f8f9fa" if i % 2 == 0 else "white"
-                nivel_risco = suspeita.get('nivel_risco', 'DESCONHECIDO')
-                cor_risco = "#dc3545" if nivel_risco == "ALTO" else "#ffc107" if nivel_risco == "MÉDIO" else "#6c757d"
-                
-                # Criar resumo dos detalhes
-                detalhes_resumo = []
-                if 'sku' in suspeita:
-                    detalhes_resumo.append(f"SKU: {suspeita['sku']}")
-                if 'loja' in suspeita:
-                    detalhes_resumo.append(f"Loja: {suspeita['loja']}")
-                if 'cliente' in suspeita:
-                    detalhes_resumo.append(f"Cliente: {suspeita['cliente']}")
-                if 'produto' in suspeita:
-                    detalhes_resumo.append(f"Produto: {suspeita['produto']}")
-                
-                detalhes_texto = " | ".join(detalhes_resumo) if detalhes_resumo else "N/A"
-                
+        cartoes = [
+            {'valor': total_suspeitas, 'rotulo': 'Total de Suspeitas', 'cor': 'perigo'},
+            {'valor': suspeitas_por_risco.get('ALTO', 0), 'rotulo': 'Alto Risco', 'cor': 'perigo'},
+            {'valor': suspeitas_por_risco.get('MÉDIO', 0), 'rotulo': 'Médio Risco', 'cor': 'alerta'},
+            {'valor': f"{resumo_executivo.get('percentual_alto_risco', 0)}%", 'rotulo': '% Alto Risco', 'cor': 'sucesso'}
+        ]
+        
+        suspeitas = []
+        for suspeita in detalhes_suspeitas:
+            nivel_risco = suspeita.get('nivel_risco', 'DESCONHECIDO')
+            
+            # Criar resumo dos detalhes
+            detalhes_resumo = []
+            if 'sku' in suspeita:
+                detalhes_resumo.append(f"SKU: {suspeita['sku']}")
+            if 'loja' in suspeita:
+                detalhes_resumo.append(f"Loja: {suspeita['loja']}")
+            if 'cliente' in suspeita:
+                detalhes_resumo.append(f"Cliente: {suspeita['cliente']}")
+            if 'produto' in suspeita:
+                detalhes_resumo.append(f"Produto: {suspeita['produto']}")
+            
+            suspeitas.append({
+                'tipo': suspeita.get('tipo_fraude', 'N/A'),
+                'nivel_risco': nivel_risco,
                 # Determinar classe CSS baseada no nível de risco
-                classe_risco = "risk-high" if nivel_risco == "ALTO" else "risk-medium" if nivel_risco == "MÉDIO" else ""
-                
-                html += f"""
-                    <tr style="background-color: {cor_linha};">
-                        <td style="padding: 10px 15px; border-bottom: 1px solid #dee2e6; color: #495057; font-weight: 500;">{suspeita.get('tipo_fraude', 'N/A')}</td>
-                        <td style="padding: 10px 15px; border-bottom: 1px solid #dee2e6;">
-                            <span class="{classe_risco}" style="padding: 4px 8px; border-radius: 4px; font-weight: bold; font-size: 12px;">{nivel_risco}</span>
-                        </td>
-                        <td style="padding: 10px 15px; border-bottom: 1px solid #dee2e6; color: #495057; font-size: 14px;">{detalhes_texto}</td>
-                    </tr>
-                """
-            
-            if len(detalhes_suspeitas) > 20:
-                html += f"""
-                    <tr style="background-color: #e9ecef;">
-                        <td colspan="3" style="padding: 15px; text-align: center; color: #6c757d; font-style: italic;">
-                            ... e mais {len(detalhes_suspeitas) - 20} suspeitas (mostrando apenas as primeiras 20)
-                        </td>
-                    </tr>
-                """
-            
-            html += """
-                            </tbody>
-                        </table>
-                    </div>
-                </div>
-            """
-        
-        html += """
-            </div>
-        """
-        
-        return html
+                'classe_risco': "risk-high" if nivel_risco == "ALTO" else "risk-medium" if nivel_risco == "MÉDIO" else "",
+                'detalhes': " | ".join(detalhes_resumo) if detalhes_resumo else "N/A"
+            })
+        
+        # A resposta estruturada leva todas as suspeitas (paginadas no navegador)
+        registrar_tabela(
+            " Detalhes das Suspeitas",
+            ['Tipo de Fraude', 'Nível de Risco', 'Detalhes'],
+            [[item['tipo'], item['nivel_risco'], item['detalhes']] for item in suspeitas]
+        )
+        registrar_tabela(" Tipos de Fraude Detectados", ['Tipo de Fraude', 'Suspeitas'], list(suspeitas_por_tipo.items()))
+        registrar_resumo(
+            " | ".join(f"{cartao['rotulo']}: {cartao['valor']}" for cartao in cartoes)
+            + f" (análise executada em {relatorio.get('timestamp_analise', 'N/A')})"
+        )
+        registrar_link("Baixar Relatório Excel", "/download-excel-fraude")
+        
+        # No HTML, limitar a 20 suspeitas para não sobrecarregar
+        return renderizar(
+            'relatorio_fraude.html',
+            timestamp=relatorio.get('timestamp_analise', 'N/A'),
+            tempo_segundos=relatorio.get('tempo_analise_segundos', 0),
+            cartoes=cartoes,
+            suspeitas_por_tipo=suspeitas_por_tipo,
+            suspeitas=suspeitas[:20],
+            restantes=max(len(suspeitas) - 20, 0)
+        )
 
     def _consultar_por_data_especifica(self, pergunta: str) -> str:
         """
@@ -954,26 +1200,21 @@ Resposta em português:""",
         """
         try:
             # Detectar tipo de consulta e coleção
-            tipo_consulta = self._detectar_tipo_consulta_data(pergunta)
-            colecoes_possiveis = tipo_consulta['colecoes']
+            tipo_consulta, colecao_nome = self._resolver_colecao_data(pergunta)
             campo_data = tipo_consulta['campo_data']
             
-            # Encontrar coleção disponível
-            colecoes_disponiveis = [col for col in colecoes_possiveis if col in self.db.list_collection_names()]
-            
-            if not colecoes_disponiveis:
+            if not colecao_nome:
                 return f"Nenhuma coleção encontrada para consulta de {tipo_consulta['tipo']}."
             
-            colecao_nome = colecoes_disponiveis[0]
-            colecao = self.db[colecao_nome]
-            
             # Normalizar data
             data_consulta = self._normalizar_data(pergunta)
             if not data_consulta:
                 return "Data não encontrada na pergunta. Por favor, forneça uma data no formato DD/MM/AAAA."
             
             # Contar registros
-            total_registros = colecao.count_documents({campo_data: data_consulta})
+            total_registros = self._contar_planejado(ConsultaAST(
+                colecao_nome, campo_data=campo_data, data_inicio=data_consulta, data_fim=data_consulta
+            ))
             
             return f"No dia {data_consulta}, foram encontrados **{total_registros}** registros de {tipo_consulta['tipo']} na coleção **{colecao_nome}**."
             
@@ -992,54 +1233,23 @@ Resposta em português:""",
             Resposta formatada com a contagem de registros
         """
         try:
-            pergunta_lower = pergunta.lower()
-            
             # Detectar tipo de consulta e coleção
-            tipo_consulta = self._detectar_tipo_consulta_data(pergunta)
-            colecoes_possiveis = tipo_consulta['colecoes']
+            tipo_consulta, colecao_nome = self._resolver_colecao_data(pergunta)
             campo_data = tipo_consulta['campo_data']
             
-            # Encontrar coleção disponível
-            colecoes_disponiveis = [col for col in colecoes_possiveis if col in self.db.list_collection_names()]
-            
-            if not colecoes_disponiveis:
+            if not colecao_nome:
                 return f"Nenhuma coleção encontrada para consulta de {tipo_consulta['tipo']}."
             
-            colecao_nome = colecoes_disponiveis[0]
-            colecao = self.db[colecao_nome]
-            
             # Extrair datas do período
-            import re
-            
-            # Padrões para diferentes formatos de período
-            padroes_periodo = [
-                r'entre\s+o?\s*dia\s+(\d{1,2}/\d{1,2})\s+até\s+dia\s+(\d{1,2}/\d{1,2})',
-                r'de\s+(\d{1,2}/\d{1,2})\s+até\s+(\d{1,2}/\d{1,2})',
-                r'entre\s+(\d{1,2}/\d{1,2})\s+e\s+(\d{1,2}/\d{1,2})',
-                r'entre\s+os\s+dias\s+(\d{1,2}/\d{1,2})\s+e\s+(\d{1,2}/\d{1,2})',
-                r'entre\s+o\s+dia\s+(\d{1,2}/\d{1,2})\s+e\s+(\d{1,2}/\d{1,2})'
-            ]
-            
-            data_inicio = None
-            data_fim = None
-            
-            for padrao in padroes_periodo:
-                match = re.search(padrao, pergunta_lower)
-                if match:
-                    data_inicio = self._normalizar_data(match.group(1))
-                    data_fim = self._normalizar_data(match.group(2))
-                    break
+            data_inicio, data_fim = self._extrair_periodo(pergunta)
             
             if not data_inicio or not data_fim:
                 return "Período não encontrado na pergunta. Por favor, forneça um período no formato 'entre DD/MM/AAAA e DD/MM/AAAA'."
             
-            # Contar registros no período
-            total_registros = colecao.count_documents({
-                campo_data: {
-                    "$gte": data_inicio,
-                    "$lte": data_fim
-                }
-            })
+            # Contar registros no período (o planejador compara as datas como datas, não como texto)
+            total_registros = self._contar_planejado(ConsultaAST(
+                colecao_nome, campo_data=campo_data, data_inicio=data_inicio, data_fim=data_fim
+            ))
             
             return f"No período de {data_inicio} a {data_fim}, foram encontrados **{total_registros}** registros de {tipo_consulta['tipo']} na coleção **{colecao_nome}**."
             
@@ -1047,6 +1257,355 @@ Resposta em português:""",
             print(f" Erro ao consultar por período: {e}")
             return f"Erro ao consultar por período: {str(e)}"
 
+    def _contar_planejado(self, consulta: ConsultaAST) -> int:
+        """Executa uma consulta sem agrupamento e retorna o total."""
+        resultado = self.planejador.executar(consulta)
+        return resultado[0]['count'] if resultado else 0
+    
+    def _construir_consulta_ast(self, interpretacao: Dict[str, Any]) -> Optional[ConsultaAST]:
+        """
+        Monta a árvore de consulta de perguntas com filtros por valor e/ou período,
+        ex.: "Top 5 SKUs da loja 12 entre 01/01 e 15/01".
+        
+        Args:
+            interpretacao: Resultado de _interpretar_pergunta
+            
+        Returns:
+            Consulta estruturada, ou None se a pergunta não tiver filtros nem período
+        """
+        pergunta = interpretacao.get('pergunta_original', '')
+        pergunta_lower = pergunta.lower()
+        
+        # Filtros por valor: "loja 12", "sku 123456", "usuário nº 45"
+        filtros = {}
+        posicoes_filtro = []
+        for campo, (palavras, _) in self.DIMENSOES_CONSULTA.items():
+            singulares = '|'.join(re.escape(p) for p in palavras if not p.endswith('s'))
+            match = re.search(rf'\b(?:{singulares})\s+(?:n[º°o.]?\s*)?([a-z0-9\-]*\d[a-z0-9\-]*)\b', pergunta_lower)
+            if match:
+                filtros[campo] = match.group(1).upper()
+                posicoes_filtro.append(match.start())
+        
+        # Período ou data específica
+        data_inicio = data_fim = None
+        if interpretacao['tipo'] == 'consulta_periodo_datas':
+            data_inicio, data_fim = self._extrair_periodo(pergunta)
+        elif interpretacao['tipo'] == 'consulta_data_especifica':
+            data_inicio = data_fim = self._normalizar_data(pergunta)
+        
+        if not filtros and not data_inicio:
+            return None
+        
+        # Agrupamento por período ("por dia", "por semana", "mensal")
+        granularidade = None
+        if data_inicio:
+            for nome, (padrao, _) in self.GRANULARIDADES_PERIODO.items():
+                if re.search(padrao, pergunta_lower):
+                    granularidade = nome
+                    break
+        
+        # Agrupamento: primeira dimensão mencionada que não é filtro
+        agrupar_por = None
+        if not granularidade and any(re.search(rf'\b{palavra}\b', pergunta_lower) for palavra in self.PALAVRAS_RANKING):
+            mencoes = []
+            for campo, (palavras, _) in self.DIMENSOES_CONSULTA.items():
+                if campo in filtros:
+                    continue
+                for palavra in palavras:
+                    match = re.search(rf'\b{re.escape(palavra)}\b', pergunta_lower)
+                    if match and match.start() not in posicoes_filtro:
+                        mencoes.append((match.start(), campo))
+            if mencoes:
+                agrupar_por = min(mencoes)[1]
+        
+        # Coleção e campo de data
+        tipo_consulta, colecao_nome = self._resolver_colecao_data(pergunta)
+        if not data_inicio:
+            colecao_nome = self._detectar_colecao_relevante(pergunta) or colecao_nome
+        if not colecao_nome:
+            return None
+        
+        return ConsultaAST(
+            colecao_nome,
+            filtros=filtros,
+            campo_data=tipo_consulta['campo_data'] if data_inicio else None,
+            data_inicio=data_inicio,
+            data_fim=data_fim,
+            agrupar_por=agrupar_por,
+            limite=self._detectar_quantidade(self._remover_valores_filtro(pergunta, filtros)) if agrupar_por else None,
+            granularidade=granularidade
+        )
+    
+    def _construir_consultas(self, interpretacao: Dict[str, Any]) -> List[ConsultaAST]:
+        """
+        Monta as consultas estruturadas da pergunta. Quando a pergunta menciona
+        vários tipos de registro ("devoluções e cancelamentos em janeiro"), a
+        mesma consulta é repetida para a coleção de cada tipo.
+        
+        Args:
+            interpretacao: Resultado de _interpretar_pergunta
+            
+        Returns:
+            Lista de consultas (vazia se a pergunta não for estruturada)
+        """
+        consulta = self._construir_consulta_ast(interpretacao)
+        pares = self._resolver_colecoes_data(interpretacao.get('pergunta_original', ''))
+        if len(pares) < 2:
+            return [consulta] if consulta is not None else []
+        
+        # Contagens simples também são repartidas entre as coleções mencionadas
+        if consulta is None:
+            if interpretacao['tipo'] != 'contagem':
+                return []
+            consulta = ConsultaAST(pares[0][1])
+        
+        return [consulta.para_colecao(colecao, tipo_consulta['campo_data']) for tipo_consulta, colecao in pares]
+    
+    def _remover_valores_filtro(self, pergunta: str, filtros: Dict[str, Any]) -> str:
+        """Remove os valores filtrados e as datas para não confundi-los com a quantidade pedida."""
+        texto = re.sub(r'\d{1,2}/\d{1,2}(?:/\d{2,4})?', ' ', pergunta)
+        for valor in filtros.values():
+            texto = re.sub(rf'\b{re.escape(str(valor))}\b', ' ', texto, flags=re.IGNORECASE)
+        return texto
+    
+    def _descrever_consulta(self, consulta: ConsultaAST) -> str:
+        """Descreve os filtros e o período de uma consulta estruturada."""
+        partes = [f"{campo} {valor}" for campo, valor in sorted(consulta.filtros.items())]
+        if consulta.tem_intervalo:
+            if consulta.data_inicio == consulta.data_fim:
+                partes.append(f"em {consulta.data_inicio}")
+            else:
+                partes.append(f"de {consulta.data_inicio} a {consulta.data_fim}")
+        return ", ".join(partes)
+    
+    def _executar_consulta_planejada(self, consulta: ConsultaAST, formato_tabela: bool) -> str:
+        """
+        Executa uma consulta estruturada e formata a resposta.
+        
+        Args:
+            consulta: Consulta estruturada
+            formato_tabela: Se True, responde com tabela HTML
+            
+        Returns:
+            Resposta formatada
+        """
+        resultado = self.planejador.executar(consulta)
+        descricao = self._descrever_consulta(consulta)
+        
+        if consulta.granularidade:
+            return self._formatar_periodos(consulta, resultado, descricao, formato_tabela)
+        
+        if not consulta.agrupar_por:
+            total = resultado[0]['count'] if resultado else 0
+            return f"Foram encontrados **{total:,}** registros na coleção **{consulta.colecao}** ({descricao})."
+        
+        titulo = self.DIMENSOES_CONSULTA[consulta.agrupar_por][1]
+        if not resultado:
+            return f"Nenhum registro encontrado na coleção **{consulta.colecao}** ({descricao})."
+        
+        if formato_tabela:
+            return self._formatar_como_tabela(
+                dados=resultado,
+                colunas=['Posição', consulta.agrupar_por, 'Quantidade de Registros'],
+                titulo=f"Top {consulta.limite} {titulo} - {consulta.colecao} ({descricao})",
+                formata_dados=lambda i, item: [i + 1, item['_id'], f"{item['count']:,}"]
+            )
+        
+        resposta = f"Top {consulta.limite} {titulo} na coleção **{consulta.colecao}** ({descricao}):\n\n"
+        for i, item in enumerate(resultado, 1):
+            resposta += f"{i}. **{item['_id']}**: {item['count']:,} registros\n"
+        return resposta
+    
+    def _executar_consultas_multiplas(self, consultas: List[ConsultaAST], formato_tabela: bool) -> str:
+        """
+        Executa a mesma consulta em várias coleções em paralelo e combina as respostas.
+        
+        Args:
+            consultas: Consultas (uma por coleção)
+            formato_tabela: Se True, responde com tabelas HTML
+            
+        Returns:
+            Resposta com o resultado de cada coleção, o tempo de cada uma e o resultado combinado
+        """
+        referencia = consultas[0]
+        ranking = bool(referencia.agrupar_por) and not referencia.granularidade
+        if ranking:
+            # O top N da soma só sai correto com todos os grupos de cada coleção; o corte
+            # fica para mesclar_resultados. O total de cada coleção vem de uma contagem sem agrupamento.
+            consultas_executadas = [consulta.para_colecao(consulta.colecao, consulta.campo_data, limitar=False) for consulta in consultas]
+            consultas_executadas += [consulta.para_total() for consulta in consultas]
+        else:
+            consultas_executadas = consultas
+        
+        inicio = time.perf_counter()
+        execucoes = self.planejador.executar_varias(consultas_executadas)
+        tempo_total = time.perf_counter() - inicio
+        totais = execucoes[len(consultas):] if ranking else execucoes
+        execucoes = execucoes[:len(consultas)]
+        
+        descricao = self._descrever_consulta(referencia)
+        tipos = {
+            colecao: tipo_consulta['tipo']
+            for tipo_consulta in self.TIPOS_CONSULTA_DATA.values()
+            for colecao in tipo_consulta['colecoes']
+        }
+        
+        # Total de cada coleção (soma dos grupos ou, em rankings, a contagem sem agrupamento)
+        linhas = []
+        for execucao, total in zip(execucoes, totais):
+            tempo = execucao['tempo_segundos'] + (total['tempo_segundos'] if total is not execucao else 0)
+            linhas.append({
+                'colecao': execucao['colecao'],
+                'tipo': tipos.get(execucao['colecao'], execucao['colecao']),
+                'total': sum(item['count'] for item in total['resultado']),
+                'tempo': tempo,
+                'erro': execucao['erro'] or total['erro']
+            })
+        mesclado = mesclar_resultados([execucao for execucao in execucoes if not execucao['erro']], referencia)
+        total_geral = sum(linha['total'] for linha in linhas)
+        rodape = (f"Consultadas {len(execucoes)} coleções em paralelo em {tempo_total:.2f}s "
+                  f"(soma dos tempos: {sum(linha['tempo'] for linha in linhas):.2f}s)")
+        
+        if formato_tabela:
+            resposta = self._formatar_como_tabela(
+                dados=linhas,
+                colunas=['Coleção', 'Registros', 'Tempo (s)'],
+                titulo=f"Resultado por coleção ({descricao})" if descricao else "Resultado por coleção",
+                formata_dados=lambda i, linha: [
+                    linha['colecao'],
+                    f"Erro: {linha['erro']}" if linha['erro'] else f"{linha['total']:,}",
+                    f"{linha['tempo']:.3f}"
+                ]
+            )
+        else:
+            resposta = f"Resultado por coleção{f' ({descricao})' if descricao else ''}:\n\n"
+            for linha in linhas:
+                if linha['erro']:
+                    resposta += f"- **{linha['colecao']}**: erro ao consultar ({linha['erro']})\n"
+                else:
+                    resposta += f"- **{linha['colecao']}** ({linha['tipo']}): {linha['total']:,} registros em {linha['tempo']:.3f}s\n"
+            if not referencia.agrupar_por and not referencia.granularidade:
+                resposta += f"\n**Total combinado:** {total_geral:,} registros\n"
+        
+        # Grupos somados entre as coleções
+        if referencia.granularidade:
+            resposta += "\n\n" + self._formatar_periodos(referencia.para_colecao("todas as coleções"), mesclado, descricao, formato_tabela)
+        elif referencia.agrupar_por and mesclado:
+            titulo = self.DIMENSOES_CONSULTA[referencia.agrupar_por][1]
+            if formato_tabela:
+                resposta += self._formatar_como_tabela(
+                    dados=mesclado,
+                    colunas=['Posição', referencia.agrupar_por, 'Quantidade de Registros'],
+                    titulo=f"Top {referencia.limite} {titulo} - todas as coleções ({descricao})",
+                    formata_dados=lambda i, item: [i + 1, item['_id'], f"{item['count']:,}"]
+                )
+            else:
+                resposta += f"\nTop {referencia.limite} {titulo} somando as coleções ({descricao}):\n\n"
+                for i, item in enumerate(mesclado, 1):
+                    resposta += f"{i}. **{item['_id']}**: {item['count']:,} registros\n"
+        
+        registrar_resumo(rodape)
+        return resposta + f"\n\n_{rodape}_"
+    
+    def _formatar_periodos(self, consulta: ConsultaAST, resultado: List[Dict[str, Any]],
+                           descricao: str, formato_tabela: bool) -> str:
+        """
+        Formata contagens agrupadas por dia, semana ou mês.
+        
+        Args:
+            consulta: Consulta estruturada com granularidade
+            resultado: Lista {"_id": período, "count": quantidade} em ordem cronológica
+            descricao: Descrição dos filtros e do período
+            formato_tabela: Se True, responde com tabela HTML
+            
+        Returns:
+            Resposta formatada
+        """
+        titulo = self.GRANULARIDADES_PERIODO[consulta.granularidade][1]
+        # Documentos sem data válida ficam no grupo None
+        periodos = [item for item in resultado if item['_id'] is not None]
+        if not periodos:
+            return f"Nenhum registro encontrado na coleção **{consulta.colecao}** ({descricao})."
+        
+        total = sum(item['count'] for item in periodos)
+        if formato_tabela:
+            return self._formatar_como_tabela(
+                dados=periodos,
+                colunas=[titulo, 'Quantidade de Registros'],
+                titulo=f"Registros por {titulo.lower()} - {consulta.colecao} ({descricao}) - total {total:,}",
+                formata_dados=lambda i, item: [item['_id'], f"{item['count']:,}"]
+            )
+        
+        resposta = f"Registros por {titulo.lower()} na coleção **{consulta.colecao}** ({descricao}):\n\n"
+        for item in periodos:
+            resposta += f"- **{item['_id']}**: {item['count']:,} registros\n"
+        resposta += f"\n**Total:** {total:,} registros"
+        return resposta
+    
+    def _extrair_periodo(self, pergunta: str) -> Tuple[Optional[str], Optional[str]]:
+        """
+        Extrai as datas inicial e final de um período mencionado na pergunta.
+        
+        Args:
+            pergunta: Pergunta do usuário contendo o período
+            
+        Returns:
+            Tupla (data_inicio, data_fim) normalizadas ou (None, None)
+        """
+        pergunta_lower = pergunta.lower()
+        
+        # Padrões para diferentes formatos de período
+        padroes_periodo = [
+            r'entre\s+o?\s*dia\s+(\d{1,2}/\d{1,2})\s+até\s+dia\s+(\d{1,2}/\d{1,2})',
+            r'de\s+(\d{1,2}/\d{1,2})\s+até\s+(\d{1,2}/\d{1,2})',
+            r'entre\s+(\d{1,2}/\d{1,2})\s+e\s+(\d{1,2}/\d{1,2})',
+            r'entre\s+os\s+dias\s+(\d{1,2}/\d{1,2})\s+e\s+(\d{1,2}/\d{1,2})',
+            r'entre\s+o\s+dia\s+(\d{1,2}/\d{1,2})\s+e\s+(\d{1,2}/\d{1,2})'
+        ]
+        
+        for padrao in padroes_periodo:
+            match = re.search(padrao, pergunta_lower)
+            if match:
+                return self._normalizar_data(match.group(1)), self._normalizar_data(match.group(2))
+        
+        return self._extrair_mes(pergunta)
+    
+    def _extrair_mes(self, pergunta: str) -> Tuple[Optional[str], Optional[str]]:
+        """
+        Extrai o período de um mês por extenso ("em janeiro", "março de 2025").
+        Sem ano explícito, usa o ano atual.
+        
+        Args:
+            pergunta: Pergunta do usuário
+            
+        Returns:
+            Tupla (primeiro dia, último dia) no formato DD/MM/AAAA ou (None, None)
+        """
+        nomes_meses = '|'.join(self.MESES)
+        match = re.search(rf'\b({nomes_meses})\b(?:\s+de\s+(\d{{4}}))?', pergunta.lower())
+        if not match:
+            return None, None
+        
+        mes = self.MESES[match.group(1)]
+        ano = int(match.group(2)) if match.group(2) else datetime.now().year
+        ultimo_dia = calendar.monthrange(ano, mes)[1]
+        return f"01/{mes:02d}/{ano}", f"{ultimo_dia:02d}/{mes:02d}/{ano}"
+    
+    def _resolver_colecao_data(self, pergunta: str) -> Tuple[Dict[str, Any], Optional[str]]:
+        """
+        Resolve o tipo de consulta de data e a primeira coleção disponível para ele.
+        
+        Args:
+            pergunta: Pergunta do usuário
+            
+        Returns:
+            Tupla (tipo_consulta, nome da coleção ou None)
+        """
+        tipo_consulta = self._detectar_tipo_consulta_data(pergunta)
+        colecoes_existentes = self.catalogo.nomes()
+        colecoes_disponiveis = [col for col in tipo_consulta['colecoes'] if col in colecoes_existentes]
+        return tipo_consulta, colecoes_disponiveis[0] if colecoes_disponiveis else None
+    
     def _detectar_tipo_consulta_data(self, pergunta: str) -> Dict[str, Any]:
         """
         Detecta o tipo de consulta de data baseado na pergunta.
@@ -1057,43 +1616,45 @@ Resposta em português:""",
         Returns:
             Dicionário com informações sobre o tipo de consulta
         """
-        pergunta_lower = pergunta.lower()
+        tipos = self._detectar_tipos_consulta_data(pergunta)
         
-        # Mapear tipos de consulta para coleções e campos
-        tipos_consulta = {
-            'devolução': {
-                'colecoes': ['DEVOLUCAO', 'DEVOLUCOES', 'DEVOLUCAO_2025'],
-                'campo_data': 'DATA_DEVOLUCAO',
-                'tipo': 'devoluções'
-            },
-            'cancelamento': {
-                'colecoes': ['CANCELAMENTO', 'CANCELAMENTOS', 'CANCELAMENTO_2025'],
-                'campo_data': 'DATACANCELAMENTO',
-                'tipo': 'cancelamentos'
-            },
-            'ajuste': {
-                'colecoes': ['AJUSTES ESTOQUE', 'AJUSTES', 'ESTOQUE', 'INVENTARIO', 'AJUSTES_ESTOQUE_2025'],
-                'campo_data': 'DATA',
-                'tipo': 'ajustes de estoque'
-            }
-        }
+        # Se não detectar tipo específico, assumir devolução
+        return tipos[0] if tipos else self.TIPOS_CONSULTA_DATA['devolução']
+    
+    def _detectar_tipos_consulta_data(self, pergunta: str) -> List[Dict[str, Any]]:
+        """
+        Detecta todos os tipos de consulta de data mencionados na pergunta,
+        ex.: "devoluções e cancelamentos".
         
-        # Detectar tipo baseado em palavras-chave
-        for tipo, info in tipos_consulta.items():
-            # Criar variações com e sem acentos
-            variacoes = [tipo, f'{tipo}s']
-            if tipo == 'devolução':
-                variacoes.extend(['devolucao', 'devoluções', 'devolucoes'])
-            elif tipo == 'cancelamento':
-                variacoes.extend(['cancelamentos'])
-            elif tipo == 'ajuste':
-                variacoes.extend(['ajustes', 'estoque', 'inventario', 'inventário'])
+        Args:
+            pergunta: Pergunta do usuário
             
-            if any(palavra in pergunta_lower for palavra in variacoes):
-                return info
+        Returns:
+            Lista de tipos mencionados (vazia se nenhum)
+        """
+        pergunta_lower = pergunta.lower()
+        return [
+            info for info in self.TIPOS_CONSULTA_DATA.values()
+            if any(palavra in pergunta_lower for palavra in info['variacoes'])
+        ]
+    
+    def _resolver_colecoes_data(self, pergunta: str) -> List[Tuple[Dict[str, Any], str]]:
+        """
+        Resolve cada tipo de consulta de data mencionado para a primeira coleção disponível.
         
-        # Se não detectar tipo específico, assumir devolução
-        return tipos_consulta['devolução']
+        Args:
+            pergunta: Pergunta do usuário
+            
+        Returns:
+            Lista de tuplas (tipo_consulta, nome da coleção)
+        """
+        colecoes_existentes = self.catalogo.nomes()
+        pares = []
+        for tipo_consulta in self._detectar_tipos_consulta_data(pergunta):
+            disponiveis = [col for col in tipo_consulta['colecoes'] if col in colecoes_existentes]
+            if disponiveis:
+                pares.append((tipo_consulta, disponiveis[0]))
+        return pares
 
     def _normalizar_data(self, texto: str) -> Optional[str]:
         """
@@ -1128,91 +1689,98 @@ Resposta em português:""",
         
         return f"{dia}/{mes}/{ano}"
 
+    def _buscar_identificadores(self, identificadores: Dict[str, List[str]]) -> str:
+        """
+        Busca os registros de SKU, usuário, loja ou devolução em todas as coleções.
+        Só as coleções que têm o campo são consultadas, com igualdades sobre o
+        índice do campo no MongoDB (contagem por valor gravado e registros).
+        
+        Args:
+            identificadores: Campo -> valores citados na pergunta
+            
+        Returns:
+            Resumo por coleção e tabelas com os registros encontrados
+        """
+        descricao = ", ".join(f"{campo} {valor}" for campo, valores in identificadores.items() for valor in valores)
+        try:
+            busca = self.indice_identificadores.consultar(identificadores)
+        except Exception as e:
+            return renderizar_aviso(AVISO_ERRO, " Erro na Busca", f"Erro ao buscar {descricao}: {str(e)}")
+        
+        resultados = busca['resultados']
+        if not resultados:
+            return renderizar_aviso(
+                AVISO_ALERTA, " Nenhum Registro Encontrado",
+                f"Não há registros de {descricao} em nenhuma coleção."
+            )
+        
+        total = sum(item['total'] for item in resultados)
+        partes = [self._formatar_como_tabela(
+            dados=resultados,
+            colunas=['Coleção', 'Campo', 'Valor', 'Registros'],
+            titulo=f" Registros de {descricao}",
+            formata_dados=lambda i, item: [item['colecao'], item['campo'], item['valor'], f"{item['total']:,}"]
+        )]
+        for item in resultados:
+            colunas = []
+            for documento in item['documentos']:
+                colunas.extend(chave for chave in documento if chave not in colunas)
+            titulo = f"{item['colecao']} - {item['campo']} {item['valor']}"
+            if item['total'] > len(item['documentos']):
+                titulo += f" (primeiros {len(item['documentos'])} de {item['total']:,})"
+            partes.append(self._formatar_como_tabela(
+                dados=item['documentos'],
+                colunas=colunas,
+                titulo=titulo,
+                formata_dados=lambda i, documento: [documento.get(coluna, '') for coluna in colunas]
+            ))
+        
+        resumo = (f"{total:,} registros em {len({item['colecao'] for item in resultados})} coleção(ões), "
+                  f"busca em {busca['tempo_segundos'] * 1000:.0f} ms pelos índices de identificadores")
+        registrar_resumo(resumo)
+        partes.append(renderizar_nota(resumo))
+        return "".join(partes)
+    
     def _analisar_inconsistencias(self) -> str:
         """
-        Analisa inconsistências entre as coleções do banco de dados.
+        Analisa inconsistências de SKU entre as coleções do banco de dados.
+        Usa diferenças de conjuntos (uma leitura por coleção) e mostra a contagem
+        por par de coleções; o relatório completo fica paginado em /inconsistencias.
         """
         try:
-            # Buscar SKUs que aparecem em uma coleção mas não em outras
-            colecoes = ['DEVOLUCAO', 'CANCELAMENTO', 'AJUSTES ESTOQUE']
-            inconsistencias = []
+            resultado = obter_analisador_inconsistencias().analisar("SKU")
             
-            for colecao in colecoes:
-                if colecao in self.db.list_collection_names():
-                    skus = set()
-                    for doc in self.db[colecao].find({}, {"SKU": 1}):
-                        if 'SKU' in doc and doc['SKU']:
-                            skus.add(doc['SKU'])
-                    
-                    for sku in skus:
-                        # Verificar se SKU existe nas outras coleções
-                        outras_colecoes = [c for c in colecoes if c != colecao]
-                        for outra_colecao in outras_colecoes:
-                            if outra_colecao in self.db.list_collection_names():
-                                existe_na_outra = self.db[outra_colecao].count_documents({"SKU": sku}) > 0
-                                if not existe_na_outra:
-                                    inconsistencias.append({
-                                        'tipo': f'{colecao} sem {outra_colecao}',
-                                        'sku': sku,
-                                        'descricao': f'SKU {sku} existe em {colecao} mas não em {outra_colecao}'
-                                    })
-            
-            if inconsistencias:
-                # Limitar a 10 inconsistências para melhor visualização
-                inconsistencias_limitadas = inconsistencias[:10]
-                
-                html = f"""
-                <div style="margin: 20px 0; font-family: Arial, sans-serif;">
-                    <h3 style="color: #dc3545; margin-bottom: 15px; text-align: center;"> Inconsistências Encontradas</h3>
-                    <div style="overflow-x: auto;">
-                        <table style="width: 100%; border-collapse: collapse; background-color: white; box-shadow: 0 2px 4px rgba(0,0,0,0.1); border-radius: 8px; overflow: hidden;">
-                            <thead>
-                                <tr style="background-color: #f8d7da;">
-                                    <th style="padding: 12px 15px; text-align: left; font-weight: bold; color: #721c24; border-bottom: 2px solid #f5c6cb;">Tipo de Inconsistência</th>
-                                    <th style="padding: 12px 15px; text-align: left; font-weight: bold; color: #721c24; border-bottom: 2px solid #f5c6cb;">SKU</th>
-                                    <th style="padding: 12px 15px; text-align: left; font-weight: bold; color: #721c24; border-bottom: 2px solid #f5c6cb;">Descrição</th>
-                                </tr>
-                            </thead>
-                            <tbody>
-                """
-                
-                for i, item in enumerate(inconsistencias_limitadas):
-                    cor_linha = "#f8d7da" if i % 2 == 0 else "#f5c6cb"
-                    html += f"""
-                                <tr style="background-color: {cor_linha};">
-                                    <td style="padding: 10px 15px; border-bottom: 1px solid #f5c6cb; color: #721c24; font-weight: bold;">{item['tipo']}</td>
-                                    <td style="padding: 10px 15px; border-bottom: 1px solid #f5c6cb; color: #721c24; font-family: monospace;">{item['sku']}</td>
-                                    <td style="padding: 10px 15px; border-bottom: 1px solid #f5c6cb; color: #721c24;">{item['descricao']}</td>
-                                </tr>
-                    """
-                
-                html += f"""
-                            </tbody>
-                        </table>
-                    </div>
-                    <p style="margin-top: 10px; color: #6c757d; font-size: 14px; text-align: center;">
-                        <strong>Total de inconsistências encontradas:</strong> {len(inconsistencias)} | 
-                        <strong>Mostrando:</strong> {len(inconsistencias_limitadas)}
-                    </p>
-                </div>
-                """
-                
-                return html
+            if len(resultado.colecoes) < 2:
+                return renderizar_aviso(
+                    AVISO_ALERTA, " Coleções Insuficientes",
+                    "São necessárias ao menos duas coleções com o campo SKU para comparar."
+                )
+            
+            if resultado.total_inconsistencias:
+                # Primeiros itens do relatório completo
+                primeira_pagina = resultado.pagina(1, 10)
+                pares = [[item['origem'], item['destino'], f"{item['total']:,}"] for item in resultado.resumo_pares()]
+                exemplos = [
+                    [
+                        f"{item['origem']} sem {item['destino']}",
+                        item['sku'],
+                        f"SKU {item['sku']} existe em {item['origem']} mas não em {item['destino']}"
+                    ]
+                    for item in primeira_pagina['itens']
+                ]
+                registrar_tabela(" Inconsistências de SKU entre Coleções", ['Existe em', 'Não existe em', 'SKUs'], pares)
+                registrar_tabela("Exemplos", ['Tipo de Inconsistência', 'SKU', 'Descrição'], exemplos)
+                registrar_resumo(f"Total de inconsistências encontradas: {resultado.total_inconsistencias:,}")
+                registrar_link("Relatório completo (paginado)", "/inconsistencias?pagina=1")
+                return renderizar('inconsistencias.html', pares=pares, exemplos=exemplos, total=resultado.total_inconsistencias)
             else:
-                return """
-                <div style="margin: 20px 0; padding: 20px; background-color: #d4edda; border: 1px solid #c3e6cb; border-radius: 8px; text-align: center;">
-                    <h3 style="color: #155724; margin: 0;"> Nenhuma Inconsistência Encontrada</h3>
-                    <p style="color: #155724; margin: 10px 0 0 0;">Os dados estão consistentes entre todas as coleções.</p>
-                </div>
-                """
+                return renderizar_aviso(
+                    AVISO_SUCESSO, " Nenhuma Inconsistência Encontrada",
+                    "Os dados estão consistentes entre todas as coleções."
+                )
                 
         except Exception as e:
-            return f"""
-            <div style="margin: 20px 0; padding: 20px; background-color: #f8d7da; border: 1px solid #f5c6cb; border-radius: 8px; text-align: center;">
-                <h3 style="color: #721c24; margin: 0;"> Erro na Análise</h3>
-                <p style="color: #721c24; margin: 10px 0 0 0;">Erro ao analisar inconsistências: {str(e)}</p>
-            </div>
-            """
+            return renderizar_aviso(AVISO_ERRO, " Erro na Análise", f"Erro ao analisar inconsistências: {str(e)}")
 
     def _detectar_quantidade(self, pergunta: str) -> int:
         """
@@ -1254,86 +1822,184 @@ Resposta em português:""",
 
     def _formatar_como_tabela(self, dados: list, colunas: list, titulo: str, formata_dados) -> str:
         """
-        Formata dados como uma tabela HTML estilizada.
+        Formata dados como uma tabela HTML estilizada (template "tabela.html").
+        Durante a montagem de uma resposta, a tabela é só registrada na resposta
+        estruturada e volta como marcador; o HTML é gerado por renderizar_resposta.
         """
-        html = f"""
-        <div style="margin: 20px 0; font-family: Arial, sans-serif;">
-            <h3 style="color: #333; margin-bottom: 15px; text-align: center;">{titulo}</h3>
-            <div style="overflow-x: auto;">
-                <table style="width: 100%; border-collapse: collapse; background-color: white; box-shadow: 0 2px 4px rgba(0,0,0,0.1); border-radius: 8px; overflow: hidden;">
-                    <thead>
-                        <tr style="background-color: #f8f9fa;">
+        linhas = (formata_dados(i, item) for i, item in enumerate(dados))
+        marcador = registrar_tabela(titulo, colunas, linhas)
+        if marcador is not None:
+            return marcador
+        return renderizar_tabela(titulo, colunas, linhas)
+
+    def _canonicalizar_intencao(self, interpretacao: Dict[str, Any]) -> Tuple[Optional[Dict[str, Any]], List[str]]:
         """
+        Reduz a interpretação da pergunta à sua intenção canônica.
+        Perguntas com redações diferentes mas mesma consulta geram a mesma intenção.
         
-        # Cabeçalho da tabela
-        for coluna in colunas:
-            html += f'<th style="padding: 12px 15px; text-align: left; font-weight: bold; color: #495057; border-bottom: 2px solid #dee2e6;">{coluna}</th>'
-        
-        html += """
-                        </tr>
-                    </thead>
-                    <tbody>
+        Args:
+            interpretacao: Resultado de _interpretar_pergunta
+            
+        Returns:
+            Tupla (intenção canônica ou None se não cacheável, coleções envolvidas)
         """
+        tipo = interpretacao['tipo']
+        pergunta = interpretacao.get('pergunta_original', '')
+        intencao = {
+            'tipo': tipo,
+            'formato_tabela': interpretacao['formato_tabela'],
+            'aproximado': interpretacao.get('aproximado', False)
+        }
         
-        # Dados da tabela
-        for i, item in enumerate(dados):
-            cor_linha = "#f8f9fa" if i % 2 == 0 else "white"
-            html += f'<tr style="background-color: {cor_linha};">'
-            
-            dados_formatados = formata_dados(i, item)
-            for dado in dados_formatados:
-                # Escapar caracteres especiais para HTML
-                dado_escaped = str(dado).replace('&', '&amp;').replace('<', '&lt;').replace('>', '&gt;')
-                html += f'<td style="padding: 10px 15px; border-bottom: 1px solid #dee2e6; color: #495057;">{dado_escaped}</td>'
-            
-            html += '</tr>'
+        # Consultas que dependem de todas as coleções
+        if tipo in ('listar_colecoes', 'inconsistencia', 'analise_fraude'):
+            return intencao, [TODAS_COLECOES]
         
-        html += """
-                    </tbody>
-                </table>
-            </div>
-        </div>
+        if tipo == 'busca_identificador':
+            intencao['identificadores'] = {
+                campo: sorted(valores) for campo, valores in sorted(interpretacao['identificadores'].items())
+            }
+            return intencao, [TODAS_COLECOES]
+        
+        # Consultas com filtros por valor e/ou período (planejador), em uma ou várias coleções
+        consultas = self._construir_consultas(interpretacao)
+        if consultas:
+            intencao.update({'tipo': tipo, 'consultas': [consulta.para_dict() for consulta in consultas]})
+            return intencao, [consulta.colecao for consulta in consultas]
+        
+        if tipo == 'ranking':
+            ranking = self._resolver_ranking(pergunta)
+            if not ranking:
+                return None, []
+            intencao.update({
+                'colecao': ranking['colecao'],
+                'dimensao': ranking['campo_agrupamento'],
+                'quantidade': self._detectar_quantidade(pergunta),
+                # O ranking direto decide o formato a partir do texto da pergunta
+                'formato_tabela': any(palavra in pergunta.lower() for palavra in ['tabela', 'table', 'formato de tabela'])
+            })
+            return intencao, [ranking['colecao']]
+        
+        if tipo in ('consulta_data_especifica', 'consulta_periodo_datas'):
+            tipo_consulta, colecao_nome = self._resolver_colecao_data(pergunta)
+            if tipo == 'consulta_data_especifica':
+                data_inicio = data_fim = self._normalizar_data(pergunta)
+            else:
+                data_inicio, data_fim = self._extrair_periodo(pergunta)
+            intencao.update({
+                'colecao': colecao_nome,
+                'dimensao': tipo_consulta['campo_data'],
+                'data_inicio': data_inicio,
+                'data_fim': data_fim
+            })
+            return intencao, [colecao_nome] if colecao_nome else []
+        
+        dimensoes = {'top_sku': 'SKU', 'top_loja': 'LOJA', 'top_usuario': 'IDUSUARIO', 'contagem_total': None}
+        if tipo in dimensoes:
+            colecao_nome = self._detectar_colecao_relevante(pergunta)
+            if not colecao_nome:
+                return None, []
+            intencao.update({
+                'colecao': colecao_nome,
+                'dimensao': dimensoes[tipo],
+                'quantidade': interpretacao['quantidade'] if dimensoes[tipo] else None
+            })
+            return intencao, [colecao_nome]
+        
+        return None, []
+    
+    def _get_cache_key(self, interpretacao: Dict[str, Any]) -> Tuple[Optional[str], List[str]]:
         """
+        Gera chave determinística para o cache baseada na intenção canônica.
         
-        return html
-
-    def _get_cache_key(self, interpretacao: Dict[str, Any]) -> str:
-        """Gera chave única para o cache baseada na interpretação."""
-        pergunta = interpretacao.get('pergunta_original', '')
-        colecoes = interpretacao.get('colecoes_especificas', [])
-        return f"{interpretacao['tipo']}_{interpretacao['quantidade']}_{interpretacao['formato_tabela']}_{hash(pergunta)}_{hash(str(colecoes))}"
+        Returns:
+            Tupla (chave ou None se a consulta não for cacheável, coleções envolvidas)
+        """
+        intencao, colecoes = self._canonicalizar_intencao(interpretacao)
+        if intencao is None:
+            return None, []
+        return gerar_chave_intencao(intencao), colecoes
     
-    def _get_from_cache(self, cache_key: str) -> Optional[str]:
-        """Recupera resultado do cache."""
-        if cache_key in self.cache_consultas:
+    def _get_from_cache(self, cache_key: Optional[str]) -> Optional[Dict[str, Any]]:
+        """Recupera resultado do cache ({"resposta", "estruturada"})."""
+        if cache_key is None:
+            return None
+        resultado = self.cache_consultas.obter(cache_key)
+        if resultado is not None:
             print(f" Cache hit: {cache_key}")
-            return self.cache_consultas[cache_key]
-        return None
+            # Entradas gravadas antes das respostas estruturadas
+            if isinstance(resultado, str):
+                resultado = {"resposta": resultado, "estruturada": montar_resposta(resultado)}
+        return resultado
     
-    def _save_to_cache(self, cache_key: str, resultado: str):
-        """Salva resultado no cache."""
-        # Limitar tamanho do cache
-        if len(self.cache_consultas) >= self.cache_max_size:
-            # Remover o item mais antigo (FIFO)
-            oldest_key = next(iter(self.cache_consultas))
-            del self.cache_consultas[oldest_key]
-        
-        self.cache_consultas[cache_key] = resultado
+    def _save_to_cache(self, cache_key: Optional[str], resultado: str, colecoes: List[str]):
+        """
+        Salva resultado no cache associado às coleções da consulta, junto com
+        a resposta estruturada registrada durante a montagem.
+        """
+        if cache_key is None:
+            return
+        self.cache_consultas.salvar(cache_key, self._empacotar_resposta(resultado, coletor_ativo()), colecoes)
         print(f" Cache saved: {cache_key}")
+    
+    def _empacotar_resposta(self, resultado: str, coletor=None) -> Dict[str, Any]:
+        """
+        Resposta (HTML/texto com os marcadores das tabelas) e sua versão estruturada.
+        As linhas das tabelas ficam só na versão estruturada, inclusive no cache.
+        """
+        return {"resposta": resultado, "estruturada": montar_resposta(resultado, coletor)}
 
-    def _fazer_consulta_inteligente(self, interpretacao: Dict[str, Any]) -> Optional[str]:
+    def _fazer_consulta_inteligente(self, interpretacao: Dict[str, Any],
+                                    callback_evento: Optional[Callable] = None) -> Optional[Dict[str, Any]]:
         """
         Faz consulta inteligente baseada na interpretação da pergunta.
         OTIMIZADO: Usa cache para consultas frequentes.
         Agora funciona com qualquer coleção do banco.
+        
+        Args:
+            interpretacao: Resultado de _interpretar_pergunta
+            callback_evento: Recebe eventos de progresso de análises longas
+            
+        Returns:
+            Dicionário {"resposta": HTML/texto, "estruturada": resposta estruturada} ou None
         """
         try:
             # Verificar cache primeiro
-            cache_key = self._get_cache_key(interpretacao)
-            resultado_cache = self._get_from_cache(cache_key)
+            with span(COMPONENTE_AGENTE, "cache") as estagio:
+                cache_key, colecoes_cache = self._get_cache_key(interpretacao)
+                resultado_cache = self._get_from_cache(cache_key)
+                estagio.definir(cacheavel=cache_key is not None, acerto=bool(resultado_cache))
             if resultado_cache:
                 return resultado_cache
             
+            def executar(difundir):
+                with span(COMPONENTE_AGENTE, "consulta", tipo=interpretacao['tipo']):
+                    with coletar_resposta() as coletor:
+                        resultado = self._executar_consulta_inteligente(interpretacao, cache_key, colecoes_cache, difundir)
+                return self._empacotar_resposta(resultado, coletor) if resultado else None
+            
+            if cache_key is None:
+                return executar(callback_evento)
+            
+            # Perguntas com a mesma intenção em andamento aguardam a mesma execução
+            return self.coalescedor.executar(cache_key, executar, callback_evento)
+            
+        except Exception as e:
+            print(f" Erro na consulta inteligente: {e}")
+            return None
+    
+    def _executar_consulta_inteligente(self, interpretacao: Dict[str, Any], cache_key: Optional[str],
+                                       colecoes_cache: List[str], callback_evento: Optional[Callable] = None) -> Optional[str]:
+        """
+        Executa a consulta da intenção interpretada e salva o resultado no cache.
+        
+        Args:
+            interpretacao: Resultado de _interpretar_pergunta
+            cache_key: Chave da intenção canônica (None se não cacheável)
+            colecoes_cache: Coleções das quais o resultado depende
+            callback_evento: Recebe eventos de progresso de análises longas
+        """
+        try:
             tipo = interpretacao['tipo']
             quantidade = interpretacao['quantidade']
             formato_tabela = interpretacao['formato_tabela']
@@ -1342,25 +2008,45 @@ Resposta em português:""",
             if tipo == 'listar_colecoes':
                 resultado = self._listar_colecoes_disponiveis()
                 if resultado:
-                    self._save_to_cache(cache_key, resultado)
+                    self._save_to_cache(cache_key, resultado, colecoes_cache)
                     return resultado
             
             # Se for pergunta sobre inconsistências, usar função específica
             elif tipo == 'inconsistencia':
                 resultado = self._analisar_inconsistencias()
                 if resultado:
-                    self._save_to_cache(cache_key, resultado)
+                    self._save_to_cache(cache_key, resultado, colecoes_cache)
                     return resultado
             
             # Se for pergunta sobre análise de fraude, executar análise completa
             elif tipo == 'analise_fraude':
-                resultado = self._executar_analise_fraude()
+                resultado = self._executar_analise_fraude(callback_evento)
                 if resultado:
-                    self._save_to_cache(cache_key, resultado)
+                    self._save_to_cache(cache_key, resultado, colecoes_cache)
                     return resultado
             
-            # Detectar coleção relevante para outros tipos de consulta
+            # Busca de identificadores pelo índice de cada campo no MongoDB (todas as coleções)
+            elif tipo == 'busca_identificador':
+                resultado = self._buscar_identificadores(interpretacao['identificadores'])
+                self._save_to_cache(cache_key, resultado, colecoes_cache)
+                return resultado
+            
+            # Perguntas sobre várias coleções: uma agregação por coleção, em paralelo
             pergunta = interpretacao.get('pergunta_original', '')
+            consultas = self._construir_consultas(interpretacao)
+            if len(consultas) > 1:
+                resultado = self._executar_consultas_multiplas(consultas, formato_tabela)
+                self._save_to_cache(cache_key, resultado, colecoes_cache)
+                return resultado
+            
+            # Consultas com filtros por valor ou ranking dentro de um período
+            consulta = consultas[0] if consultas else None
+            if consulta is not None and (consulta.filtros or consulta.agrupar_por or consulta.granularidade):
+                resultado = self._executar_consulta_planejada(consulta, formato_tabela)
+                self._save_to_cache(cache_key, resultado, colecoes_cache)
+                return resultado
+            
+            # Detectar coleção relevante para outros tipos de consulta
             colecao_nome = self._detectar_colecao_relevante(pergunta)
             if not colecao_nome:
                 return "Nenhuma coleção encontrada no banco de dados."
@@ -1371,136 +2057,69 @@ Resposta em português:""",
             if tipo == 'consulta_data_especifica':
                 resultado = self._consultar_por_data_especifica(pergunta)
                 if resultado:
-                    self._save_to_cache(cache_key, resultado)
+                    self._save_to_cache(cache_key, resultado, colecoes_cache)
                     return resultado
             
             # Se for consulta por período de datas
             if tipo == 'consulta_periodo_datas':
                 resultado = self._consultar_por_periodo_datas(pergunta)
                 if resultado:
-                    self._save_to_cache(cache_key, resultado)
+                    self._save_to_cache(cache_key, resultado, colecoes_cache)
                     return resultado
             
             # Se for consulta de ranking, usar consulta direta
             if tipo == 'ranking':
                 print(f" Tipo 'ranking' detectado - executando consulta direta para: {pergunta}")
-                resultado = self._fazer_consulta_direta(pergunta)
+                resultado, cacheavel = self._fazer_consulta_direta(pergunta)
                 if resultado:
                     print(f" Consulta direta retornou resultado: {resultado[:100]}...")
-                    self._save_to_cache(cache_key, resultado)
+                    if cacheavel:
+                        self._save_to_cache(cache_key, resultado, colecoes_cache)
                     return resultado
                 else:
                     print(f" Consulta direta não retornou resultado")
             
-            if tipo == 'top_sku':
-                pipeline = [
-                    {"$match": {"SKU": {"$exists": True, "$ne": None}}},  # Filtrar SKUs válidos
-                    {"$group": {"_id": "$SKU", "count": {"$sum": 1}}},
-                    {"$sort": {"count": -1}},
-                    {"$limit": quantidade}
-                ]
-                resultado = list(colecao.aggregate(pipeline))
-                if resultado:
-                    if formato_tabela:
-                        resposta = self._formatar_como_tabela(
-                            dados=resultado,
-                            colunas=['Posição', 'SKU', 'Quantidade de Registros'],
-                            titulo=f"Top {quantidade} SKUs Mais Frequentes - Coleção {colecao_nome}",
-                            formata_dados=lambda i, item: [
-                                i + 1,
-                                item['_id'] if item['_id'] else 'N/A',
-                                f"{item['count']:,}"
-                            ]
-                        )
-                        self._save_to_cache(cache_key, resposta)
-                        return resposta
-                    else:
-                        resposta = f"Os {quantidade} SKUs mais frequentes na coleção **{colecao_nome}** são:\n\n"
-                        for i, item in enumerate(resultado, 1):
-                            sku = item['_id'] if item['_id'] else 'N/A'
-                            count = item['count']
-                            resposta += f"{i}. **SKU {sku}**: {count:,} registros\n"
-                        self._save_to_cache(cache_key, resposta)
-                        return resposta
-                else:
-                    resultado = "Não foi possível analisar os SKUs."
-                    self._save_to_cache(cache_key, resultado)
-                    return resultado
-            
-            elif tipo == 'top_loja':
-                pipeline = [
-                    {"$match": {"LOJA": {"$exists": True, "$ne": None}}},  # Filtrar lojas válidas
-                    {"$group": {"_id": "$LOJA", "count": {"$sum": 1}}},
-                    {"$sort": {"count": -1}},
-                    {"$limit": quantidade}
-                ]
-                resultado = list(colecao.aggregate(pipeline))
-                if resultado:
-                    if formato_tabela:
-                        resposta = self._formatar_como_tabela(
-                            dados=resultado,
-                            colunas=['Posição', 'Loja', 'Quantidade de Registros'],
-                            titulo=f"Top {quantidade} Lojas Mais Frequentes - Coleção {colecao_nome}",
-                            formata_dados=lambda i, item: [
-                                i + 1,
-                                item['_id'] if item['_id'] else 'N/A',
-                                f"{item['count']:,}"
-                            ]
-                        )
-                        self._save_to_cache(cache_key, resposta)
-                        return resposta
-                    else:
-                        resposta = f"As {quantidade} lojas mais frequentes na coleção **{colecao_nome}** são:\n\n"
-                        for i, item in enumerate(resultado, 1):
-                            loja = item['_id'] if item['_id'] else 'N/A'
-                            count = item['count']
-                            resposta += f"{i}. **Loja {loja}**: {count:,} registros\n"
-                        self._save_to_cache(cache_key, resposta)
-                        return resposta
-                else:
-                    resultado = "Não foi possível analisar as lojas."
-                    self._save_to_cache(cache_key, resultado)
-                    return resultado
-            
-            elif tipo == 'top_usuario':
-                pipeline = [
-                    {"$match": {"IDUSUARIO": {"$exists": True, "$ne": None}}},  # Filtrar usuários válidos
-                    {"$group": {"_id": "$IDUSUARIO", "count": {"$sum": 1}}},
-                    {"$sort": {"count": -1}},
-                    {"$limit": quantidade}
-                ]
-                resultado = list(colecao.aggregate(pipeline))
+            if tipo in self.RANKINGS_POR_TIPO:
+                campo, rotulo_coluna, rotulo_item, titulo, artigo, descricao = self.RANKINGS_POR_TIPO[tipo]
+                resultado, aviso, aproximado = self._consultar_ranking(
+                    colecao_nome, campo, quantidade, ignorar_nulos=True,
+                    aproximado=interpretacao.get('aproximado', False)
+                )
                 if resultado:
                     if formato_tabela:
                         resposta = self._formatar_como_tabela(
                             dados=resultado,
-                            colunas=['Posição', 'ID Usuário', 'Quantidade de Registros'],
-                            titulo=f"Top {quantidade} Usuários Mais Frequentes - Coleção {colecao_nome}",
+                            colunas=['Posição', rotulo_coluna, 'Quantidade de Registros'],
+                            titulo=f"Top {quantidade} {titulo} Mais Frequentes - Coleção {colecao_nome}",
                             formata_dados=lambda i, item: [
                                 i + 1,
                                 item['_id'] if item['_id'] else 'N/A',
-                                f"{item['count']:,}"
+                                self._formatar_contagem(item)
                             ]
                         )
-                        self._save_to_cache(cache_key, resposta)
-                        return resposta
+                        if aviso:
+                            registrar_resumo(aviso)
+                            resposta += renderizar_nota(aviso)
                     else:
-                        resposta = f"Os {quantidade} usuários mais frequentes na coleção **{colecao_nome}** são:\n\n"
+                        resposta = f"{artigo} {quantidade} {descricao} mais frequentes na coleção **{colecao_nome}** são:\n\n"
                         for i, item in enumerate(resultado, 1):
-                            usuario = item['_id'] if item['_id'] else 'N/A'
-                            count = item['count']
-                            resposta += f"{i}. **Usuário {usuario}**: {count:,} registros\n"
-                        self._save_to_cache(cache_key, resposta)
-                        return resposta
+                            valor = item['_id'] if item['_id'] else 'N/A'
+                            resposta += f"{i}. **{rotulo_item} {valor}**: {self._formatar_contagem(item)} registros\n"
+                        if aviso:
+                            resposta += f"\n_{aviso}_\n"
+                    # Aproximado só por exceder o orçamento: a chave da intenção é a do ranking exato
+                    if interpretacao.get('aproximado', False) or not aproximado:
+                        self._save_to_cache(cache_key, resposta, colecoes_cache)
+                    return resposta
                 else:
-                    resultado = "Não foi possível analisar os usuários."
-                    self._save_to_cache(cache_key, resultado)
+                    resultado = f"Não foi possível analisar {'as' if artigo == 'As' else 'os'} {descricao}."
+                    self._save_to_cache(cache_key, resultado, colecoes_cache)
                     return resultado
             
-            elif tipo == 'contagem_total':
-                total = colecao.count_documents({})
+            if tipo == 'contagem_total':
+                total = self.catalogo.contagem(colecao_nome)
                 resultado = f"A coleção **{colecao_nome}** possui **{total:,}** registros."
-                self._save_to_cache(cache_key, resultado)
+                self._save_to_cache(cache_key, resultado, colecoes_cache)
                 return resultado
             
             return None
@@ -1509,58 +2128,123 @@ Resposta em português:""",
             print(f" Erro na consulta inteligente: {e}")
             return None
 
-    def perguntar(self, pergunta: str) -> Dict[str, Any]:
+    def perguntar(self, pergunta: str, callback_evento: Optional[Callable[[str, Dict[str, Any]], None]] = None,
+                  sessao_id: str = "padrao") -> Dict[str, Any]:
         """
         Faz uma pergunta ao agente.
+        Cada estágio (interpretação, cache, consulta, recuperação, LLM) é
+        rastreado; a duração total vai para o histograma por intenção.
         
         Args:
             pergunta: Pergunta do usuário
+            sessao_id: Sessão de conversa cuja memória será usada
+            callback_evento: Recebe eventos intermediários ("progresso" das
+                análises longas e "token" da resposta do LLM)
             
         Returns:
-            Dicionário com resposta e documentos fonte
+            Dicionário com resposta (HTML/texto; as tabelas vêm como marcadores,
+            ver renderizacao_respostas.renderizar_resposta), resposta estruturada
+            (ver modules.respostas_estruturadas), documentos fonte e o caminho
+            que a respondeu ("llm", "consulta_inteligente", "consulta_direta"...)
         """
-        if not self.qa_chain:
-            raise ValueError("Agente não foi criado. Execute criar_agente() primeiro.")
-        
+        if self.db is None:
+            raise ValueError("Agente não conectado. Execute conectar_mongodb() primeiro.")
+        
+        inicio = time.perf_counter()
+        with rastrear(COMPONENTE_AGENTE, "pergunta", sessao=sessao_id) as rastro:
+            resultado = self._responder_pergunta(pergunta, callback_evento, sessao_id, rastro)
+        resultado["caminho"] = rastro.atributos.get("caminho", "erro")
+        obter_registro_metricas().observar(
+            METRICA_PERGUNTA, time.perf_counter() - inicio,
+            intencao=rastro.atributos.get("intencao", "nenhuma"),
+            caminho=resultado["caminho"]
+        )
+        return resultado
+    
+    def _responder_pergunta(self, pergunta: str, callback_evento: Optional[Callable], sessao_id: str,
+                            rastro) -> Dict[str, Any]:
+        """Responde a pergunta (ver perguntar), registrando intenção e caminho no rastro."""
         try:
             print(f" Pergunta: {pergunta}")
             
             # Interpretar a pergunta de forma inteligente
-            interpretacao = self._interpretar_pergunta(pergunta)
+            with span(COMPONENTE_AGENTE, "interpretar"):
+                interpretacao = self._interpretar_pergunta(pergunta)
             print(f" Interpretação: {interpretacao}")
+            rastro.definir(intencao=interpretacao['tipo'] or "nenhuma")
             
             # Se conseguiu interpretar, fazer consulta direta específica
             if interpretacao['tipo']:
-                resultado_direto = self._fazer_consulta_inteligente(interpretacao)
+                resultado_direto = self._fazer_consulta_inteligente(interpretacao, callback_evento)
                 if resultado_direto:
-                    print(f" Resposta (consulta inteligente): {resultado_direto}")
+                    print(f" Resposta (consulta inteligente): {resultado_direto['resposta']}")
+                    rastro.definir(caminho="consulta_inteligente")
                     return {
                         "pergunta": pergunta,
-                        "resposta": resultado_direto,
+                        "resposta": resultado_direto["resposta"],
+                        "estruturada": resultado_direto["estruturada"],
                         "documentos_fonte": []
                     }
             
             # Fallback: tentar consulta direta tradicional
-            resposta_direta = self._fazer_consulta_direta(pergunta)
+            with span(COMPONENTE_AGENTE, "consulta_direta"):
+                with coletar_resposta() as coletor:
+                    resposta_direta, _ = self._fazer_consulta_direta(pergunta)
             if resposta_direta:
                 print(f" Resposta (consulta direta): {resposta_direta}")
+                rastro.definir(caminho="consulta_direta")
                 return {
                     "pergunta": pergunta,
                     "resposta": resposta_direta,
+                    "estruturada": montar_resposta(resposta_direta, coletor),
+                    "documentos_fonte": []
+                }
+            
+            # O fallback para o LLM depende do índice vetorial (aquecimento em andamento ou com falha)
+            if self.sessoes is None:
+                rastro.definir(caminho="indisponivel")
+                if self.erro_preparacao:
+                    aviso = renderizar_aviso(
+                        AVISO_ERRO, " Assistente indisponível",
+                        f"Não foi possível preparar o índice de busca ({self.erro_preparacao}). Consultas "
+                        "diretas (contagens, rankings, datas, fraude e inconsistências) continuam disponíveis; "
+                        "uma nova tentativa é feita automaticamente."
+                    )
+                else:
+                    aviso = renderizar_aviso(
+                        AVISO_ALERTA, " Assistente em preparação",
+                        "O índice de busca ainda está sendo criado. Consultas diretas (contagens, rankings, "
+                        "datas, fraude e inconsistências) já estão disponíveis; tente esta pergunta em instantes."
+                    )
+                return {
+                    "pergunta": pergunta,
+                    "resposta": aviso,
+                    "estruturada": montar_resposta(aviso),
                     "documentos_fonte": []
                 }
             
             # Executar consulta via LangChain
-            resultado = self.qa_chain({"question": pergunta})
+            # O coletor registra os documentos recuperados, que compõem a chave do cache do LLM
+            # O rastreador mede a recuperação e cada chamada ao LLM dentro da chain
+            callbacks = [ColetorDocumentos(), RastreadorChain(rastro)]
+            if callback_evento:
+                callbacks.append(EncaminhadorTokens(callback_evento))
+            sessao = self.sessoes.obter(sessao_id)
+            with span(COMPONENTE_AGENTE, "chain") as estagio:
+                with sessao.lock:
+                    resultado = sessao.chain({"question": pergunta}, callbacks=callbacks)
+                estagio.definir(documentos=len(resultado.get("source_documents", [])))
             
             resposta = resultado["answer"]
             documentos_fonte = resultado.get("source_documents", [])
+            rastro.definir(caminho="llm")
             
             print(f" Resposta: {resposta}")
             
             return {
                 "pergunta": pergunta,
                 "resposta": resposta,
+                "estruturada": montar_resposta(resposta),
                 "documentos_fonte": [
                     {
                         "colecao": doc.metadata.get("colecao", ""),
@@ -1568,17 +2252,57 @@ Resposta em português:""",
                         "preview": doc.page_content[:200] + "..." if len(doc.page_content) > 200 else doc.page_content
                     }
                     for doc in documentos_fonte
+                    if not doc.metadata.get("cabecalho")
                 ]
             }
             
         except Exception as e:
             print(f" Erro ao processar pergunta: {e}")
+            rastro.definir(caminho="erro", erro=str(e))
             return {
                 "pergunta": pergunta,
                 "resposta": f"Erro ao processar pergunta: {str(e)}",
+                "estruturada": montar_resposta(f"Erro ao processar pergunta: {str(e)}"),
                 "documentos_fonte": []
             }
 
+    def perguntar_stream(self, pergunta: str, sessao_id: str = "padrao") -> Iterator[Tuple[str, Dict[str, Any]]]:
+        """
+        Faz uma pergunta ao agente emitindo eventos à medida que são produzidos.
+        
+        Args:
+            pergunta: Pergunta do usuário
+            sessao_id: Sessão de conversa cuja memória será usada
+            
+        Yields:
+            Tuplas (evento, dados): "inicio", "progresso", "token" e, por último,
+            "final" com o mesmo dicionário retornado por perguntar()
+        """
+        eventos = queue.Queue()
+        fim = object()
+        
+        def executar():
+            try:
+                resultado = self.perguntar(
+                    pergunta,
+                    callback_evento=lambda evento, dados: eventos.put((evento, dados)),
+                    sessao_id=sessao_id
+                )
+                eventos.put(("final", resultado))
+            except Exception as e:
+                eventos.put(("erro", {"erro": str(e)}))
+            finally:
+                eventos.put(fim)
+        
+        threading.Thread(target=executar, name="pergunta-stream", daemon=True).start()
+        
+        yield "inicio", {"pergunta": pergunta}
+        while True:
+            item = eventos.get()
+            if item is fim:
+                break
+            yield item
+
 
 def criar_agente_mongodb() -> MongoDBAgent:
     """
@@ -1618,7 +2342,7 @@ if __name__ == "__main__":
         for pergunta in perguntas_exemplo:
             print(f"\n Testando pergunta: {pergunta}")
             resultado = agente.perguntar(pergunta)
-            print(f" Resposta: {resultado['resposta']}")
+            print(f" Resposta: {renderizar_resposta(resultado['resposta'], resultado['estruturada'])}")
             print("-" * 30)
         
         # Loop interativo
@@ -1635,7 +2359,7 @@ if __name__ == "__main__":
                 
             if pergunta_usuario:
                 resultado = agente.perguntar(pergunta_usuario)
-                print(f" Resposta: {resultado['resposta']}")
+                print(f" Resposta: {renderizar_resposta(resultado['resposta'], resultado['estruturada'])}")
     
     except Exception as e:
         print(f" Erro: {e}")
@@ -0,0 +1 @@
+# Medições de desempenho (executadas manualmente)
@@ -0,0 +1,94 @@
+"""
+Benchmark da codificação dos documentos (detalhada x compacta).
+Gera documentos sintéticos no formato das coleções importadas (campos texto
+do CSV, alguns vazios, datas tipadas derivadas) e mede, em cada modo, os
+caracteres e tokens por documento e os tokens do contexto de uma pergunta
+(5 documentos, com o cabeçalho das abreviações no modo compacto).
+
+Os tokens são contados com o tokenizador dos embeddings (tiktoken) quando
+instalado; senão, aproximados por ~4 caracteres.
+
+Uso (a partir de backend/app):
+    python -m benchmarks.benchmark_codificacao [documentos por coleção]
+"""
+
+import random
+import sys
+from datetime import datetime
+from modules.codificacao_documentos import (
+    CodificadorDocumentos, contar_tokens, MODO_DETALHADO, MODO_COMPACTO
+)
+from modules.dimensao_datas import PREFIXO_CAMPO_TIPADO
+
+
+# Documentos por pergunta (k do retriever)
+DOCUMENTOS_CONTEXTO = 5
+
+COLECOES = {
+    "DEVOLUCAO": ["DATA_DEVOLUCAO", "LOJA", "SKU", "DESCRICAO_PRODUTO", "QUANTIDADE", "VALOR_TOTAL",
+                  "IDUSUARIO", "MOTIVO", "ID_DEVOLUCAO", "OBSERVACAO"],
+    "CANCELAMENTO_2025": ["DATA_CANCELAMENTO", "LOJA", "SKU", "QUANTIDADE", "VALOR_UNITARIO",
+                          "IDUSUARIO", "OPERADOR", "MOTIVO", "NUMERO_NOTA_FISCAL"],
+    "AJUSTES ESTOQUE": ["DATA", "LOJA", "SKU", "TIPO_AJUSTE", "QUANTIDADE", "ESTOQUE_ORIGEM",
+                        "ESTOQUE_DESTINO", "IDUSUARIO"]
+}
+
+
+def documento_sintetico(campos, aleatorio: random.Random) -> dict:
+    """Documento com valores texto (como no CSV), alguns vazios e a data tipada derivada."""
+    doc = {"_id": f"{aleatorio.getrandbits(96):024x}"}
+    for campo in campos:
+        if campo.startswith("DATA"):
+            data = f"{aleatorio.randint(1, 28):02d}/{aleatorio.randint(1, 12):02d}/2025"
+            doc[campo] = data
+            doc[f"{PREFIXO_CAMPO_TIPADO}{campo}"] = datetime.strptime(data, "%d/%m/%Y")
+        elif campo in ("OBSERVACAO", "MOTIVO") and aleatorio.random() < 0.5:
+            doc[campo] = ""
+        elif campo.startswith(("SKU", "ID", "LOJA", "NUMERO")):
+            doc[campo] = str(aleatorio.randint(1, 999999))
+        elif campo.startswith(("VALOR", "QUANTIDADE")):
+            doc[campo] = f"{aleatorio.uniform(1, 500):.2f}".replace(".", ",")
+        else:
+            doc[campo] = aleatorio.choice(["PRODUTO COM DEFEITO", "TROCA DE TAMANHO", "ERRO DE LANCAMENTO",
+                                           "CAMISETA BASICA ALGODAO", "TRANSFERENCIA ENTRE LOJAS"])
+    return doc
+
+
+def executar(por_colecao: int = 200):
+    aleatorio = random.Random(42)
+    documentos = [
+        (documento_sintetico(campos, aleatorio), colecao)
+        for colecao, campos in COLECOES.items()
+        for _ in range(por_colecao)
+    ]
+
+    print(f"{len(documentos)} documentos ({por_colecao} por coleção), contexto de {DOCUMENTOS_CONTEXTO} documentos")
+    print(f"{'modo':>10} | {'caracteres/doc':>14} | {'tokens/doc':>10} | {'cabeçalho (tokens)':>18} | "
+          f"{'contexto (tokens)':>17} | {'economia':>8}")
+    referencia = None
+    for modo, separador in ((MODO_DETALHADO, "\n\n"), (MODO_COMPACTO, "\n")):
+        codificador = CodificadorDocumentos(modo)
+        textos = [(codificador.codificar(doc, colecao), colecao) for doc, colecao in documentos]
+        caracteres = sum(len(texto) for texto, _ in textos) / len(textos)
+        tokens = sum(contar_tokens(texto) for texto, _ in textos) / len(textos)
+
+        # Contextos de 5 documentos de uma coleção, como o retriever costuma
+        # devolver, precedidos do cabeçalho com as chaves usadas neles
+        cabecalhos = []
+        contextos = []
+        for _ in range(100):
+            colecao = aleatorio.choice(list(COLECOES))
+            amostra = aleatorio.sample([texto for texto, origem in textos if origem == colecao], DOCUMENTOS_CONTEXTO)
+            cabecalho = codificador.cabecalho(amostra)
+            cabecalhos.append(contar_tokens(cabecalho))
+            contextos.append(contar_tokens(separador.join(([cabecalho] if cabecalho else []) + amostra)))
+        cabecalho_medio = sum(cabecalhos) / len(cabecalhos)
+        contexto = sum(contextos) / len(contextos)
+
+        referencia = referencia or contexto
+        print(f"{modo:>10} | {caracteres:>14.1f} | {tokens:>10.1f} | {cabecalho_medio:>18.1f} | "
+              f"{contexto:>17.1f} | {1 - contexto / referencia:>7.0%}")
+
+
+if __name__ == "__main__":
+    executar(int(sys.argv[1]) if len(sys.argv) > 1 else 200)
@@ -0,0 +1,82 @@
+"""
+Benchmark da compressão das respostas HTTP.
+Mede o tamanho e a taxa de compressão (gzip e, se instalado, brotli) da
+resposta do /chat com o relatório de fraude: HTML e payload estruturado.
+
+Uso (a partir de backend/app):
+    python -m benchmarks.benchmark_compressao [suspeitas ...]
+"""
+
+import json
+import random
+import sys
+import time
+from modules.renderizacao_respostas import renderizar
+from modules.middleware_http import comprimir, brotli, CODIFICACAO_BROTLI, CODIFICACAO_GZIP
+
+
+TIPOS_FRAUDE = [
+    "Devolução acima do valor da compra", "Devoluções repetidas do mesmo cliente",
+    "Devolução sem compra correspondente", "Concentração de devoluções na loja"
+]
+
+
+def payload_fraude(quantidade: int) -> dict:
+    """HTML do relatório e corpo JSON do /chat para a quantidade de suspeitas indicada."""
+    aleatorio = random.Random(42)
+    suspeitas = []
+    for i in range(quantidade):
+        nivel = aleatorio.choice(["ALTO", "MÉDIO", "BAIXO"])
+        suspeitas.append({
+            'tipo': aleatorio.choice(TIPOS_FRAUDE),
+            'nivel_risco': nivel,
+            'classe_risco': "risk-high" if nivel == "ALTO" else "risk-medium" if nivel == "MÉDIO" else "",
+            'detalhes': f"SKU: {aleatorio.randint(100000, 999999)} | Loja: {aleatorio.randint(1, 300)} | Cliente: {aleatorio.randint(1, 50000)}"
+        })
+    por_tipo = {}
+    for suspeita in suspeitas:
+        por_tipo[suspeita['tipo']] = por_tipo.get(suspeita['tipo'], 0) + 1
+
+    html = renderizar(
+        'relatorio_fraude.html',
+        timestamp="01/01/2025 10:00:00",
+        tempo_segundos=3.2,
+        cartoes=[{'valor': quantidade, 'rotulo': 'Total de Suspeitas', 'cor': 'perigo'}],
+        suspeitas_por_tipo=por_tipo,
+        suspeitas=suspeitas[:20],
+        restantes=max(quantidade - 20, 0)
+    )
+    estruturada = {
+        "tipo": "tabela",
+        "titulo": " Detalhes das Suspeitas",
+        "colunas": ['Tipo de Fraude', 'Nível de Risco', 'Detalhes'],
+        "linhas": [[s['tipo'], s['nivel_risco'], s['detalhes']] for s in suspeitas],
+        "resumo": f"Total de Suspeitas: {quantidade}",
+        "links": [{"rotulo": "Baixar Relatório Excel", "url": "/download-excel-fraude"}],
+        "secoes": [{"titulo": " Tipos de Fraude Detectados", "colunas": ['Tipo de Fraude', 'Suspeitas'],
+                    "linhas": [list(item) for item in por_tipo.items()]}]
+    }
+    return {
+        "html": html.encode("utf-8"),
+        "json": json.dumps({"response": html, "structured": estruturada}).encode("utf-8")
+    }
+
+
+def executar(quantidades=(100, 1000, 10000)):
+    codificacoes = [CODIFICACAO_GZIP] + ([CODIFICACAO_BROTLI] if brotli is not None else [])
+    print(f"{'suspeitas':>9} | {'corpo':>5} | {'original (KB)':>13} | " + " | ".join(
+        f"{c + ' (KB)':>10} | {'taxa':>6} | {'ms':>6}" for c in codificacoes
+    ))
+    for quantidade in quantidades:
+        for corpo, dados in payload_fraude(quantidade).items():
+            colunas = []
+            for codificacao in codificacoes:
+                inicio = time.perf_counter()
+                comprimido = comprimir(dados, codificacao)
+                tempo = time.perf_counter() - inicio
+                colunas.append(f"{len(comprimido) / 1024:>10.1f} | {len(dados) / len(comprimido):>5.1f}x | {tempo * 1000:>6.1f}")
+            print(f"{quantidade:>9} | {corpo:>5} | {len(dados) / 1024:>13.1f} | " + " | ".join(colunas))
+
+
+if __name__ == "__main__":
+    executar([int(arg) for arg in sys.argv[1:]] or (100, 1000, 10000))
@@ -0,0 +1,84 @@
+"""
+Benchmark do tempo de importação da aplicação (partida a frio).
+Importa o módulo em um processo novo com `python -X importtime`, soma o
+tempo de cada import e lista os mais caros. Falha (código de saída 1) se o
+total passar do limite ou se algum módulo pesado (LangChain, FAISS, pandas,
+openpyxl) for carregado na importação.
+
+O aquecimento do agente é desativado no processo medido, para que apenas a
+importação seja contada.
+
+Uso (a partir de backend/app):
+    python -m benchmarks.benchmark_importacao [--modulo main] [--limite-ms 1500] [--top 15]
+"""
+
+import argparse
+import os
+import re
+import subprocess
+import sys
+
+
+RAIZ_PROJETO = os.path.normpath(os.path.join(os.path.dirname(__file__), '..', '..', '..'))
+DIRETORIO_BACKEND = os.path.join(RAIZ_PROJETO, 'backend', 'app')
+
+# Só devem ser carregados no primeiro uso (agente, importação de CSV e Excel)
+MODULOS_PESADOS = [
+    "langchain", "langchain_core", "langchain_openai", "langchain_community", "langchain_text_splitters",
+    "openai", "tiktoken", "faiss", "numpy", "pandas", "openpyxl"
+]
+
+LINHA_IMPORTTIME = re.compile(r"^import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)")
+
+
+def perfil_importacao(modulo: str):
+    """
+    Importa o módulo em um processo novo e lê o relatório do -X importtime.
+
+    Returns:
+        Lista de (módulo, próprio_us, acumulado_us, nível de aninhamento)
+    """
+    ambiente = dict(os.environ)
+    ambiente["AQUECIMENTO_AUTOMATICO"] = "false"
+    ambiente["PYTHONPATH"] = os.pathsep.join(filter(None, [DIRETORIO_BACKEND, ambiente.get("PYTHONPATH")]))
+    processo = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {modulo}"],
+        cwd=RAIZ_PROJETO, env=ambiente, capture_output=True, text=True
+    )
+    if processo.returncode != 0:
+        print(processo.stderr[-2000:])
+        raise RuntimeError(f"Falha ao importar '{modulo}'")
+
+    imports = []
+    for linha in processo.stderr.splitlines():
+        encontrado = LINHA_IMPORTTIME.match(linha)
+        if encontrado:
+            proprio, acumulado, recuo, nome = encontrado.groups()
+            imports.append((nome, int(proprio), int(acumulado), (len(recuo) - 1) // 2))
+    return imports
+
+
+def executar(modulo: str = "main", limite_ms: float = 1500, top: int = 15) -> bool:
+    imports = perfil_importacao(modulo)
+    total_ms = sum(proprio for _, proprio, _, _ in imports) / 1000
+    carregados = {nome.split(".")[0] for nome, _, _, _ in imports}
+    pesados = [nome for nome in MODULOS_PESADOS if nome in carregados]
+
+    print(f"Importação de '{modulo}': {total_ms:.1f} ms em {len(imports)} módulos (limite {limite_ms:.0f} ms)")
+    print(f"\n{'acumulado (ms)':>14} | {'próprio (ms)':>12} | módulo")
+    for nome, proprio, acumulado, nivel in sorted(imports, key=lambda item: -item[2])[:top]:
+        print(f"{acumulado / 1000:>14.1f} | {proprio / 1000:>12.1f} | {'  ' * nivel}{nome}")
+
+    print(f"\nMódulos pesados carregados: {', '.join(pesados) if pesados else 'nenhum'}")
+    aprovado = total_ms <= limite_ms and not pesados
+    print("OK" if aprovado else "ACIMA DO ESPERADO")
+    return aprovado
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Tempo de importação da aplicação")
+    parser.add_argument("--modulo", default="main", help="Módulo importado (padrão: main)")
+    parser.add_argument("--limite-ms", type=float, default=1500, help="Tempo máximo aceito")
+    parser.add_argument("--top", type=int, default=15, help="Quantidade de imports listados")
+    argumentos = parser.parse_args()
+    sys.exit(0 if executar(argumentos.modulo, argumentos.limite_ms, argumentos.top) else 1)
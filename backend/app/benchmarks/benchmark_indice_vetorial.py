@@ -0,0 +1,100 @@
+"""
+Benchmark dos tipos de índice vetorial (FAISS).
+Gera um corpus sintético (vetores normalizados agrupados em torno de
+centros, como os embeddings reais) e, para cada tipo de índice e compressão,
+mede o tempo de treino e inserção, o tamanho em memória, o recall@k em
+relação à busca exata e a latência de uma consulta por vez (como no agente).
+Também mostra a escolha automática para cada tamanho de corpus.
+
+Uso (a partir de backend/app):
+    python -m benchmarks.benchmark_indice_vetorial [--vetores 20000 100000] [--dimensao 256]
+        [--consultas 200] [--k 10]
+"""
+
+import argparse
+import time
+import numpy as np
+import faiss
+from modules.indice_vetorial import (
+    construir_indice, resolver_configuracao, TIPO_AUTOMATICO,
+    TIPO_FLAT, TIPO_IVF, TIPO_HNSW, COMPRESSAO_NENHUMA, COMPRESSAO_PQ, COMPRESSAO_FP16
+)
+
+
+CONFIGURACOES = [
+    (TIPO_FLAT, COMPRESSAO_NENHUMA),
+    (TIPO_FLAT, COMPRESSAO_FP16),
+    (TIPO_IVF, COMPRESSAO_NENHUMA),
+    (TIPO_IVF, COMPRESSAO_FP16),
+    (TIPO_IVF, COMPRESSAO_PQ),
+    (TIPO_HNSW, COMPRESSAO_NENHUMA),
+    (TIPO_HNSW, COMPRESSAO_FP16),
+    (TIPO_HNSW, COMPRESSAO_PQ),
+]
+
+
+def corpus_sintetico(quantidade: int, dimensao: int, consultas: int, semente: int = 42):
+    """
+    Vetores normalizados em torno de centros aleatórios.
+
+    Returns:
+        (vetores do corpus, vetores das consultas)
+    """
+    aleatorio = np.random.default_rng(semente)
+    centros = aleatorio.standard_normal((max(quantidade // 100, 10), dimensao)).astype("float32")
+
+    def amostrar(total):
+        vetores = centros[aleatorio.integers(0, len(centros), total)]
+        vetores = vetores + 0.5 * aleatorio.standard_normal((total, dimensao)).astype("float32")
+        return vetores / np.linalg.norm(vetores, axis=1, keepdims=True)
+
+    return amostrar(quantidade).astype("float32"), amostrar(consultas).astype("float32")
+
+
+def medir(indice, consultas, vizinhos_exatos, k: int):
+    """Recall@k médio e latência (média e p95, em ms) de uma consulta por vez."""
+    tempos = []
+    acertos = 0
+    for posicao, consulta in enumerate(consultas):
+        inicio = time.perf_counter()
+        _, encontrados = indice.search(consulta.reshape(1, -1), k)
+        tempos.append((time.perf_counter() - inicio) * 1000)
+        acertos += len(set(encontrados[0]) & set(vizinhos_exatos[posicao]))
+    return acertos / (len(consultas) * k), float(np.mean(tempos)), float(np.percentile(tempos, 95))
+
+
+def executar(quantidades, dimensao: int, total_consultas: int, k: int):
+    for quantidade in quantidades:
+        vetores, consultas = corpus_sintetico(quantidade, dimensao, total_consultas)
+        exato = faiss.IndexFlatL2(dimensao)
+        exato.add(vetores)
+        _, vizinhos_exatos = exato.search(consultas, k)
+
+        automatico = resolver_configuracao(quantidade, TIPO_AUTOMATICO, TIPO_AUTOMATICO)
+        print(f"\n{quantidade} vetores, dimensão {dimensao}, {total_consultas} consultas, k={k} "
+              f"(escolha automática: {automatico[0]} + {automatico[1]})")
+        print(f"{'fábrica':>18} | {'treino (s)':>10} | {'inserção (s)':>12} | {'MB':>7} | "
+              f"{'recall@' + str(k):>9} | {'média ms':>8} | {'p95 ms':>7}")
+
+        vistas = set()
+        for tipo, compressao in CONFIGURACOES:
+            indice, info = construir_indice(vetores, tipo, compressao)
+            # Combinações ajustadas para o tamanho do corpus podem se repetir
+            if info["fabrica"] in vistas:
+                continue
+            vistas.add(info["fabrica"])
+            recall, media, p95 = medir(indice, consultas, vizinhos_exatos, k)
+            marca = " *" if (info["tipo"], info["compressao"]) == automatico else ""
+            print(f"{info['fabrica'] + marca:>18} | {info['tempo_treino_segundos']:>10.2f} | "
+                  f"{info['tempo_adicao_segundos']:>12.2f} | {info['bytes'] / 1024 / 1024:>7.1f} | "
+                  f"{recall:>9.3f} | {media:>8.3f} | {p95:>7.3f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Recall e latência dos tipos de índice vetorial")
+    parser.add_argument("--vetores", type=int, nargs="+", default=[20000, 100000])
+    parser.add_argument("--dimensao", type=int, default=256)
+    parser.add_argument("--consultas", type=int, default=200)
+    parser.add_argument("--k", type=int, default=10)
+    argumentos = parser.parse_args()
+    executar(argumentos.vetores, argumentos.dimensao, argumentos.consultas, argumentos.k)
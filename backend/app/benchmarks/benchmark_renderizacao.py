@@ -0,0 +1,81 @@
+"""
+Benchmark da renderização de tabelas das respostas.
+Compara a montagem antiga (html += f"..." em laço, estilos inline por célula)
+com o template Jinja compilado, em tempo e tamanho da resposta.
+
+Uso (a partir de backend/app):
+    python -m benchmarks.benchmark_renderizacao [linhas ...]
+"""
+
+import sys
+import time
+from modules.renderizacao_respostas import renderizar_tabela
+
+
+def tabela_concatenada(dados: list, colunas: list, titulo: str, formata_dados) -> str:
+    """Montagem anterior ao uso de templates, mantida apenas para comparação."""
+    html = f"""
+        <div style="margin: 20px 0; font-family: Arial, sans-serif;">
+            <h3 style="color: #333; margin-bottom: 15px; text-align: center;">{titulo}</h3>
+            <div style="overflow-x: auto;">
+                <table style="width: 100%; border-collapse: collapse; background-color: white; box-shadow: 0 2px 4px rgba(0,0,0,0.1); border-radius: 8px; overflow: hidden;">
+                    <thead>
+                        <tr style="background-color: #f8f9fa;">
+        """
+    for coluna in colunas:
+        html += f'<th style="padding: 12px 15px; text-align: left; font-weight: bold; color: #495057; border-bottom: 2px solid #dee2e6;">{coluna}</th>'
+    html += """
+                        </tr>
+                    </thead>
+                    <tbody>
+        """
+    for i, item in enumerate(dados):
+        cor_linha = "#f8f9fa" if i % 2 == 0 else "white"
+        html += f'<tr style="background-color: {cor_linha};">'
+        for dado in formata_dados(i, item):
+            dado_escaped = str(dado).replace('&', '&amp;').replace('<', '&lt;').replace('>', '&gt;')
+            html += f'<td style="padding: 10px 15px; border-bottom: 1px solid #dee2e6; color: #495057;">{dado_escaped}</td>'
+        html += '</tr>'
+    html += """
+                    </tbody>
+                </table>
+            </div>
+        </div>
+        """
+    return html
+
+
+def medir(funcao, repeticoes: int = 5) -> float:
+    """Melhor tempo (segundos) entre as repetições."""
+    melhor = float("inf")
+    for _ in range(repeticoes):
+        inicio = time.perf_counter()
+        funcao()
+        melhor = min(melhor, time.perf_counter() - inicio)
+    return melhor
+
+
+def executar(quantidades=(100, 1000, 10000)):
+    colunas = ['Posição', 'SKU', 'Quantidade de Registros']
+    formata_dados = lambda i, item: [i + 1, item['_id'], f"{item['count']:,}"]
+
+    print(f"{'linhas':>8} | {'concat (ms)':>12} | {'template (ms)':>13} | {'concat (KB)':>11} | {'template (KB)':>13}")
+    for quantidade in quantidades:
+        dados = [{'_id': f"SKU-{i:06d}", 'count': quantidade - i} for i in range(quantidade)]
+        titulo = f"Top {quantidade} SKUs"
+
+        antigo = tabela_concatenada(dados, colunas, titulo, formata_dados)
+        novo = renderizar_tabela(titulo, colunas, (formata_dados(i, item) for i, item in enumerate(dados)))
+
+        tempo_antigo = medir(lambda: tabela_concatenada(dados, colunas, titulo, formata_dados))
+        tempo_novo = medir(lambda: renderizar_tabela(
+            titulo, colunas, (formata_dados(i, item) for i, item in enumerate(dados))
+        ))
+        print(
+            f"{quantidade:>8} | {tempo_antigo * 1000:>12.1f} | {tempo_novo * 1000:>13.1f} | "
+            f"{len(antigo.encode('utf-8')) / 1024:>11.1f} | {len(novo.encode('utf-8')) / 1024:>13.1f}"
+        )
+
+
+if __name__ == "__main__":
+    executar([int(arg) for arg in sys.argv[1:]] or (100, 1000, 10000))
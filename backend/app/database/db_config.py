@@ -12,6 +12,123 @@ DB_NAME = os.getenv("DB_NAME", "db_analytics")
 # Configurações da OpenAI
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY", "")
 
+# Configurações do cache de consultas
+CACHE_CONSULTAS_MAX_ITENS = int(os.getenv("CACHE_CONSULTAS_MAX_ITENS", "256"))
+CACHE_CONSULTAS_TTL_SEGUNDOS = int(os.getenv("CACHE_CONSULTAS_TTL_SEGUNDOS", "600"))
+# Backend compartilhado entre workers: "mongo" ou "memoria" (apenas local)
+CACHE_CONSULTAS_BACKEND = os.getenv("CACHE_CONSULTAS_BACKEND", "mongo")
+# Tempo de vida no cache local quando há backend compartilhado
+CACHE_CONSULTAS_L1_TTL_SEGUNDOS = int(os.getenv("CACHE_CONSULTAS_L1_TTL_SEGUNDOS", "30"))
+COLECAO_CACHE_CONSULTAS = "_cache_consultas"
+
+# Rankings materializados (contagens por coleção e dimensão)
+COLECAO_RANKINGS = "_rankings"
+COLECAO_RANKINGS_META = "_rankings_meta"
+# Importações em andamento, aguardadas pela reconstrução de um ranking
+COLECAO_RANKINGS_IMPORTACOES = "_rankings_importacoes"
+# Prazo do lock de reconstrução de uma dimensão (renovado durante a agregação); vencido, outro worker assume
+RANKING_RECONSTRUCAO_PRAZO_SEGUNDOS = int(os.getenv("RANKING_RECONSTRUCAO_PRAZO_SEGUNDOS", "300"))
+
+# Ranking aproximado (Space-Saving) para coleções muito grandes
+COLECAO_SKETCHES = "_sketches"
+CAPACIDADE_SKETCH = int(os.getenv("CAPACIDADE_SKETCH", "1000"))
+# Tempo máximo de espera pelo ranking exato antes de responder com o aproximado
+ORCAMENTO_RANKING_MS = int(os.getenv("ORCAMENTO_RANKING_MS", "2000"))
+
+# Sessões de conversa do agente (memória própria por sessão, despejo LRU)
+MAX_SESSOES_AGENTE = int(os.getenv("MAX_SESSOES_AGENTE", "100"))
+# Turnos mantidos literalmente; os anteriores viram um resumo
+MAX_TURNOS_MEMORIA = int(os.getenv("MAX_TURNOS_MEMORIA", "4"))
+# Limite rígido de tokens do histórico enviado em cada pergunta
+ORCAMENTO_TOKENS_MEMORIA = int(os.getenv("ORCAMENTO_TOKENS_MEMORIA", "1500"))
+# Turnos acumulados fora da janela antes de cada resumo (gerado em segundo plano)
+RESUMO_LOTE_TURNOS = int(os.getenv("RESUMO_LOTE_TURNOS", "2"))
+
+# Cache persistente das respostas do LLM
+CACHE_LLM_ATIVO = os.getenv("CACHE_LLM_ATIVO", "true").lower() == "true"
+CACHE_LLM_TTL_SEGUNDOS = int(os.getenv("CACHE_LLM_TTL_SEGUNDOS", "86400"))
+CACHE_LLM_MAX_ITENS = int(os.getenv("CACHE_LLM_MAX_ITENS", "5000"))
+COLECAO_CACHE_LLM = "_cache_llm"
+
+# Catálogo de coleções (nomes, contagens estimadas e esquema)
+CATALOGO_TTL_SEGUNDOS = int(os.getenv("CATALOGO_TTL_SEGUNDOS", "30"))
+
+# Consultas em várias coleções (threads paralelas sobre um único MongoClient)
+MAX_WORKERS_CONSULTAS = int(os.getenv("MAX_WORKERS_CONSULTAS", "4"))
+# Conexões do pool do MongoClient compartilhado pelo planejador
+MONGO_MAX_POOL_SIZE = int(os.getenv("MONGO_MAX_POOL_SIZE", "50"))
+
+# Compressão das respostas HTTP (brotli quando instalado, senão gzip)
+COMPRESSAO_ATIVA = os.getenv("COMPRESSAO_ATIVA", "true").lower() == "true"
+# Respostas menores que isso não compensam o custo da compressão
+COMPRESSAO_MIN_BYTES = int(os.getenv("COMPRESSAO_MIN_BYTES", "1024"))
+COMPRESSAO_NIVEL_GZIP = int(os.getenv("COMPRESSAO_NIVEL_GZIP", "6"))
+COMPRESSAO_NIVEL_BROTLI = int(os.getenv("COMPRESSAO_NIVEL_BROTLI", "5"))
+# Tempo de cache no navegador dos arquivos estáticos (CSS/JS)
+CACHE_ESTATICOS_SEGUNDOS = int(os.getenv("CACHE_ESTATICOS_SEGUNDOS", "86400"))
+
+# Aquecimento do agente em segundo plano
+# Desativado, o agente é inicializado na primeira requisição que precisar dele
+AQUECIMENTO_AUTOMATICO = os.getenv("AQUECIMENTO_AUTOMATICO", "true").lower() == "true"
+# Espera máxima de uma requisição pela conexão do agente ao MongoDB
+AQUECIMENTO_ESPERA_SEGUNDOS = int(os.getenv("AQUECIMENTO_ESPERA_SEGUNDOS", "15"))
+# Intervalo mínimo entre novas tentativas após uma falha
+AQUECIMENTO_RETENTATIVA_SEGUNDOS = int(os.getenv("AQUECIMENTO_RETENTATIVA_SEGUNDOS", "30"))
+
+# Corpus do índice vetorial (amostra estratificada por coleção)
+CORPUS_AMOSTRA_POR_COLECAO = int(os.getenv("CORPUS_AMOSTRA_POR_COLECAO", "500"))
+# Documentos sorteados = amostra x fator, antes de escolher por estrato (LOJA ou mês)
+CORPUS_FATOR_SORTEIO = int(os.getenv("CORPUS_FATOR_SORTEIO", "4"))
+CORPUS_MAX_WORKERS = int(os.getenv("CORPUS_MAX_WORKERS", "4"))
+CORPUS_MAX_CAMPOS = int(os.getenv("CORPUS_MAX_CAMPOS", "30"))
+
+# Texto dos documentos no embedding e no prompt: "compacto" (chaves abreviadas, uma linha) ou "detalhado"
+DOCUMENTO_CODIFICACAO = os.getenv("DOCUMENTO_CODIFICACAO", "compacto")
+
+# Índice vetorial FAISS: tipo (flat, ivf, hnsw ou auto) e compressão (nenhuma, pq, fp16 ou auto)
+VETOR_TIPO_INDICE = os.getenv("VETOR_TIPO_INDICE", "auto")
+VETOR_COMPRESSAO = os.getenv("VETOR_COMPRESSAO", "auto")
+# Escolha automática: flat abaixo do primeiro limite, hnsw+fp16 abaixo do segundo, ivf+pq acima
+VETOR_LIMITE_FLAT = int(os.getenv("VETOR_LIMITE_FLAT", "20000"))
+VETOR_LIMITE_HNSW = int(os.getenv("VETOR_LIMITE_HNSW", "1000000"))
+# Vetores usados no treino (IVF e PQ)
+VETOR_MAX_TREINO = int(os.getenv("VETOR_MAX_TREINO", "100000"))
+VETOR_IVF_NPROBE = int(os.getenv("VETOR_IVF_NPROBE", "16"))
+VETOR_HNSW_M = int(os.getenv("VETOR_HNSW_M", "32"))
+VETOR_HNSW_EF_CONSTRUCTION = int(os.getenv("VETOR_HNSW_EF_CONSTRUCTION", "80"))
+VETOR_HNSW_EF_SEARCH = int(os.getenv("VETOR_HNSW_EF_SEARCH", "64"))
+
+# Relatórios de inconsistências mantidos em memória (LRU) e seu tempo de vida
+INCONSISTENCIAS_MAX_RESULTADOS = int(os.getenv("INCONSISTENCIAS_MAX_RESULTADOS", "8"))
+INCONSISTENCIAS_TTL_SEGUNDOS = int(os.getenv("INCONSISTENCIAS_TTL_SEGUNDOS", "300"))
+
+# Busca de identificadores (SKU, usuário, loja, devolução): registros exibidos por coleção
+BUSCA_IDENTIFICADOR_LIMITE = int(os.getenv("BUSCA_IDENTIFICADOR_LIMITE", "50"))
+
+# Rastreamento por estágios: imprime cada rastro (pergunta, importação, fraude) como uma linha JSON
+RASTREAMENTO_LOG = os.getenv("RASTREAMENTO_LOG", "true").lower() == "true"
+# Limites (segundos) dos histogramas de latência exportados em /metrics
+RASTREAMENTO_BUCKETS = [
+    float(limite) for limite in
+    os.getenv("RASTREAMENTO_BUCKETS", "0.005,0.01,0.025,0.05,0.1,0.25,0.5,1,2.5,5,10,30,60").split(",")
+]
+
+# Perfilamento sob demanda (/chat, /colecao/<nome>, /download-excel-fraude); vazio desativa
+PERFIL_TOKEN = os.getenv("PERFIL_TOKEN", "")
+PERFIL_INTERVALO_AMOSTRAGEM_MS = float(os.getenv("PERFIL_INTERVALO_AMOSTRAGEM_MS", "5"))
+# Funções listadas no resumo em texto do cProfile
+PERFIL_LINHAS_TEXTO = int(os.getenv("PERFIL_LINHAS_TEXTO", "60"))
+
+# Coleções internas da aplicação (prefixo "_" e coleções de sistema)
+PREFIXO_COLECAO_INTERNA = "_"
+COLECOES_SISTEMA = ["historico_conversas", "system.indexes"]
+
+
+def colecao_interna(nome: str) -> bool:
+    """Indica se a coleção é de uso interno e não deve ser exibida ou analisada."""
+    return nome.startswith(PREFIXO_COLECAO_INTERNA) or nome.startswith("system.") or nome in COLECOES_SISTEMA
+
+
 print(f"MongoDB URI: {MONGO_URI}")
 print(f"Database: {DB_NAME}")
 print(f"OpenAI Key: {'Configurada' if OPENAI_API_KEY else 'Nao configurada'}")
@@ -0,0 +1,209 @@
+"""
+Análise de inconsistências entre coleções por operações de conjunto.
+Cada coleção tem os valores distintos do campo (ex.: SKU) lidos uma única vez
+por um $group em streaming; as diferenças entre cada par de coleções são
+calculadas em memória e ficam disponíveis em um relatório paginado.
+
+Os resultados ficam em um LRU com TTL: as importações deste processo os
+invalidam na hora, as de outros workers apenas ao fim do TTL.
+"""
+
+import threading
+import time
+from collections import OrderedDict
+from itertools import permutations
+from typing import Any, Dict, List, Set, Tuple
+from pymongo import MongoClient
+from database import db_config
+from modules.catalogo_colecoes import obter_catalogo
+from modules.eventos_colecoes import registrar_ouvinte, PRIORIDADE_CACHES
+
+
+# Coleções comparadas por padrão (quando existirem)
+COLECOES_PADRAO = ['DEVOLUCAO', 'CANCELAMENTO', 'AJUSTES ESTOQUE']
+
+# Campos que podem ser comparados (o campo vem da query string de /inconsistencias)
+CAMPOS_COMPARAVEIS = ['SKU', 'IDUSUARIO', 'LOJA']
+
+
+class ResultadoInconsistencias:
+    """Diferenças de um campo entre pares de coleções."""
+
+    def __init__(self, campo: str, colecoes: List[str], totais: Dict[str, int],
+                 diferencas: Dict[Tuple[str, str], List[str]], tempo_segundos: float):
+        self.campo = campo
+        self.colecoes = colecoes
+        # Quantidade de valores distintos por coleção
+        self.totais = totais
+        # (origem, destino) -> valores presentes na origem e ausentes no destino (ordenados)
+        self.diferencas = diferencas
+        self.tempo_segundos = tempo_segundos
+
+    @property
+    def total_inconsistencias(self) -> int:
+        return sum(len(valores) for valores in self.diferencas.values())
+
+    def resumo_pares(self) -> List[Dict[str, Any]]:
+        """Contagem de inconsistências por par de coleções."""
+        return [
+            {"origem": origem, "destino": destino, "total": len(valores)}
+            for (origem, destino), valores in self.diferencas.items()
+        ]
+
+    def pagina(self, pagina: int = 1, por_pagina: int = 100, origem: str = None, destino: str = None) -> Dict[str, Any]:
+        """
+        Retorna uma página do relatório completo.
+
+        Args:
+            pagina: Página (a partir de 1)
+            por_pagina: Itens por página
+            origem: Filtra pela coleção onde o valor existe
+            destino: Filtra pela coleção onde o valor falta
+
+        Returns:
+            Dicionário com os itens da página e os totais
+        """
+        pares = [
+            par for par in self.diferencas
+            if (origem is None or par[0] == origem) and (destino is None or par[1] == destino)
+        ]
+        total = sum(len(self.diferencas[par]) for par in pares)
+        inicio = max(pagina - 1, 0) * por_pagina
+        fim = inicio + por_pagina
+
+        # Percorre os pares acumulando deslocamentos, sem materializar a lista completa
+        itens = []
+        deslocamento = 0
+        for par in pares:
+            valores = self.diferencas[par]
+            if deslocamento + len(valores) > inicio and deslocamento < fim:
+                for valor in valores[max(inicio - deslocamento, 0):fim - deslocamento]:
+                    itens.append({"origem": par[0], "destino": par[1], self.campo.lower(): valor})
+            deslocamento += len(valores)
+            if deslocamento >= fim:
+                break
+
+        return {
+            "campo": self.campo,
+            "pagina": pagina,
+            "por_pagina": por_pagina,
+            "total": total,
+            "total_paginas": (total + por_pagina - 1) // por_pagina,
+            "itens": itens
+        }
+
+
+class AnalisadorInconsistencias:
+    """Calcula (e mantém em cache) as diferenças entre coleções."""
+
+    def __init__(self, db=None, max_resultados: int = None, ttl_segundos: int = None):
+        """
+        Args:
+            db: Banco MongoDB (conecta sob demanda se None)
+            max_resultados: Resultados mantidos em memória (padrão da configuração)
+            ttl_segundos: Tempo de vida de cada resultado (padrão da configuração)
+        """
+        self.db = db
+        self.catalogo = obter_catalogo()
+        self.max_resultados = max_resultados or db_config.INCONSISTENCIAS_MAX_RESULTADOS
+        self.ttl_segundos = ttl_segundos or db_config.INCONSISTENCIAS_TTL_SEGUNDOS
+        self._lock = threading.Lock()
+        # (campo, coleções) -> (resultado, expira_em), do usado há mais tempo ao mais recente
+        self._resultados = OrderedDict()
+
+    def _obter_db(self):
+        if self.db is None:
+            self.db = MongoClient(db_config.MONGO_URI)[db_config.DB_NAME]
+        return self.db
+
+    def colecoes_comparaveis(self, campo: str) -> List[str]:
+        """Coleções padrão existentes ou, na falta delas, todas as que possuem o campo."""
+        existentes = [colecao for colecao in COLECOES_PADRAO if self.catalogo.existe(colecao)]
+        if len(existentes) >= 2:
+            return existentes
+        return [colecao for colecao in self.catalogo.nomes() if campo in self.catalogo.esquema(colecao)]
+
+    def carregar_valores(self, colecao: str, campo: str) -> Set[str]:
+        """
+        Lê os valores distintos do campo em streaming ($group no servidor,
+        sem o limite de 16 MB do distinct).
+        """
+        cursor = self._obter_db()[colecao].aggregate([
+            {"$match": {campo: {"$exists": True, "$nin": [None, ""]}}},
+            {"$group": {"_id": f"${campo}"}}
+        ], allowDiskUse=True, batchSize=10000)
+        # Normaliza para texto: o mesmo SKU pode ter sido importado como número ou texto
+        return {str(doc["_id"]).strip() for doc in cursor}
+
+    def analisar(self, campo: str = "SKU", colecoes: List[str] = None) -> ResultadoInconsistencias:
+        """
+        Compara os valores do campo entre todos os pares de coleções.
+
+        Args:
+            campo: Campo comparado
+            colecoes: Coleções comparadas (padrão: colecoes_comparaveis)
+
+        Returns:
+            Resultado com as diferenças de cada par (reaproveitado até a próxima
+            alteração ou o fim do TTL)
+
+        Raises:
+            ValueError: Se o campo não estiver em CAMPOS_COMPARAVEIS
+        """
+        campo = campo.upper()
+        if campo not in CAMPOS_COMPARAVEIS:
+            raise ValueError(f"Campo '{campo}' não pode ser comparado (use {', '.join(CAMPOS_COMPARAVEIS)})")
+        colecoes = sorted(colecoes or self.colecoes_comparaveis(campo))
+        chave = (campo, tuple(colecoes))
+        with self._lock:
+            item = self._resultados.get(chave)
+            if item is not None:
+                if item[1] > time.monotonic():
+                    self._resultados.move_to_end(chave)
+                    return item[0]
+                del self._resultados[chave]
+
+        inicio = time.perf_counter()
+        conjuntos = {colecao: self.carregar_valores(colecao, campo) for colecao in colecoes}
+        diferencas = {
+            (origem, destino): sorted(conjuntos[origem] - conjuntos[destino])
+            for origem, destino in permutations(colecoes, 2)
+        }
+        resultado = ResultadoInconsistencias(
+            campo, colecoes,
+            {colecao: len(valores) for colecao, valores in conjuntos.items()},
+            diferencas,
+            round(time.perf_counter() - inicio, 2)
+        )
+        print(f" Inconsistências de {campo} em {colecoes}: {resultado.total_inconsistencias} em {resultado.tempo_segundos}s")
+
+        with self._lock:
+            self._resultados[chave] = (resultado, time.monotonic() + self.ttl_segundos)
+            self._resultados.move_to_end(chave)
+            # Cada resultado guarda as listas de diferenças: manter poucos (LRU)
+            while len(self._resultados) > self.max_resultados:
+                self._resultados.popitem(last=False)
+        return resultado
+
+    def invalidar_colecao(self, colecao: str):
+        """Descarta os resultados que envolvem a coleção."""
+        with self._lock:
+            for chave in [chave for chave in self._resultados if colecao in chave[1]]:
+                del self._resultados[chave]
+
+
+# Instância global do analisador
+analisador_inconsistencias = AnalisadorInconsistencias()
+
+
+def _ao_alterar_colecao(colecao: str, evento: str, registros=None):
+    """Descarta as análises que envolvem a coleção alterada."""
+    analisador_inconsistencias.invalidar_colecao(colecao)
+
+
+registrar_ouvinte(_ao_alterar_colecao, PRIORIDADE_CACHES)
+
+
+def obter_analisador_inconsistencias() -> AnalisadorInconsistencias:
+    """Retorna a instância global do analisador de inconsistências."""
+    return analisador_inconsistencias
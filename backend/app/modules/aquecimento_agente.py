@@ -0,0 +1,208 @@
+"""
+Aquecimento do agente em segundo plano, por estágios.
+
+A inicialização completa do agente (conexão, amostragem das coleções e
+embeddings do índice vetorial) é lenta. Em vez de bloquear a subida da
+aplicação ou a primeira requisição de cada worker, ela roda em uma thread
+dedicada e cada estágio fica disponível assim que termina:
+
+- "mongodb": conexão e detector de fraude; as consultas diretas (intenções
+  resolvidas no MongoDB) já podem ser respondidas;
+- "modelos": LLM, embeddings e prompt;
+- "indice_vetorial": amostras das coleções no FAISS e sessões de conversa;
+  a partir daqui o fallback para o LLM fica disponível.
+"""
+
+import threading
+import time
+from typing import Any, Callable, Dict, Optional
+from database import db_config
+
+
+ESTAGIO_MONGODB = "mongodb"
+ESTAGIO_MODELOS = "modelos"
+ESTAGIO_INDICE_VETORIAL = "indice_vetorial"
+
+ESTADO_PENDENTE = "pendente"
+ESTADO_EXECUTANDO = "executando"
+ESTADO_PRONTO = "pronto"
+ESTADO_ERRO = "erro"
+
+
+class _Estagio:
+    """Situação de um estágio do aquecimento."""
+
+    def __init__(self, nome: str):
+        self.nome = nome
+        self.estado = ESTADO_PENDENTE
+        self.duracao_segundos = None
+        self.erro = None
+        self.concluido = threading.Event()
+
+    def para_dict(self) -> Dict[str, Any]:
+        return {
+            "estado": self.estado,
+            "duracao_segundos": self.duracao_segundos,
+            "erro": self.erro
+        }
+
+
+class AquecimentoAgente:
+    """Inicializa o agente em uma thread, estágio por estágio."""
+
+    def __init__(self, fabrica: Callable[[], Any], intervalo_retentativa: int = None):
+        """
+        Args:
+            fabrica: Cria o agente (ex.: MongoDBAgent(...))
+            intervalo_retentativa: Segundos mínimos entre tentativas após uma falha
+        """
+        self.fabrica = fabrica
+        self.intervalo_retentativa = (
+            intervalo_retentativa if intervalo_retentativa is not None
+            else db_config.AQUECIMENTO_RETENTATIVA_SEGUNDOS
+        )
+        self._agente = None
+        self._thread = None
+        self._lock = threading.Lock()
+        self._tentativa_em = 0.0
+        self.tentativas = 0
+        self._estagios = {
+            nome: _Estagio(nome)
+            for nome in (ESTAGIO_MONGODB, ESTAGIO_MODELOS, ESTAGIO_INDICE_VETORIAL)
+        }
+
+    def iniciar(self) -> bool:
+        """
+        Inicia o aquecimento em segundo plano (não bloqueia).
+        Depois de uma falha, uma nova chamada refaz os estágios que não
+        ficaram prontos, respeitando o intervalo de retentativa.
+
+        Returns:
+            True se uma nova execução foi iniciada
+        """
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return False
+            pendentes = [e for e in self._estagios.values() if e.estado != ESTADO_PRONTO]
+            if not pendentes:
+                return False
+            if self.tentativas and time.monotonic() - self._tentativa_em < self.intervalo_retentativa:
+                return False
+            for estagio in pendentes:
+                estagio.estado = ESTADO_PENDENTE
+                estagio.erro = None
+                estagio.concluido.clear()
+            self._tentativa_em = time.monotonic()
+            self.tentativas += 1
+            if self._agente is not None:
+                self._agente.erro_preparacao = None
+            self._thread = threading.Thread(target=self._executar, name="aquecimento-agente", daemon=True)
+            self._thread.start()
+            return True
+
+    def _executar(self):
+        etapas = [
+            (ESTAGIO_MONGODB, self._conectar),
+            (ESTAGIO_MODELOS, lambda: self._agente.criar_modelos()),
+            (ESTAGIO_INDICE_VETORIAL, lambda: self._agente.criar_indice_vetorial()),
+        ]
+        falhou = None
+        for nome, funcao in etapas:
+            estagio = self._estagios[nome]
+            if estagio.estado == ESTADO_PRONTO:
+                continue
+            if falhou is not None:
+                # Estágios seguintes dependem do que falhou
+                estagio.estado = ESTADO_ERRO
+                estagio.erro = f"Estágio '{falhou}' não concluído"
+                estagio.concluido.set()
+                continue
+
+            estagio.estado = ESTADO_EXECUTANDO
+            inicio = time.perf_counter()
+            try:
+                funcao()
+                estagio.estado = ESTADO_PRONTO
+                print(f" Aquecimento: estágio '{nome}' pronto em {time.perf_counter() - inicio:.2f}s")
+            except Exception as e:
+                estagio.estado = ESTADO_ERRO
+                estagio.erro = str(e)
+                falhou = nome
+                print(f" Aquecimento: erro no estágio '{nome}': {e}")
+                if self._agente is not None:
+                    # O agente já atende consultas diretas: avisa que o fallback para o LLM falhou
+                    self._agente.erro_preparacao = str(e)
+            finally:
+                estagio.duracao_segundos = round(time.perf_counter() - inicio, 3)
+                estagio.concluido.set()
+
+    def _conectar(self):
+        agente = self._agente or self.fabrica()
+        # O construtor do agente já tenta conectar (e engole os erros)
+        if agente.db is None or agente.detector_fraude is None:
+            agente.conectar_mongodb()
+        if agente.client is None or agente.detector_fraude is None:
+            raise ConnectionError("Não foi possível conectar ao MongoDB")
+        # O MongoClient conecta sob demanda: sem o ping, um servidor fora do ar passaria como pronto
+        agente.client.admin.command("ping")
+        # Publicado já conectado: as consultas diretas podem ser atendidas
+        self._agente = agente
+
+    def pronto(self, estagio: str) -> bool:
+        """Indica se o estágio já foi concluído com sucesso."""
+        return self._estagios[estagio].estado == ESTADO_PRONTO
+
+    def com_erro(self) -> bool:
+        """Indica se algum estágio terminou com erro na última tentativa."""
+        return any(estagio.estado == ESTADO_ERRO for estagio in self._estagios.values())
+
+    def aguardar(self, estagio: str, timeout: Optional[float] = None) -> bool:
+        """
+        Aguarda a conclusão de um estágio.
+
+        Args:
+            estagio: Nome do estágio
+            timeout: Espera máxima em segundos (None espera indefinidamente)
+
+        Returns:
+            True se o estágio ficou pronto
+        """
+        self._estagios[estagio].concluido.wait(timeout)
+        return self.pronto(estagio)
+
+    def obter_agente(self, timeout: Optional[float] = None):
+        """
+        Retorna o agente assim que a conexão com o MongoDB estiver pronta.
+
+        Args:
+            timeout: Espera máxima pelo estágio "mongodb" (padrão da configuração)
+
+        Returns:
+            Agente conectado ou None se ainda não disponível/falhou
+        """
+        if self.com_erro() or not self.pronto(ESTAGIO_MONGODB):
+            # Respeita o intervalo de retentativa e refaz só os estágios que não ficaram prontos
+            # (inclusive modelos e índice vetorial, com o MongoDB já conectado)
+            self.iniciar()
+        if not self.pronto(ESTAGIO_MONGODB):
+            espera = timeout if timeout is not None else db_config.AQUECIMENTO_ESPERA_SEGUNDOS
+            if not self.aguardar(ESTAGIO_MONGODB, espera):
+                return None
+        return self._agente
+
+    @property
+    def agente(self):
+        """Agente publicado (None antes da conexão com o MongoDB)."""
+        return self._agente
+
+    def estado(self) -> Dict[str, Any]:
+        """Situação e duração de cada estágio."""
+        estagios = {nome: estagio.para_dict() for nome, estagio in self._estagios.items()}
+        return {
+            "pronto": all(e["estado"] == ESTADO_PRONTO for e in estagios.values()),
+            "consultas_diretas": self.pronto(ESTAGIO_MONGODB),
+            "llm": self.pronto(ESTAGIO_INDICE_VETORIAL),
+            "em_execucao": self._thread is not None and self._thread.is_alive(),
+            "tentativas": self.tentativas,
+            "estagios": estagios
+        }
@@ -0,0 +1,110 @@
+"""
+Armazenamento do cache de respostas do LLM (coleção MongoDB, invalidação e
+estatísticas). Fica fora de modules.cache_llm para que a aplicação registre
+a invalidação a cada importação ou exclusão, e leia as estatísticas, sem
+carregar o LangChain na partida.
+"""
+
+import threading
+from typing import Any, Dict, Optional
+from pymongo import MongoClient
+from database import db_config
+from modules.eventos_colecoes import registrar_ouvinte, PRIORIDADE_CACHES
+
+
+class ArmazenamentoCacheLLM:
+    """Coleção das respostas do LLM, com índice TTL, limite de tamanho e contadores de uso."""
+
+    def __init__(self, ttl_segundos: int = None, max_itens: int = None,
+                 mongo_uri: str = None, database_name: str = None):
+        """
+        Args:
+            ttl_segundos: Tempo de vida de cada resposta
+            max_itens: Quantidade máxima de respostas armazenadas
+        """
+        self.ttl_segundos = ttl_segundos or db_config.CACHE_LLM_TTL_SEGUNDOS
+        self.max_itens = max_itens or db_config.CACHE_LLM_MAX_ITENS
+        self.mongo_uri = mongo_uri or db_config.MONGO_URI
+        self.database_name = database_name or db_config.DB_NAME
+        self.colecao = None
+        self._lock = threading.Lock()
+        self._salvamentos = 0
+        self.acertos = 0
+        self.falhas = 0
+
+    def obter_colecao(self):
+        """Conecta ao MongoDB e cria os índices na primeira utilização."""
+        if self.colecao is None:
+            with self._lock:
+                if self.colecao is None:
+                    client = MongoClient(self.mongo_uri)
+                    colecao = client[self.database_name][db_config.COLECAO_CACHE_LLM]
+                    colecao.create_index("expira_em", expireAfterSeconds=0)
+                    colecao.create_index("colecoes")
+                    colecao.create_index("ultimo_acesso")
+                    self.colecao = colecao
+        return self.colecao
+
+    def contar(self, campo: str):
+        with self._lock:
+            setattr(self, campo, getattr(self, campo) + 1)
+
+    def registrar_salvamento(self):
+        """Conta um salvamento e aplica o limite de tamanho a cada 50."""
+        with self._lock:
+            self._salvamentos += 1
+            aplicar = self._salvamentos % 50 == 0
+        if aplicar:
+            self.aplicar_limite()
+
+    def aplicar_limite(self):
+        """Remove as respostas usadas há mais tempo acima de max_itens."""
+        colecao = self.obter_colecao()
+        excedente = colecao.estimated_document_count() - self.max_itens
+        if excedente <= 0:
+            return
+        antigas = [doc["_id"] for doc in colecao.find({}, {"_id": 1}).sort("ultimo_acesso", 1).limit(excedente)]
+        if antigas:
+            colecao.delete_many({"_id": {"$in": antigas}})
+            print(f"Cache do LLM: {len(antigas)} respostas antigas removidas")
+
+    def invalidar_colecao(self, colecao: str) -> int:
+        """Remove as respostas cujo contexto veio da coleção."""
+        resultado = self.obter_colecao().delete_many({"colecoes": colecao})
+        if resultado.deleted_count:
+            print(f"Cache do LLM invalidado para '{colecao}': {resultado.deleted_count} respostas removidas")
+        return resultado.deleted_count
+
+    def limpar(self):
+        """Remove todas as respostas."""
+        self.obter_colecao().delete_many({})
+
+    def estatisticas(self) -> Dict[str, Any]:
+        """Retorna estatísticas de uso do cache."""
+        with self._lock:
+            total = self.acertos + self.falhas
+            return {
+                "acertos": self.acertos,
+                "falhas": self.falhas,
+                "taxa_acerto": round(self.acertos / total, 4) if total else 0.0,
+                "ttl_segundos": self.ttl_segundos,
+                "max_itens": self.max_itens
+            }
+
+
+# Instância global do armazenamento (None quando o cache está desativado)
+armazenamento_cache_llm = ArmazenamentoCacheLLM() if db_config.CACHE_LLM_ATIVO else None
+
+
+def _ao_alterar_colecao(colecao: str, evento: str, registros=None):
+    """Invalida as respostas que usaram documentos da coleção alterada."""
+    if armazenamento_cache_llm is not None:
+        armazenamento_cache_llm.invalidar_colecao(colecao)
+
+
+registrar_ouvinte(_ao_alterar_colecao, PRIORIDADE_CACHES)
+
+
+def obter_armazenamento_cache_llm() -> Optional[ArmazenamentoCacheLLM]:
+    """Retorna a instância global do armazenamento do cache do LLM."""
+    return armazenamento_cache_llm
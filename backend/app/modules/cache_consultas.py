@@ -0,0 +1,331 @@
+"""
+Cache de resultados das consultas do agente.
+As chaves são derivadas da intenção canônica da pergunta (tipo, coleção,
+dimensão, quantidade e período), com despejo LRU + TTL e invalidação
+por coleção quando há importações ou exclusões.
+
+O cache tem dois níveis: um LRU em memória por processo (L1) e um backend
+compartilhado entre workers (L2), por padrão uma coleção MongoDB com índice TTL.
+"""
+
+import hashlib
+import json
+from abc import ABC, abstractmethod
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Any, Dict, Iterable, Optional
+from pymongo import MongoClient
+from database import db_config
+from modules.eventos_colecoes import registrar_ouvinte, PRIORIDADE_CACHES
+
+
+# Dependência usada por resultados que envolvem todas as coleções
+TODAS_COLECOES = "*"
+
+# Incrementar quando o formato dos valores armazenados mudar
+VERSAO_CACHE = 1
+
+
+def gerar_chave_intencao(intencao: Dict[str, Any]) -> str:
+    """
+    Gera uma chave determinística para uma intenção canônica.
+    A mesma intenção gera a mesma chave em qualquer processo ou reinício.
+
+    Args:
+        intencao: Dicionário com os campos que definem a consulta
+
+    Returns:
+        Hash SHA256 do conteúdo da intenção
+    """
+    conteudo = json.dumps({"versao": VERSAO_CACHE, "intencao": intencao}, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(conteudo.encode("utf-8")).hexdigest()
+
+
+class BackendCache(ABC):
+    """Interface comum dos backends de cache."""
+
+    @abstractmethod
+    def obter(self, chave: str) -> Optional[Any]:
+        """Recupera um valor ou None se ausente/expirado."""
+
+    @abstractmethod
+    def salvar(self, chave: str, valor: Any, colecoes: Iterable[str], ttl_segundos: int):
+        """Armazena um valor associado às coleções das quais depende."""
+
+    @abstractmethod
+    def invalidar_colecao(self, colecao: str) -> int:
+        """Remove os valores que dependem de uma coleção."""
+
+    @abstractmethod
+    def limpar(self):
+        """Remove todos os valores."""
+
+    @abstractmethod
+    def tamanho(self) -> int:
+        """Retorna a quantidade de valores armazenados."""
+
+
+class BackendMemoria(BackendCache):
+    """Cache LRU em memória, local ao processo."""
+
+    def __init__(self, max_itens: int):
+        self.max_itens = max_itens
+        self._itens = OrderedDict()
+        self._lock = threading.Lock()
+
+    def obter(self, chave: str) -> Optional[Any]:
+        with self._lock:
+            item = self._itens.get(chave)
+            if item is None:
+                return None
+
+            if item["expira_em"] <= time.monotonic():
+                del self._itens[chave]
+                return None
+
+            # Marcar como usado recentemente
+            self._itens.move_to_end(chave)
+            return item["valor"]
+
+    def salvar(self, chave: str, valor: Any, colecoes: Iterable[str], ttl_segundos: int):
+        with self._lock:
+            self._itens[chave] = {
+                "valor": valor,
+                "colecoes": set(colecoes),
+                "expira_em": time.monotonic() + ttl_segundos
+            }
+            self._itens.move_to_end(chave)
+
+            # Remover os itens usados há mais tempo (LRU)
+            while len(self._itens) > self.max_itens:
+                self._itens.popitem(last=False)
+
+    def invalidar_colecao(self, colecao: str) -> int:
+        with self._lock:
+            chaves = [
+                chave for chave, item in self._itens.items()
+                if colecao in item["colecoes"] or TODAS_COLECOES in item["colecoes"]
+            ]
+            for chave in chaves:
+                del self._itens[chave]
+        return len(chaves)
+
+    def limpar(self):
+        with self._lock:
+            self._itens.clear()
+
+    def tamanho(self) -> int:
+        with self._lock:
+            return len(self._itens)
+
+
+class BackendMongo(BackendCache):
+    """Cache compartilhado entre workers em uma coleção MongoDB com índice TTL."""
+
+    def __init__(self, mongo_uri: str = None, database_name: str = None, nome_colecao: str = None):
+        self.mongo_uri = mongo_uri or db_config.MONGO_URI
+        self.database_name = database_name or db_config.DB_NAME
+        self.nome_colecao = nome_colecao or db_config.COLECAO_CACHE_CONSULTAS
+        self.colecao = None
+        self._lock = threading.Lock()
+
+    def _obter_colecao(self):
+        """Conecta ao MongoDB e cria os índices na primeira utilização."""
+        if self.colecao is None:
+            with self._lock:
+                if self.colecao is None:
+                    client = MongoClient(self.mongo_uri)
+                    colecao = client[self.database_name][self.nome_colecao]
+                    # O MongoDB remove os documentos automaticamente após expira_em
+                    colecao.create_index("expira_em", expireAfterSeconds=0)
+                    colecao.create_index("colecoes")
+                    self.colecao = colecao
+        return self.colecao
+
+    def obter(self, chave: str) -> Optional[Any]:
+        # O monitor TTL roda a cada minuto, então a expiração também é verificada aqui
+        documento = self._obter_colecao().find_one(
+            {"_id": chave, "expira_em": {"$gt": datetime.utcnow()}},
+            {"valor": 1}
+        )
+        return documento["valor"] if documento else None
+
+    def salvar(self, chave: str, valor: Any, colecoes: Iterable[str], ttl_segundos: int):
+        agora = datetime.utcnow()
+        self._obter_colecao().replace_one(
+            {"_id": chave},
+            {
+                "valor": valor,
+                "colecoes": sorted(set(colecoes)),
+                "criado_em": agora,
+                "expira_em": agora + timedelta(seconds=ttl_segundos)
+            },
+            upsert=True
+        )
+
+    def invalidar_colecao(self, colecao: str) -> int:
+        resultado = self._obter_colecao().delete_many({"colecoes": {"$in": [colecao, TODAS_COLECOES]}})
+        return resultado.deleted_count
+
+    def limpar(self):
+        self._obter_colecao().delete_many({})
+
+    def tamanho(self) -> int:
+        return self._obter_colecao().estimated_document_count()
+
+
+class CacheConsultas:
+    """Cache em dois níveis (L1 local + L2 compartilhado) com invalidação por coleção."""
+
+    def __init__(self, max_itens: int = None, ttl_segundos: int = None, backend_compartilhado: Optional[BackendCache] = None):
+        """
+        Inicializa o cache.
+
+        Args:
+            max_itens: Número máximo de entradas mantidas no L1
+            ttl_segundos: Tempo de vida de cada entrada
+            backend_compartilhado: Backend L2 compartilhado entre workers (opcional)
+        """
+        self.max_itens = max_itens or db_config.CACHE_CONSULTAS_MAX_ITENS
+        self.ttl_segundos = ttl_segundos or db_config.CACHE_CONSULTAS_TTL_SEGUNDOS
+        self.local = BackendMemoria(self.max_itens)
+        self.compartilhado = backend_compartilhado
+
+        # Com L2, o L1 vive pouco para limitar o tempo em que um worker
+        # enxerga um resultado invalidado por outro
+        if self.compartilhado is not None:
+            self.ttl_local = min(self.ttl_segundos, db_config.CACHE_CONSULTAS_L1_TTL_SEGUNDOS)
+        else:
+            self.ttl_local = self.ttl_segundos
+
+        self._lock = threading.Lock()
+        self.acertos = 0
+        self.acertos_compartilhado = 0
+        self.falhas = 0
+
+    def _contar(self, campo: str):
+        with self._lock:
+            setattr(self, campo, getattr(self, campo) + 1)
+
+    def obter(self, chave: str) -> Optional[Any]:
+        """
+        Recupera um resultado do cache, consultando o L1 e depois o L2.
+
+        Args:
+            chave: Chave da intenção
+
+        Returns:
+            Resultado armazenado ou None se ausente/expirado
+        """
+        valor = self.local.obter(chave)
+        if valor is not None:
+            self._contar("acertos")
+            return valor
+
+        if self.compartilhado is not None:
+            try:
+                valor = self.compartilhado.obter(chave)
+            except Exception as e:
+                print(f"Erro ao consultar cache compartilhado: {e}")
+                valor = None
+
+            if valor is not None:
+                # Promover para o L1 (com as dependências genéricas, o valor
+                # será descartado em qualquer invalidação local)
+                self.local.salvar(chave, valor, [TODAS_COLECOES], self.ttl_local)
+                self._contar("acertos")
+                self._contar("acertos_compartilhado")
+                return valor
+
+        self._contar("falhas")
+        return None
+
+    def salvar(self, chave: str, valor: Any, colecoes: Iterable[str]):
+        """
+        Salva um resultado no cache.
+
+        Args:
+            chave: Chave da intenção
+            valor: Resultado da consulta
+            colecoes: Coleções das quais o resultado depende
+        """
+        colecoes = list(colecoes)
+        self.local.salvar(chave, valor, colecoes, self.ttl_local)
+
+        if self.compartilhado is not None:
+            try:
+                self.compartilhado.salvar(chave, valor, colecoes, self.ttl_segundos)
+            except Exception as e:
+                print(f"Erro ao salvar no cache compartilhado: {e}")
+
+    def invalidar_colecao(self, colecao: str) -> int:
+        """
+        Remove os resultados que dependem de uma coleção nos dois níveis.
+
+        Args:
+            colecao: Nome da coleção alterada
+
+        Returns:
+            Quantidade de entradas removidas
+        """
+        removidos = self.local.invalidar_colecao(colecao)
+
+        if self.compartilhado is not None:
+            try:
+                removidos += self.compartilhado.invalidar_colecao(colecao)
+            except Exception as e:
+                print(f"Erro ao invalidar cache compartilhado: {e}")
+
+        if removidos:
+            print(f"Cache invalidado para '{colecao}': {removidos} entradas removidas")
+        return removidos
+
+    def limpar(self):
+        """Remove todas as entradas do cache."""
+        self.local.limpar()
+        if self.compartilhado is not None:
+            try:
+                self.compartilhado.limpar()
+            except Exception as e:
+                print(f"Erro ao limpar cache compartilhado: {e}")
+
+    def estatisticas(self) -> Dict[str, Any]:
+        """Retorna estatísticas de uso do cache."""
+        with self._lock:
+            total = self.acertos + self.falhas
+            return {
+                "itens_local": self.local.tamanho(),
+                "max_itens": self.max_itens,
+                "ttl_segundos": self.ttl_segundos,
+                "backend_compartilhado": type(self.compartilhado).__name__ if self.compartilhado else None,
+                "acertos": self.acertos,
+                "acertos_compartilhado": self.acertos_compartilhado,
+                "falhas": self.falhas,
+                "taxa_acerto": round(self.acertos / total, 4) if total else 0.0
+            }
+
+
+def criar_backend_compartilhado() -> Optional[BackendCache]:
+    """Cria o backend L2 configurado em CACHE_CONSULTAS_BACKEND."""
+    if db_config.CACHE_CONSULTAS_BACKEND == "mongo":
+        return BackendMongo()
+    return None
+
+
+# Instância global do cache
+cache_consultas = CacheConsultas(backend_compartilhado=criar_backend_compartilhado())
+
+
+def _ao_alterar_colecao(colecao: str, evento: str, registros=None):
+    """Invalida o cache quando uma coleção é importada ou excluída."""
+    cache_consultas.invalidar_colecao(colecao)
+
+
+registrar_ouvinte(_ao_alterar_colecao, PRIORIDADE_CACHES)
+
+
+def obter_cache_consultas() -> CacheConsultas:
+    """Retorna a instância global do cache de consultas."""
+    return cache_consultas
@@ -0,0 +1,135 @@
+"""
+Cache persistente das respostas do LLM.
+As chaves combinam o modelo e seus parâmetros (inclusive a temperatura), o
+hash do prompt renderizado e os IDs dos documentos recuperados como contexto,
+então perguntas repetidas com o mesmo contexto não chamam a OpenAI de novo.
+
+As entradas ficam em uma coleção MongoDB com índice TTL e limite de tamanho
+(despejo das usadas há mais tempo) e são invalidadas quando uma coleção da
+qual o contexto dependia é importada ou excluída (a coleção, a invalidação e
+as estatísticas ficam em modules.armazenamento_cache_llm, sem LangChain).
+"""
+
+import hashlib
+import json
+from contextvars import ContextVar
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from langchain_core.caches import BaseCache
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.load import dumps, loads
+from modules.armazenamento_cache_llm import ArmazenamentoCacheLLM, obter_armazenamento_cache_llm
+
+
+# Incrementar quando o formato das entradas mudar
+VERSAO_CACHE_LLM = 1
+
+# Documentos recuperados na pergunta em andamento (lista compartilhada pelos
+# contextos copiados que o LangChain cria para as execuções internas)
+_documentos_recuperados: ContextVar[Optional[List[Dict[str, str]]]] = ContextVar("documentos_recuperados", default=None)
+
+
+class ColetorDocumentos(BaseCallbackHandler):
+    """Registra os documentos devolvidos pelo retriever para compor a chave do cache."""
+
+    def __init__(self):
+        self.documentos = []
+        _documentos_recuperados.set(self.documentos)
+
+    def on_retriever_end(self, documents: Sequence[Any], **kwargs) -> None:
+        for doc in documents:
+            # Cabeçalho das chaves abreviadas (derivado dos próprios documentos)
+            if doc.metadata.get("cabecalho"):
+                continue
+            self.documentos.append({
+                "colecao": str(doc.metadata.get("colecao", "")),
+                "id": str(doc.metadata.get("id", ""))
+            })
+
+
+class CacheRespostasLLM(BaseCache):
+    """Cache de gerações do LangChain persistido no MongoDB."""
+
+    def __init__(self, armazenamento: ArmazenamentoCacheLLM):
+        """
+        Args:
+            armazenamento: Coleção, invalidação e contadores (sem LangChain)
+        """
+        self.armazenamento = armazenamento
+
+    def _gerar_chave(self, prompt: str, llm_string: str) -> Tuple[str, List[Dict[str, str]]]:
+        """Gera a chave a partir do modelo, do prompt e dos documentos de contexto."""
+        documentos = list(_documentos_recuperados.get() or [])
+        ids = sorted(f"{doc['colecao']}:{doc['id']}" for doc in documentos)
+        conteudo = json.dumps({
+            "versao": VERSAO_CACHE_LLM,
+            "llm": llm_string,
+            "prompt": hashlib.sha256(prompt.encode("utf-8")).hexdigest(),
+            "documentos": ids
+        }, sort_keys=True)
+        return hashlib.sha256(conteudo.encode("utf-8")).hexdigest(), documentos
+
+    def lookup(self, prompt: str, llm_string: str) -> Optional[Any]:
+        chave, _ = self._gerar_chave(prompt, llm_string)
+        agora = datetime.utcnow()
+        try:
+            documento = self.armazenamento.obter_colecao().find_one_and_update(
+                {"_id": chave, "expira_em": {"$gt": agora}},
+                {"$set": {"ultimo_acesso": agora}, "$inc": {"acessos": 1}},
+                {"geracoes": 1}
+            )
+        except Exception as e:
+            print(f"Erro ao consultar cache do LLM: {e}")
+            return None
+
+        if documento is None:
+            self.armazenamento.contar("falhas")
+            return None
+
+        self.armazenamento.contar("acertos")
+        return [loads(geracao) for geracao in documento["geracoes"]]
+
+    def update(self, prompt: str, llm_string: str, return_val: Any) -> None:
+        chave, documentos = self._gerar_chave(prompt, llm_string)
+        agora = datetime.utcnow()
+        colecoes = sorted({doc["colecao"] for doc in documentos if doc["colecao"]})
+        try:
+            self.armazenamento.obter_colecao().replace_one(
+                {"_id": chave},
+                {
+                    "geracoes": [dumps(geracao) for geracao in return_val],
+                    "documentos": [f"{doc['colecao']}:{doc['id']}" for doc in documentos],
+                    "colecoes": colecoes,
+                    "criado_em": agora,
+                    "ultimo_acesso": agora,
+                    "acessos": 0,
+                    "expira_em": agora + timedelta(seconds=self.armazenamento.ttl_segundos)
+                },
+                upsert=True
+            )
+            self.armazenamento.registrar_salvamento()
+        except Exception as e:
+            print(f"Erro ao salvar no cache do LLM: {e}")
+
+    def invalidar_colecao(self, colecao: str) -> int:
+        """Remove as respostas cujo contexto veio da coleção."""
+        return self.armazenamento.invalidar_colecao(colecao)
+
+    def clear(self, **kwargs: Any) -> None:
+        self.armazenamento.limpar()
+
+    def estatisticas(self) -> Dict[str, Any]:
+        """Retorna estatísticas de uso do cache."""
+        return self.armazenamento.estatisticas()
+
+
+# Instância global do cache (None quando desativado); a invalidação a cada
+# importação ou exclusão é registrada pelo módulo do armazenamento
+_armazenamento = obter_armazenamento_cache_llm()
+cache_llm = CacheRespostasLLM(_armazenamento) if _armazenamento is not None else None
+
+
+def obter_cache_llm() -> Optional[CacheRespostasLLM]:
+    """Retorna a instância global do cache de respostas do LLM."""
+    return cache_llm
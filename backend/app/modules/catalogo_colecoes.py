@@ -0,0 +1,153 @@
+"""
+Catálogo das coleções do banco.
+Mantém em cache os nomes das coleções, a contagem estimada de documentos
+(metadados da coleção, sem varrer os documentos) e o esquema amostrado de
+cada coleção. É atualizado por eventos de importação/exclusão e, entre
+workers, por um TTL curto.
+"""
+
+import threading
+import time
+from typing import Any, Dict, List, Optional
+from pymongo import MongoClient
+from database import db_config
+from modules.eventos_colecoes import registrar_ouvinte, PRIORIDADE_DERIVADOS
+
+
+class CatalogoColecoes:
+    """Cache de nomes, contagens estimadas e esquemas das coleções."""
+
+    def __init__(self, db=None, ttl_segundos: int = None, tamanho_amostra_esquema: int = 200):
+        """
+        Args:
+            db: Banco MongoDB (conecta ao banco configurado se omitido)
+            ttl_segundos: Tempo máximo antes de reler o catálogo
+            tamanho_amostra_esquema: Documentos amostrados para inferir o esquema
+        """
+        self.db = db
+        self.ttl_segundos = ttl_segundos if ttl_segundos is not None else db_config.CATALOGO_TTL_SEGUNDOS
+        self.tamanho_amostra_esquema = tamanho_amostra_esquema
+        self._lock = threading.Lock()
+        self._nomes = None
+        self._nomes_em = 0.0
+        self._contagens = {}
+        self._esquemas = {}
+
+    def _obter_db(self):
+        if self.db is None:
+            self.db = MongoClient(db_config.MONGO_URI)[db_config.DB_NAME]
+        return self.db
+
+    def _expirado(self, lido_em: float) -> bool:
+        return time.monotonic() - lido_em > self.ttl_segundos
+
+    def nomes(self, incluir_internas: bool = False) -> List[str]:
+        """
+        Lista as coleções do banco.
+
+        Args:
+            incluir_internas: Se True, inclui as coleções internas da aplicação
+
+        Returns:
+            Nomes das coleções
+        """
+        with self._lock:
+            if self._nomes is None or self._expirado(self._nomes_em):
+                self._nomes = sorted(self._obter_db().list_collection_names())
+                self._nomes_em = time.monotonic()
+            nomes = list(self._nomes)
+
+        if incluir_internas:
+            return nomes
+        return [nome for nome in nomes if not db_config.colecao_interna(nome)]
+
+    def existe(self, colecao: str) -> bool:
+        """Indica se a coleção existe."""
+        return colecao in self.nomes(incluir_internas=True)
+
+    def contagem(self, colecao: str) -> int:
+        """
+        Retorna a contagem estimada de documentos da coleção (metadados, O(1)).
+
+        Args:
+            colecao: Nome da coleção
+
+        Returns:
+            Quantidade de documentos (0 se a coleção não existir)
+        """
+        with self._lock:
+            item = self._contagens.get(colecao)
+            if item is not None and not self._expirado(item[1]):
+                return item[0]
+
+        total = self._obter_db()[colecao].estimated_document_count() if self.existe(colecao) else 0
+        with self._lock:
+            self._contagens[colecao] = (total, time.monotonic())
+        return total
+
+    def esquema(self, colecao: str) -> Dict[str, List[str]]:
+        """
+        Retorna os campos da coleção e os tipos encontrados em uma amostra.
+
+        Args:
+            colecao: Nome da coleção
+
+        Returns:
+            Dicionário campo -> lista de nomes de tipos
+        """
+        with self._lock:
+            item = self._esquemas.get(colecao)
+            if item is not None and not self._expirado(item[1]):
+                return item[0]
+
+        tipos = {}
+        if self.existe(colecao):
+            amostra = self._obter_db()[colecao].aggregate([{"$sample": {"size": self.tamanho_amostra_esquema}}])
+            for doc in amostra:
+                for campo, valor in doc.items():
+                    if campo == "_id":
+                        continue
+                    tipos.setdefault(campo, set()).add(type(valor).__name__)
+        esquema = {campo: sorted(nomes_tipos) for campo, nomes_tipos in tipos.items()}
+
+        with self._lock:
+            self._esquemas[colecao] = (esquema, time.monotonic())
+        return esquema
+
+    def resumo(self) -> List[Dict[str, Any]]:
+        """Retorna nome e contagem estimada de cada coleção visível."""
+        return [{"nome": nome, "total": self.contagem(nome)} for nome in self.nomes()]
+
+    def invalidar(self, colecao: Optional[str] = None):
+        """
+        Descarta o catálogo (nomes) e os dados da coleção alterada.
+
+        Args:
+            colecao: Coleção alterada (None para descartar tudo)
+        """
+        with self._lock:
+            self._nomes = None
+            if colecao is None:
+                self._contagens.clear()
+                self._esquemas.clear()
+            else:
+                self._contagens.pop(colecao, None)
+                self._esquemas.pop(colecao, None)
+
+
+# Instância global do catálogo
+catalogo = CatalogoColecoes()
+
+
+def _ao_alterar_colecao(colecao: str, evento: str, registros=None):
+    """Atualiza o catálogo quando uma coleção é importada ou excluída."""
+    catalogo.invalidar(colecao)
+
+
+# Antes dos demais ouvintes, que podem consultar o catálogo
+registrar_ouvinte(_ao_alterar_colecao, PRIORIDADE_DERIVADOS - 1)
+
+
+def obter_catalogo() -> CatalogoColecoes:
+    """Retorna a instância global do catálogo de coleções."""
+    return catalogo
@@ -0,0 +1,100 @@
+"""
+Coalescência de requisições idênticas em andamento (single-flight).
+Quando várias requisições pedem o mesmo resultado ao mesmo tempo, apenas a
+primeira executa a consulta; as demais aguardam e recebem o mesmo resultado
+(ou a mesma exceção), inclusive os eventos de progresso emitidos a partir
+do momento em que entraram.
+"""
+
+import threading
+from typing import Any, Callable, Dict, Optional
+
+
+class _Chamada:
+    """Execução em andamento de uma chave."""
+
+    def __init__(self):
+        self.concluida = threading.Event()
+        self.resultado = None
+        self.erro = None
+        self.ouvintes = []
+
+
+class CoalescedorRequisicoes:
+    """Agrupa execuções concorrentes com a mesma chave em uma única execução."""
+
+    def __init__(self):
+        self._em_andamento = {}
+        self._lock = threading.Lock()
+        self.execucoes = 0
+        self.coalescidas = 0
+
+    def executar(self, chave: str, funcao: Callable[[Callable[[str, Dict[str, Any]], None]], Any],
+                 callback_evento: Optional[Callable[[str, Dict[str, Any]], None]] = None) -> Any:
+        """
+        Executa a função ou aguarda a execução idêntica já em andamento.
+
+        Args:
+            chave: Identifica o resultado (ex.: chave da intenção canônica)
+            funcao: Recebe um callback de eventos repassado a todos os participantes
+            callback_evento: Recebe os eventos (ex.: progresso) da execução
+
+        Returns:
+            Resultado da execução compartilhada
+        """
+        with self._lock:
+            chamada = self._em_andamento.get(chave)
+            lider = chamada is None
+            if lider:
+                chamada = _Chamada()
+                self._em_andamento[chave] = chamada
+                self.execucoes += 1
+            else:
+                self.coalescidas += 1
+            if callback_evento:
+                chamada.ouvintes.append(callback_evento)
+
+        if not lider:
+            print(f" Aguardando execução idêntica em andamento: {chave[:16]}...")
+            chamada.concluida.wait()
+            if chamada.erro is not None:
+                raise chamada.erro
+            return chamada.resultado
+
+        def difundir(evento: str, dados: Dict[str, Any]):
+            with self._lock:
+                ouvintes = list(chamada.ouvintes)
+            for ouvinte in ouvintes:
+                try:
+                    ouvinte(evento, dados)
+                except Exception as e:
+                    print(f" Erro ao repassar evento: {e}")
+
+        try:
+            chamada.resultado = funcao(difundir)
+            return chamada.resultado
+        except Exception as e:
+            chamada.erro = e
+            raise
+        finally:
+            with self._lock:
+                del self._em_andamento[chave]
+            chamada.concluida.set()
+
+    def estatisticas(self) -> Dict[str, Any]:
+        """Retorna contadores de execuções e requisições coalescidas."""
+        with self._lock:
+            return {
+                "em_andamento": len(self._em_andamento),
+                "execucoes": self.execucoes,
+                "coalescidas": self.coalescidas
+            }
+
+
+# Instância global compartilhada pelas threads do servidor
+coalescedor = CoalescedorRequisicoes()
+
+
+def obter_coalescedor() -> CoalescedorRequisicoes:
+    """Retorna a instância global do coalescedor de requisições."""
+    return coalescedor
@@ -0,0 +1,211 @@
+"""
+Codificação dos documentos do índice vetorial em texto.
+O mesmo texto gera o embedding e entra no prompt do LLM (5 documentos por
+pergunta), então cada caractere custa duas vezes. Dois modos:
+
+- "detalhado": "Dados da coleção 'X':" e uma linha "chave: valor" por campo;
+- "compacto": uma linha por documento, "X | sku=123; lj=12; dt=01/02/2025",
+  com chaves abreviadas, sem campos vazios e sem indentação. A legenda das
+  abreviações é um cabeçalho único, compartilhado pelos documentos de cada
+  contexto e enviado uma vez no prompt, só com as chaves presentes neles.
+
+As abreviações são globais (o mesmo campo tem a mesma abreviação em todas as
+coleções) e estáveis enquanto o processo estiver de pé.
+"""
+
+import json
+import re
+import threading
+import unicodedata
+from typing import Any, Dict, List
+from database import db_config
+from modules.dimensao_datas import PREFIXO_CAMPO_TIPADO
+
+
+MODO_DETALHADO = "detalhado"
+MODO_COMPACTO = "compacto"
+MODOS_CODIFICACAO = [MODO_DETALHADO, MODO_COMPACTO]
+
+# Abreviações das palavras mais comuns nos nomes de campos
+ABREVIACOES = {
+    "data": "dt", "hora": "hr", "loja": "lj", "filial": "fil", "sku": "sku",
+    "idusuario": "usr", "usuario": "usr", "cliente": "cli", "id": "id",
+    "devolucao": "dev", "cancelamento": "canc", "ajuste": "aj", "ajustes": "aj",
+    "estoque": "est", "produto": "prod", "descricao": "desc", "quantidade": "qtd",
+    "qtde": "qtd", "valor": "vl", "total": "tot", "preco": "prc", "unitario": "un",
+    "motivo": "mot", "tipo": "tp", "status": "st", "codigo": "cod", "numero": "num",
+    "nota": "nf", "fiscal": "", "operador": "op", "vendedor": "vend", "venda": "vd",
+    "compra": "cpr", "origem": "orig", "destino": "dest", "observacao": "obs"
+}
+
+# Tamanho das palavras sem abreviação conhecida
+TAMANHO_ABREVIACAO = 4
+
+# Chaves de um texto compacto ("COLEÇÃO | chave=valor; chave=valor")
+_CHAVE_COMPACTA = re.compile(r"(?:\| |; )([a-z0-9_]+)=")
+
+
+def _palavras(campo: str) -> List[str]:
+    """Palavras do nome do campo, minúsculas e sem acentos."""
+    sem_acentos = unicodedata.normalize("NFKD", campo).encode("ascii", "ignore").decode("ascii")
+    return [palavra for palavra in re.split(r"[^a-z0-9]+", sem_acentos.lower()) if palavra]
+
+
+def abreviar(campo: str) -> str:
+    """
+    Abreviação sugerida para o nome do campo (sem garantir unicidade).
+
+    Exemplos: "DATA_DEVOLUCAO" -> "dt_dev", "VALOR TOTAL" -> "vl_tot", "SKU" -> "sku"
+    """
+    partes = []
+    for palavra in _palavras(campo):
+        abreviada = ABREVIACOES.get(palavra, palavra[:TAMANHO_ABREVIACAO])
+        if abreviada:
+            partes.append(abreviada)
+    return "_".join(partes) or campo.lower()
+
+
+def contar_tokens(texto: str) -> int:
+    """Tokens do texto no tokenizador dos embeddings (aproximação de ~4 caracteres sem tiktoken)."""
+    codificador = _tokenizador()
+    if codificador is None:
+        return len(texto) // 4
+    return len(codificador.encode(texto))
+
+
+_tokenizador_cache = []
+
+
+def _tokenizador():
+    if not _tokenizador_cache:
+        try:
+            import tiktoken
+            _tokenizador_cache.append(tiktoken.get_encoding("cl100k_base"))
+        except Exception:
+            _tokenizador_cache.append(None)
+    return _tokenizador_cache[0]
+
+
+def _campos_visiveis(doc: Dict[str, Any]):
+    """Campos com conteúdo (sem _id, datas tipadas derivadas e valores vazios)."""
+    for chave, valor in doc.items():
+        if chave == "_id" or chave.startswith(PREFIXO_CAMPO_TIPADO):
+            continue
+        if valor is None or valor == "" or valor == [] or valor == {}:
+            continue
+        yield chave, valor
+
+
+class CodificadorDocumentos:
+    """Converte documentos em texto no modo configurado e mede o tamanho gerado."""
+
+    def __init__(self, modo: str = None):
+        """
+        Args:
+            modo: "detalhado" ou "compacto" (padrão da configuração)
+        """
+        self.modo = (modo or db_config.DOCUMENTO_CODIFICACAO).lower()
+        if self.modo not in MODOS_CODIFICACAO:
+            raise ValueError(f"Modo de codificação desconhecido: {self.modo} (use {', '.join(MODOS_CODIFICACAO)})")
+        self._lock = threading.Lock()
+        self._abreviacoes: Dict[str, str] = {}
+        self._usadas = set()
+        self.documentos = 0
+        self.tokens = 0
+
+    def abreviacao(self, campo: str) -> str:
+        """Abreviação única e estável do campo."""
+        with self._lock:
+            abreviada = self._abreviacoes.get(campo)
+            if abreviada is None:
+                base = abreviar(campo)
+                abreviada = base
+                sufixo = 2
+                while abreviada in self._usadas:
+                    abreviada = f"{base}{sufixo}"
+                    sufixo += 1
+                self._abreviacoes[campo] = abreviada
+                self._usadas.add(abreviada)
+            return abreviada
+
+    def codificar(self, doc: Dict[str, Any], colecao: str) -> str:
+        """
+        Texto do documento no modo do codificador.
+
+        Args:
+            doc: Documento MongoDB
+            colecao: Nome da coleção
+
+        Returns:
+            Texto usado no embedding e no contexto do prompt
+        """
+        if self.modo == MODO_COMPACTO:
+            texto = self.codificar_compacto(doc, colecao)
+        else:
+            texto = self.codificar_detalhado(doc, colecao)
+        tokens = contar_tokens(texto)
+        with self._lock:
+            self.documentos += 1
+            self.tokens += tokens
+        return texto
+
+    def codificar_detalhado(self, doc: Dict[str, Any], colecao: str) -> str:
+        """Cabeçalho com a coleção e uma linha "chave: valor" por campo."""
+        texto = f"Dados da coleção '{colecao}':\n"
+        for chave, valor in _campos_visiveis(doc):
+            if isinstance(valor, (dict, list)):
+                texto += f"{chave}: {json.dumps(valor, ensure_ascii=False, indent=2)}\n"
+            else:
+                texto += f"{chave}: {valor}\n"
+        return texto
+
+    def codificar_compacto(self, doc: Dict[str, Any], colecao: str) -> str:
+        """Uma linha: coleção e pares chave=valor abreviados, sem vazios."""
+        pares = []
+        for chave, valor in _campos_visiveis(doc):
+            if isinstance(valor, (dict, list)):
+                valor = json.dumps(valor, ensure_ascii=False, separators=(",", ":"))
+            elif isinstance(valor, str):
+                valor = " ".join(valor.split())
+            pares.append(f"{self.abreviacao(chave)}={valor}")
+        return f"{colecao} | {'; '.join(pares)}"
+
+    def cabecalho(self, textos: List[str]) -> str:
+        """
+        Cabeçalho compartilhado pelos documentos compactos de um contexto:
+        significado apenas das abreviações que aparecem nos textos (vazio no
+        modo detalhado, em que as chaves já são os nomes dos campos).
+        """
+        if self.modo != MODO_COMPACTO:
+            return ""
+        usadas = set()
+        for texto in textos:
+            usadas.update(_CHAVE_COMPACTA.findall(texto))
+        with self._lock:
+            pares = sorted(
+                (abreviada, campo) for campo, abreviada in self._abreviacoes.items() if abreviada in usadas
+            )
+        if not pares:
+            return ""
+        return "Documentos: COLEÇÃO | chave=valor; ... Chaves: " + ", ".join(
+            f"{abreviada}={campo}" for abreviada, campo in pares
+        )
+
+    def estatisticas(self) -> Dict[str, Any]:
+        """Modo, campos abreviados e tokens médios por documento codificado."""
+        with self._lock:
+            return {
+                "modo": self.modo,
+                "campos_abreviados": len(self._abreviacoes),
+                "documentos": self.documentos,
+                "tokens_por_documento": round(self.tokens / self.documentos, 1) if self.documentos else 0.0
+            }
+
+
+# Instância global do codificador
+codificador_documentos = CodificadorDocumentos()
+
+
+def obter_codificador_documentos() -> CodificadorDocumentos:
+    """Retorna a instância global do codificador de documentos."""
+    return codificador_documentos
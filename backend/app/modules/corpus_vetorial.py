@@ -0,0 +1,220 @@
+"""
+Construção do corpus do índice vetorial.
+Amostra as coleções em paralelo, cada uma com a projeção dos seus próprios
+campos (pelo esquema do catálogo), em vez de uma projeção fixa de campos da
+DEVOLUCAO que deixava quase vazios os documentos das demais coleções.
+
+A amostra é estratificada pela LOJA ou, na falta dela, pelo mês de um campo de
+data: de um conjunto sorteado maior que o necessário, os documentos são
+escolhidos alternando entre os estratos, para que lojas e meses pouco
+frequentes também tenham vetores. Textos vazios ou repetidos são descartados
+antes de gerar os embeddings.
+"""
+
+import hashlib
+import random
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from pymongo import MongoClient
+from database import db_config
+from modules.catalogo_colecoes import obter_catalogo
+from modules.dimensao_datas import eh_campo_data
+
+
+# Campos preferidos para estratificar a amostra (na ordem)
+CAMPOS_ESTRATO = ["LOJA"]
+
+# Valores que não contam como conteúdo do documento
+VALORES_VAZIOS = ("", "nan", "none", "null", "n/a")
+
+
+def _vazio(valor: Any) -> bool:
+    return valor is None or (isinstance(valor, str) and valor.strip().lower() in VALORES_VAZIOS)
+
+
+class ConstrutorCorpus:
+    """Amostra estratificada e paralela das coleções para o índice vetorial."""
+
+    def __init__(self, db=None, tamanho_por_colecao: int = None, fator_sorteio: int = None,
+                 max_workers: int = None, max_campos: int = None):
+        """
+        Args:
+            db: Banco MongoDB (conecta ao banco configurado se omitido)
+            tamanho_por_colecao: Documentos amostrados por coleção
+            fator_sorteio: Quantas vezes o tamanho é sorteado antes de estratificar
+            max_workers: Coleções amostradas ao mesmo tempo
+            max_campos: Máximo de campos projetados por coleção
+        """
+        self.db = db
+        self.catalogo = obter_catalogo()
+        self.tamanho_por_colecao = tamanho_por_colecao or db_config.CORPUS_AMOSTRA_POR_COLECAO
+        self.fator_sorteio = fator_sorteio or db_config.CORPUS_FATOR_SORTEIO
+        self.max_workers = max_workers or db_config.CORPUS_MAX_WORKERS
+        self.max_campos = max_campos or db_config.CORPUS_MAX_CAMPOS
+        self._lock = threading.Lock()
+        self.ultima_construcao = None
+
+    def _obter_db(self):
+        if self.db is None:
+            self.db = MongoClient(db_config.MONGO_URI)[db_config.DB_NAME]
+        return self.db
+
+    def campos_projetados(self, colecao: str) -> List[str]:
+        """Campos reais da coleção (sem _id, hash e campos derivados)."""
+        campos = [campo for campo in self.catalogo.esquema(colecao) if not campo.startswith("_")]
+        return campos[:self.max_campos]
+
+    def campo_estrato(self, campos: List[str]) -> Tuple[Optional[str], Optional[Dict[str, Any]]]:
+        """
+        Escolhe o campo de estratificação e a expressão do estrato.
+
+        Returns:
+            (campo, expressão do $project) ou (None, None) sem campo adequado
+        """
+        for campo in CAMPOS_ESTRATO:
+            if campo in campos:
+                return campo, {"$ifNull": [f"${campo}", None]}
+        for campo in campos:
+            if eh_campo_data(campo):
+                # DD/MM/AAAA -> MM/AAAA (mês da data)
+                return campo, {"$substrCP": [{"$ifNull": [f"${campo}", ""]}, 3, 7]}
+        return None, None
+
+    def _estratificar(self, docs: List[Dict[str, Any]], tamanho: int) -> List[Dict[str, Any]]:
+        """Escolhe os documentos alternando entre os estratos (mesma cota para cada um)."""
+        estratos = OrderedDict()
+        for doc in docs:
+            estratos.setdefault(doc.pop("__estrato", None), []).append(doc)
+
+        grupos = list(estratos.values())
+        random.shuffle(grupos)
+        escolhidos = []
+        posicao = 0
+        while len(escolhidos) < tamanho and grupos:
+            grupos = [grupo for grupo in grupos if len(grupo) > posicao]
+            for grupo in grupos:
+                if len(escolhidos) >= tamanho:
+                    break
+                escolhidos.append(grupo[posicao])
+            posicao += 1
+        return escolhidos
+
+    def amostrar_colecao(self, colecao: str) -> Dict[str, Any]:
+        """
+        Amostra uma coleção com a projeção dos seus campos e estratificação.
+
+        Returns:
+            Dicionário com colecao, documentos, campo_estrato, estratos e tempo_segundos
+        """
+        inicio = time.perf_counter()
+        total = self.catalogo.contagem(colecao)
+        campos = self.campos_projetados(colecao)
+        if total == 0 or not campos:
+            return {"colecao": colecao, "documentos": [], "campo_estrato": None, "estratos": 0,
+                    "tempo_segundos": 0.0}
+
+        campo, expressao = self.campo_estrato(campos)
+        projecao = {campo_projetado: 1 for campo_projetado in campos}
+        if expressao is not None:
+            projecao["__estrato"] = expressao
+
+        tamanho = min(self.tamanho_por_colecao, total)
+        pipeline = [
+            {"$sample": {"size": min(tamanho * self.fator_sorteio, total)}},
+            {"$project": projecao}
+        ]
+        docs = list(self._obter_db()[colecao].aggregate(pipeline))
+        estratos = len({doc.get("__estrato") for doc in docs})
+        documentos = self._estratificar(docs, tamanho) if expressao is not None else docs[:tamanho]
+
+        return {
+            "colecao": colecao,
+            "documentos": documentos,
+            "campo_estrato": campo,
+            "estratos": estratos if expressao is not None else 0,
+            "tempo_segundos": round(time.perf_counter() - inicio, 3)
+        }
+
+    def construir(self, formatar: Callable[[Dict[str, Any], str], str],
+                  colecoes: List[str] = None) -> List[Dict[str, Any]]:
+        """
+        Monta o corpus: amostra as coleções em paralelo, formata cada documento
+        e descarta os vazios e os textos repetidos.
+
+        Args:
+            formatar: Converte (documento, coleção) no texto do embedding
+            colecoes: Coleções amostradas (todas as visíveis se omitido)
+
+        Returns:
+            Lista de {"texto", "colecao", "id"}
+        """
+        inicio = time.perf_counter()
+        colecoes = colecoes or self.catalogo.nomes()
+
+        with ThreadPoolExecutor(max_workers=max(1, min(self.max_workers, len(colecoes) or 1)),
+                                thread_name_prefix="corpus") as executor:
+            amostras = list(executor.map(self._amostrar_seguro, colecoes))
+
+        corpus = []
+        vistos = set()
+        por_colecao = {}
+        for amostra in amostras:
+            vazios = duplicados = 0
+            for doc in amostra["documentos"]:
+                if all(_vazio(valor) for chave, valor in doc.items() if chave != "_id"):
+                    vazios += 1
+                    continue
+                texto = formatar(doc, amostra["colecao"])
+                assinatura = hashlib.sha1(texto.encode("utf-8")).digest()
+                if assinatura in vistos:
+                    duplicados += 1
+                    continue
+                vistos.add(assinatura)
+                corpus.append({"texto": texto, "colecao": amostra["colecao"], "id": str(doc.get("_id", ""))})
+
+            por_colecao[amostra["colecao"]] = {
+                "amostrados": len(amostra["documentos"]),
+                "documentos": len(amostra["documentos"]) - vazios - duplicados,
+                "vazios_descartados": vazios,
+                "duplicados_descartados": duplicados,
+                "campo_estrato": amostra["campo_estrato"],
+                "estratos": amostra["estratos"],
+                "tempo_segundos": amostra["tempo_segundos"],
+                "erro": amostra.get("erro")
+            }
+            print(f" Coleção '{amostra['colecao']}': {por_colecao[amostra['colecao']]['documentos']} documentos "
+                  f"(estratos por {amostra['campo_estrato'] or '-'}: {amostra['estratos']}, "
+                  f"{vazios} vazios e {duplicados} repetidos descartados)")
+
+        with self._lock:
+            self.ultima_construcao = {
+                "documentos": len(corpus),
+                "tempo_segundos": round(time.perf_counter() - inicio, 3),
+                "colecoes": por_colecao
+            }
+        return corpus
+
+    def _amostrar_seguro(self, colecao: str) -> Dict[str, Any]:
+        try:
+            return self.amostrar_colecao(colecao)
+        except Exception as e:
+            print(f" Erro ao amostrar a coleção '{colecao}': {e}")
+            return {"colecao": colecao, "documentos": [], "campo_estrato": None, "estratos": 0,
+                    "tempo_segundos": 0.0, "erro": str(e)}
+
+    def estatisticas(self) -> Optional[Dict[str, Any]]:
+        """Resumo da última construção do corpus."""
+        with self._lock:
+            return self.ultima_construcao
+
+
+# Instância global do construtor
+construtor_corpus = ConstrutorCorpus()
+
+
+def obter_construtor_corpus() -> ConstrutorCorpus:
+    """Retorna a instância global do construtor do corpus vetorial."""
+    return construtor_corpus
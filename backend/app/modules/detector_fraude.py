@@ -5,15 +5,14 @@ Implementa algoritmos para identificar indícios de fraude em dados de vendas, d
 """
 
 from datetime import datetime, timedelta
-from typing import List, Dict, Any, Tuple, Optional
+from typing import List, Dict, Any, Tuple, Optional, Callable
 from pymongo import MongoClient
 from collections import defaultdict, Counter
-import pandas as pd
 import json
-from openpyxl import Workbook
-from openpyxl.styles import Font, PatternFill, Alignment, Border, Side
-from openpyxl.utils import get_column_letter
 import io
+from database import db_config
+from modules.catalogo_colecoes import obter_catalogo, CatalogoColecoes
+from modules.rastreamento import rastrear, span, COMPONENTE_FRAUDE
 
 
 class DetectorFraude:
@@ -33,6 +32,9 @@ class DetectorFraude:
         self.db = mongo_client[database_name]
         self.resultados_fraude = []
         
+        # Catálogo em cache para verificar a existência das coleções
+        self.catalogo = obter_catalogo() if database_name == db_config.DB_NAME else CatalogoColecoes(self.db)
+        
         # Configurações para detecção de fraude
         self.config = {
             'percentual_troca_suspeito': 0.15,  # 15% de trocas é suspeito
@@ -137,7 +139,7 @@ class DetectorFraude:
             ajustes_skus = set()
             ajustes_detalhes = {}
             
-            if 'AJUSTES ESTOQUE' in self.db.list_collection_names():
+            if self.catalogo.existe('AJUSTES ESTOQUE'):
                 ajustes = list(self.db['AJUSTES ESTOQUE'].find({}))
                 for ajuste in ajustes:
                     sku = ajuste.get('SKU', '')
@@ -273,7 +275,7 @@ class DetectorFraude:
                 })
             
             # Ajustes
-            if 'AJUSTES ESTOQUE' in self.db.list_collection_names():
+            if self.catalogo.existe('AJUSTES ESTOQUE'):
                 ajustes = list(self.db['AJUSTES ESTOQUE'].find({}))
                 for ajuste in ajustes:
                     todas_movimentacoes.append({
@@ -288,7 +290,7 @@ class DetectorFraude:
                     })
             
             # Cancelamentos
-            if 'CANCELAMENTO' in self.db.list_collection_names():
+            if self.catalogo.existe('CANCELAMENTO'):
                 cancelamentos = list(self.db.CANCELAMENTO.find({}))
                 for cancel in cancelamentos:
                     todas_movimentacoes.append({
@@ -407,13 +409,24 @@ class DetectorFraude:
             print(f" Erro ao analisar reincidências: {e}")
             return []
     
-    def executar_analise_completa_fraude(self) -> Dict[str, Any]:
+    def executar_analise_completa_fraude(self, callback_progresso: Optional[Callable[[Dict[str, Any]], None]] = None) -> Dict[str, Any]:
         """
         Executa análise completa de fraude com todos os algoritmos.
+        A análise é rastreada (dentro de uma pergunta, os spans entram no rastro dela).
+        
+        Args:
+            callback_progresso: Função chamada no início e no fim de cada algoritmo
         
         Returns:
             Relatório completo de análise de fraude
         """
+        with rastrear(COMPONENTE_FRAUDE, "analise_fraude") as rastro:
+            relatorio = self._executar_algoritmos(callback_progresso)
+            rastro.definir(suspeitas=relatorio['total_suspeitas'])
+        return relatorio
+    
+    def _executar_algoritmos(self, callback_progresso: Optional[Callable[[Dict[str, Any]], None]]) -> Dict[str, Any]:
+        """Executa os algoritmos de detecção e monta o relatório (ver executar_analise_completa_fraude)."""
         print("Iniciando análise completa de detecção de fraude...")
         
         inicio_analise = datetime.now()
@@ -428,14 +441,27 @@ class DetectorFraude:
             ('Reincidências', self.detectar_clientes_produtos_reincidentes)
         ]
         
-        for nome_algoritmo, funcao_algoritmo in algoritmos:
+        for indice, (nome_algoritmo, funcao_algoritmo) in enumerate(algoritmos, 1):
             print(f"\n Executando: {nome_algoritmo}")
+            progresso = {'etapa': nome_algoritmo, 'indice': indice, 'total': len(algoritmos)}
+            self._notificar_progresso(callback_progresso, {**progresso, 'status': 'iniciado'})
+            inicio_algoritmo = datetime.now()
             try:
-                suspeitas = funcao_algoritmo()
+                # Um span por detector (duração e suspeitas no rastro e em /metrics)
+                with span(COMPONENTE_FRAUDE, funcao_algoritmo.__name__) as estagio:
+                    suspeitas = funcao_algoritmo()
+                    estagio.definir(suspeitas=len(suspeitas))
                 todas_suspeitas.extend(suspeitas)
                 print(f" {nome_algoritmo}: {len(suspeitas)} suspeitas encontradas")
+                self._notificar_progresso(callback_progresso, {
+                    **progresso,
+                    'status': 'concluido',
+                    'suspeitas': len(suspeitas),
+                    'tempo_segundos': round((datetime.now() - inicio_algoritmo).total_seconds(), 2)
+                })
             except Exception as e:
                 print(f" Erro em {nome_algoritmo}: {e}")
+                self._notificar_progresso(callback_progresso, {**progresso, 'status': 'erro', 'erro': str(e)})
         
         fim_analise = datetime.now()
         tempo_analise = (fim_analise - inicio_analise).total_seconds()
@@ -457,6 +483,15 @@ class DetectorFraude:
         
         return relatorio
     
+    def _notificar_progresso(self, callback_progresso: Optional[Callable], dados: Dict[str, Any]):
+        """Envia um evento de progresso sem interromper a análise em caso de erro."""
+        if callback_progresso is None:
+            return
+        try:
+            callback_progresso(dados)
+        except Exception as e:
+            print(f" Erro ao notificar progresso: {e}")
+    
     def _converter_valor(self, valor_str: str) -> float:
         """Converte string de valor para float."""
         try:
@@ -503,7 +538,7 @@ class DetectorFraude:
                     stats[loja]['total_trocas'] += 1
         
         # Analisar cancelamentos
-        if 'CANCELAMENTO' in self.db.list_collection_names():
+        if self.catalogo.existe('CANCELAMENTO'):
             cancelamentos = list(self.db.CANCELAMENTO.find({}))
             for cancel in cancelamentos:
                 loja = cancel.get('LOJA', '')
@@ -542,7 +577,7 @@ class DetectorFraude:
                 stats[cliente]['skus_envolvidos'].add(dev.get('SKU', ''))
         
         # Analisar cancelamentos
-        if 'CANCELAMENTO' in self.db.list_collection_names():
+        if self.catalogo.existe('CANCELAMENTO'):
             cancelamentos = list(self.db.CANCELAMENTO.find({}))
             for cancel in cancelamentos:
                 cliente = cancel.get('IDUSUARIO', '')
@@ -553,7 +588,7 @@ class DetectorFraude:
                     stats[cliente]['skus_envolvidos'].add(cancel.get('SKU', ''))
         
         # Analisar ajustes
-        if 'AJUSTES ESTOQUE' in self.db.list_collection_names():
+        if self.catalogo.existe('AJUSTES ESTOQUE'):
             ajustes = list(self.db['AJUSTES ESTOQUE'].find({}))
             for ajuste in ajustes:
                 cliente = ajuste.get('IDUSUARIO', '')
@@ -588,7 +623,7 @@ class DetectorFraude:
                 stats[sku]['clientes_envolvidos'].add(dev.get('IDUSUARIO', ''))
         
         # Analisar cancelamentos
-        if 'CANCELAMENTO' in self.db.list_collection_names():
+        if self.catalogo.existe('CANCELAMENTO'):
             cancelamentos = list(self.db.CANCELAMENTO.find({}))
             for cancel in cancelamentos:
                 sku = cancel.get('SKU', '')
@@ -599,7 +634,7 @@ class DetectorFraude:
                     stats[sku]['clientes_envolvidos'].add(cancel.get('IDUSUARIO', ''))
         
         # Analisar ajustes
-        if 'AJUSTES ESTOQUE' in self.db.list_collection_names():
+        if self.catalogo.existe('AJUSTES ESTOQUE'):
             ajustes = list(self.db['AJUSTES ESTOQUE'].find({}))
             for ajuste in ajustes:
                 sku = ajuste.get('SKU', '')
@@ -681,6 +716,11 @@ class DetectorFraude:
         Returns:
             BytesIO com o arquivo Excel
         """
+        # openpyxl só é carregado quando um relatório é exportado
+        from openpyxl import Workbook
+        from openpyxl.styles import Font, PatternFill, Alignment, Border, Side
+        from openpyxl.utils import get_column_letter
+        
         try:
             # Criar workbook
             wb = Workbook()
@@ -0,0 +1,266 @@
+"""
+Camada de dimensão de datas.
+Os CSVs são importados com todas as colunas como texto, então as datas ficam
+no formato "DD/MM/AAAA", que não ordena nem compara como data. Para cada campo
+de data é mantido um campo derivado tipado (_ts_<CAMPO>, datetime) com índice,
+preenchido na importação e, para dados antigos, por uma atualização no próprio
+servidor.
+
+O executor de intervalos usa o campo tipado quando disponível (intervalo
+[início, fim + 1 dia) indexado) e, enquanto ele não existe, expande o
+intervalo nos dias que contém. Também agrupa contagens por dia, semana ou mês.
+"""
+
+import threading
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional, TYPE_CHECKING
+from pymongo import MongoClient
+from database import db_config
+from modules.catalogo_colecoes import obter_catalogo
+from modules.eventos_colecoes import registrar_ouvinte, PRIORIDADE_DERIVADOS, EVENTO_EXCLUSAO
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+
+PREFIXO_CAMPO_TIPADO = "_ts_"
+FORMATO_DATA = "%d/%m/%Y"
+
+# Acima disso, sem o campo tipado, o intervalo é comparado convertendo a data no servidor
+MAX_DIAS_EXPANSAO = 1000
+
+# Granularidade -> formato do $dateToString (semana ISO: ano-semana)
+GRANULARIDADES = {
+    "dia": "%Y-%m-%d",
+    "semana": "%G-S%V",
+    "mes": "%Y-%m"
+}
+
+
+def campo_tipado(campo: str) -> str:
+    """Nome do campo derivado tipado de um campo de data."""
+    return f"{PREFIXO_CAMPO_TIPADO}{campo}"
+
+
+def eh_campo_data(campo: str) -> bool:
+    """Campos de data seguem a convenção de nome das planilhas (contêm "DATA")."""
+    return "data" in campo.lower() and not campo.startswith("_")
+
+
+def adicionar_datas_tipadas(df: "pd.DataFrame") -> "pd.DataFrame":
+    """
+    Adiciona ao DataFrame os campos tipados das colunas de data.
+    Valores que não são datas DD/MM/AAAA ficam nulos.
+
+    Args:
+        df: DataFrame com as colunas como texto
+
+    Returns:
+        DataFrame com as colunas _ts_<CAMPO>
+    """
+    # Carregado apenas na importação (o pandas já está em uso por quem chama)
+    import pandas as pd
+
+    for coluna in [col for col in df.columns if eh_campo_data(col)]:
+        serie = pd.to_datetime(df[coluna].str.slice(0, 10), format=FORMATO_DATA, errors="coerce")
+        if serie.notna().any():
+            df[campo_tipado(coluna)] = serie.astype(object).where(serie.notna(), None)
+    return df
+
+
+def expressao_data_texto(campo: str) -> Dict[str, Any]:
+    """Converte no servidor o texto DD/MM/AAAA de um campo em data."""
+    return {"$dateFromString": {
+        "dateString": {"$substrCP": [{"$ifNull": [f"${campo}", ""]}, 0, 10]},
+        "format": FORMATO_DATA,
+        "onError": None,
+        "onNull": None
+    }}
+
+
+def converter_data(texto: str) -> datetime:
+    """Converte DD/MM/AAAA em datetime."""
+    return datetime.strptime(texto, FORMATO_DATA)
+
+
+class DimensaoDatas:
+    """Mantém os campos de data tipados e executa consultas por intervalo."""
+
+    def __init__(self, db=None):
+        self.db = db
+        self.catalogo = obter_catalogo()
+        self._lock = threading.Lock()
+        # (coleção, campo) com o campo tipado preenchido e indexado
+        self._prontos = set()
+        self._em_preparo = {}
+
+    def _obter_db(self):
+        if self.db is None:
+            self.db = MongoClient(db_config.MONGO_URI)[db_config.DB_NAME]
+        return self.db
+
+    def campos_data(self, colecao: str) -> List[str]:
+        """Campos de data da coleção (pelo esquema do catálogo)."""
+        return [campo for campo in self.catalogo.esquema(colecao) if eh_campo_data(campo)]
+
+    def preparar(self, colecao: str, campo: str) -> bool:
+        """
+        Preenche o campo tipado dos documentos que ainda não o têm (no servidor,
+        sem trafegar os documentos) e cria o índice.
+
+        Returns:
+            True se o campo tipado ficou pronto
+        """
+        destino = campo_tipado(campo)
+        colecao_mongo = self._obter_db()[colecao]
+        try:
+            resultado = colecao_mongo.update_many(
+                {destino: {"$exists": False}},
+                [{"$set": {destino: expressao_data_texto(campo)}}]
+            )
+            colecao_mongo.create_index(destino)
+            print(f" Campo tipado {colecao}.{destino} pronto ({resultado.modified_count} documentos atualizados)")
+        except Exception as e:
+            print(f" Erro ao preparar datas tipadas de {colecao}.{campo}: {e}")
+            return False
+
+        with self._lock:
+            self._prontos.add((colecao, campo))
+
+        # Os planos compilados com a expansão de dias passam a usar o índice
+        from modules.planejador_consultas import obter_planejador
+        obter_planejador().invalidar_colecao(colecao)
+        return True
+
+    def preparar_em_segundo_plano(self, colecao: str, campo: str) -> threading.Thread:
+        """Prepara o campo tipado em uma thread, evitando preparos duplicados."""
+        chave = (colecao, campo)
+        with self._lock:
+            thread = self._em_preparo.get(chave)
+            if thread is not None and thread.is_alive():
+                return thread
+
+            def executar():
+                try:
+                    self.preparar(colecao, campo)
+                finally:
+                    with self._lock:
+                        self._em_preparo.pop(chave, None)
+
+            thread = threading.Thread(target=executar, name=f"datas-{colecao}-{campo}", daemon=True)
+            self._em_preparo[chave] = thread
+            thread.start()
+            return thread
+
+    def campo_tipado_pronto(self, colecao: str, campo: str) -> Optional[str]:
+        """
+        Retorna o campo tipado se estiver pronto; caso contrário, inicia o
+        preparo em segundo plano e retorna None.
+        """
+        with self._lock:
+            if (colecao, campo) in self._prontos:
+                return campo_tipado(campo)
+
+        # O índice só é criado depois do preenchimento, então indica preparo concluído
+        try:
+            indices = self._obter_db()[colecao].index_information()
+            if any(info.get("key") and info["key"][0][0] == campo_tipado(campo) for info in indices.values()):
+                with self._lock:
+                    self._prontos.add((colecao, campo))
+                return campo_tipado(campo)
+        except Exception as e:
+            print(f" Erro ao verificar índices de {colecao}: {e}")
+            return None
+
+        self.preparar_em_segundo_plano(colecao, campo)
+        return None
+
+    def filtro_intervalo(self, colecao: str, campo: str, data_inicio: str, data_fim: str) -> Dict[str, Any]:
+        """
+        Filtro ($match) de um intervalo de datas inclusivo.
+
+        Args:
+            colecao: Nome da coleção
+            campo: Campo de data original (texto DD/MM/AAAA)
+            data_inicio: Data inicial DD/MM/AAAA
+            data_fim: Data final DD/MM/AAAA
+
+        Returns:
+            Filtro sobre o campo tipado (indexado) ou, enquanto ele não existe,
+            sobre os textos dos dias do intervalo
+        """
+        inicio, fim = converter_data(data_inicio), converter_data(data_fim)
+        if fim < inicio:
+            inicio, fim = fim, inicio
+
+        destino = self.campo_tipado_pronto(colecao, campo)
+        if destino:
+            return {destino: {"$gte": inicio, "$lt": fim + timedelta(days=1)}}
+
+        dias = (fim - inicio).days + 1
+        if dias <= MAX_DIAS_EXPANSAO:
+            return {campo: {"$in": [(inicio + timedelta(days=i)).strftime(FORMATO_DATA) for i in range(dias)]}}
+
+        return {"$expr": {"$and": [
+            {"$gte": [expressao_data_texto(campo), inicio]},
+            {"$lt": [expressao_data_texto(campo), fim + timedelta(days=1)]}
+        ]}}
+
+    def expressao_periodo(self, colecao: str, campo: str, granularidade: str) -> Dict[str, Any]:
+        """Expressão de agrupamento por dia, semana ou mês."""
+        destino = self.campo_tipado_pronto(colecao, campo)
+        data = f"${destino}" if destino else expressao_data_texto(campo)
+        return {"$dateToString": {"date": data, "format": GRANULARIDADES[granularidade]}}
+
+    def contar(self, colecao: str, campo: str, data_inicio: str, data_fim: str,
+               filtros: Dict[str, Any] = None) -> int:
+        """Conta os documentos do intervalo (e filtros adicionais)."""
+        consulta = dict(filtros or {})
+        consulta.update(self.filtro_intervalo(colecao, campo, data_inicio, data_fim))
+        return self._obter_db()[colecao].count_documents(consulta)
+
+    def agrupar(self, colecao: str, campo: str, data_inicio: str, data_fim: str,
+                granularidade: str = "dia", filtros: Dict[str, Any] = None) -> List[Dict[str, Any]]:
+        """
+        Conta os documentos do intervalo agrupados por dia, semana ou mês.
+
+        Returns:
+            Lista {"_id": período, "count": quantidade} em ordem cronológica
+        """
+        consulta = dict(filtros or {})
+        consulta.update(self.filtro_intervalo(colecao, campo, data_inicio, data_fim))
+        return list(self._obter_db()[colecao].aggregate([
+            {"$match": consulta},
+            {"$group": {"_id": self.expressao_periodo(colecao, campo, granularidade), "count": {"$sum": 1}}},
+            {"$sort": {"_id": 1}}
+        ], allowDiskUse=True))
+
+    def invalidar_colecao(self, colecao: str):
+        """Esquece o estado dos campos tipados da coleção."""
+        with self._lock:
+            self._prontos = {item for item in self._prontos if item[0] != colecao}
+
+
+# Instância global da dimensão de datas
+dimensao_datas = DimensaoDatas()
+
+
+def _ao_alterar_colecao(colecao: str, evento: str, registros=None):
+    """
+    Na exclusão, esquece os campos tipados. Na importação, os novos documentos
+    já chegam com os campos tipados; o preparo garante o índice e preenche os
+    documentos antigos da coleção.
+    """
+    if evento == EVENTO_EXCLUSAO:
+        dimensao_datas.invalidar_colecao(colecao)
+    elif registros:
+        for campo in [campo for campo in registros[0] if eh_campo_data(campo)]:
+            dimensao_datas.preparar_em_segundo_plano(colecao, campo)
+
+
+registrar_ouvinte(_ao_alterar_colecao, PRIORIDADE_DERIVADOS)
+
+
+def obter_dimensao_datas() -> DimensaoDatas:
+    """Retorna a instância global da dimensão de datas."""
+    return dimensao_datas
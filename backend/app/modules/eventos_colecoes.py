@@ -0,0 +1,48 @@
+"""
+Eventos de alteração de coleções.
+Permite que caches e estruturas derivadas sejam notificados quando uma
+coleção recebe uma importação ou é excluída.
+"""
+
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+
+# Eventos suportados
+EVENTO_IMPORTACAO = "importacao"
+EVENTO_EXCLUSAO = "exclusao"
+
+# Prioridades de execução: estruturas derivadas são atualizadas antes
+# dos caches serem invalidados, para que nenhum resultado antigo seja recalculado
+PRIORIDADE_DERIVADOS = 0
+PRIORIDADE_CACHES = 100
+
+_ouvintes: List[Tuple[int, Callable]] = []
+
+
+def registrar_ouvinte(funcao: Callable, prioridade: int = PRIORIDADE_CACHES):
+    """
+    Registra uma função para ser chamada a cada alteração de coleção.
+
+    Args:
+        funcao: Função com assinatura (colecao, evento, registros)
+        prioridade: Ordem de execução (menor executa primeiro)
+    """
+    if all(ouvinte is not funcao for _, ouvinte in _ouvintes):
+        _ouvintes.append((prioridade, funcao))
+        _ouvintes.sort(key=lambda item: item[0])
+
+
+def notificar_alteracao(colecao: str, evento: str, registros: Optional[List[Dict[str, Any]]] = None):
+    """
+    Notifica todos os ouvintes sobre a alteração de uma coleção.
+
+    Args:
+        colecao: Nome da coleção alterada
+        evento: Tipo do evento (importacao ou exclusao)
+        registros: Registros efetivamente inseridos (apenas em importações)
+    """
+    for _, funcao in list(_ouvintes):
+        try:
+            funcao(colecao, evento, registros)
+        except Exception as e:
+            print(f"Erro ao notificar alteração da coleção '{colecao}': {e}")
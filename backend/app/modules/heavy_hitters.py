@@ -0,0 +1,370 @@
+"""
+Ranking aproximado (heavy hitters) para coleções muito grandes.
+Implementa um resumo Space-Saving mesclável, mantido por coleção e dimensão,
+persistido no MongoDB e atualizado a cada lote importado. As contagens
+retornadas são limites superiores com erro máximo conhecido.
+"""
+
+import threading
+from collections import Counter
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Optional
+from bson import ObjectId
+from pymongo import MongoClient
+from pymongo.errors import DuplicateKeyError
+from database import db_config
+from modules.eventos_colecoes import registrar_ouvinte, EVENTO_IMPORTACAO, EVENTO_EXCLUSAO, PRIORIDADE_DERIVADOS
+
+
+# Dimensões resumidas automaticamente quando uma coleção nova é importada
+DIMENSOES_PADRAO = ["SKU", "IDUSUARIO", "LOJA"]
+
+
+class SpaceSaving:
+    """
+    Resumo Space-Saving mesclável.
+
+    Cada item guarda uma contagem superestimada e o erro dessa estimativa
+    (contagem - erro <= frequência real <= contagem). Itens fora do resumo
+    têm frequência real de no máximo `limite_ausentes`.
+    """
+
+    def __init__(self, capacidade: int, itens: Dict[Any, List[int]] = None, total: int = 0, limite_ausentes: int = 0):
+        """
+        Args:
+            capacidade: Número máximo de itens monitorados (k)
+            itens: Mapa valor -> [contagem, erro]
+            total: Total de ocorrências resumidas (N)
+            limite_ausentes: Frequência máxima de qualquer item fora do resumo
+        """
+        self.capacidade = capacidade
+        self.itens = itens or {}
+        self.total = total
+        self.limite_ausentes = limite_ausentes
+
+    @classmethod
+    def de_contagem(cls, contagem: Counter, capacidade: int) -> "SpaceSaving":
+        """Cria um resumo a partir de contagens exatas de um lote."""
+        resumo = cls(capacidade, {valor: [quantidade, 0] for valor, quantidade in contagem.items()}, sum(contagem.values()))
+        resumo._truncar()
+        return resumo
+
+    @classmethod
+    def de_valores(cls, valores: Iterable[Any], capacidade: int, tamanho_bloco: int = 100000) -> "SpaceSaving":
+        """
+        Resume um fluxo de valores com memória limitada ao tamanho do bloco.
+
+        Args:
+            valores: Iterável com os valores da dimensão
+            capacidade: Número máximo de itens monitorados
+            tamanho_bloco: Valores contados exatamente antes de cada mescla
+        """
+        resumo = cls(capacidade)
+        bloco = Counter()
+        for i, valor in enumerate(valores, 1):
+            bloco[valor] += 1
+            if i % tamanho_bloco == 0:
+                resumo = resumo.mesclar(cls.de_contagem(bloco, capacidade))
+                bloco = Counter()
+        if bloco:
+            resumo = resumo.mesclar(cls.de_contagem(bloco, capacidade))
+        return resumo
+
+    def _truncar(self):
+        """Mantém apenas os `capacidade` itens de maior contagem."""
+        if len(self.itens) <= self.capacidade:
+            return
+
+        ordenados = sorted(self.itens.items(), key=lambda item: item[1][0], reverse=True)
+        descartados = ordenados[self.capacidade:]
+        self.itens = dict(ordenados[:self.capacidade])
+        # Um item descartado tinha no máximo a maior contagem descartada
+        self.limite_ausentes = max(self.limite_ausentes, descartados[0][1][0])
+
+    def mesclar(self, outro: "SpaceSaving") -> "SpaceSaving":
+        """
+        Mescla dois resumos, preservando os limites de erro.
+
+        Args:
+            outro: Resumo de outro lote
+
+        Returns:
+            Novo resumo equivalente à união dos dois lotes
+        """
+        capacidade = max(self.capacidade, outro.capacidade)
+        itens = {}
+        for valor in set(self.itens) | set(outro.itens):
+            contagem_a, erro_a = self.itens.get(valor, [self.limite_ausentes, self.limite_ausentes])
+            contagem_b, erro_b = outro.itens.get(valor, [outro.limite_ausentes, outro.limite_ausentes])
+            itens[valor] = [contagem_a + contagem_b, erro_a + erro_b]
+
+        resumo = SpaceSaving(
+            capacidade,
+            itens,
+            self.total + outro.total,
+            self.limite_ausentes + outro.limite_ausentes
+        )
+        resumo._truncar()
+        return resumo
+
+    def top_k(self, k: int, ignorar_nulos: bool = False) -> List[Dict[str, Any]]:
+        """
+        Retorna os k itens mais frequentes.
+
+        Returns:
+            Lista no formato {"_id": valor, "count": estimativa, "erro": erro}
+        """
+        ordenados = sorted(self.itens.items(), key=lambda item: item[1][0], reverse=True)
+        if ignorar_nulos:
+            ordenados = [item for item in ordenados if item[0] is not None]
+        return [{"_id": valor, "count": contagem, "erro": erro} for valor, (contagem, erro) in ordenados[:k]]
+
+    @property
+    def erro_maximo(self) -> int:
+        """Maior erro possível de qualquer estimativa do resumo."""
+        erros = [erro for _, erro in self.itens.values()]
+        return max([self.limite_ausentes] + erros)
+
+    @property
+    def erro_teorico(self) -> float:
+        """Garantia do Space-Saving: erro de no máximo N/k."""
+        return self.total / max(self.capacidade, 1)
+
+    def para_documento(self) -> Dict[str, Any]:
+        """Serializa o resumo para persistência."""
+        return {
+            "capacidade": self.capacidade,
+            "total": self.total,
+            "limite_ausentes": self.limite_ausentes,
+            "itens": [[valor, contagem, erro] for valor, (contagem, erro) in self.itens.items()]
+        }
+
+    @classmethod
+    def de_documento(cls, documento: Dict[str, Any]) -> "SpaceSaving":
+        """Reconstrói um resumo persistido."""
+        return cls(
+            documento["capacidade"],
+            {valor: [contagem, erro] for valor, contagem, erro in documento.get("itens", [])},
+            documento.get("total", 0),
+            documento.get("limite_ausentes", 0)
+        )
+
+
+class SketchesHeavyHitters:
+    """Resumos Space-Saving por coleção e dimensão, persistidos no MongoDB."""
+
+    def __init__(self, mongo_uri: str = None, database_name: str = None, capacidade: int = None):
+        """
+        Args:
+            mongo_uri: URI de conexão MongoDB
+            database_name: Nome do banco de dados
+            capacidade: Itens monitorados por resumo (k)
+        """
+        self.mongo_uri = mongo_uri or db_config.MONGO_URI
+        self.database_name = database_name or db_config.DB_NAME
+        self.capacidade = capacidade or db_config.CAPACIDADE_SKETCH
+        self.db = None
+        self.sketches = None
+        self._construcoes = {}
+        self._lock = threading.Lock()
+
+    def conectar(self):
+        """Conecta ao MongoDB."""
+        if self.db is not None:
+            return
+
+        with self._lock:
+            if self.db is None:
+                db = MongoClient(self.mongo_uri)[self.database_name]
+                self.sketches = db[db_config.COLECAO_SKETCHES]
+                self.sketches.create_index("colecao")
+                self.db = db
+
+    @staticmethod
+    def _id_sketch(colecao: str, dimensao: str) -> str:
+        return f"{colecao}|{dimensao}"
+
+    def obter(self, colecao: str, dimensao: str) -> Optional[SpaceSaving]:
+        """Carrega o resumo de uma dimensão, se existir (e não for só o marcador de uma construção)."""
+        self.conectar()
+        documento = self.sketches.find_one({"_id": self._id_sketch(colecao, dimensao)})
+        if documento is None or documento.get("pronto") is False:
+            return None
+        return SpaceSaving.de_documento(documento)
+
+    def construir(self, colecao: str, dimensao: str) -> Optional[SpaceSaving]:
+        """
+        Constrói o resumo percorrendo a coleção uma vez com projeção de um campo.
+
+        Antes da varredura, o documento do resumo recebe a marca da construção
+        (criando um marcador, se ainda não existir). Enquanto a marca estiver lá,
+        mesclar_lote soma cada lote importado também em "delta_construcao"; no
+        fim, o resumo varrido é mesclado a esse delta e publicado com controle
+        de versão. Um lote visto pela varredura e pelo delta é contado duas
+        vezes, o que mantém as estimativas como limites superiores.
+
+        Args:
+            colecao: Nome da coleção
+            dimensao: Campo resumido
+
+        Returns:
+            Resumo publicado, ou None se a construção foi substituída por outra
+            ou o resumo foi removido durante a varredura
+        """
+        self.conectar()
+        inicio = datetime.now()
+        id_sketch = self._id_sketch(colecao, dimensao)
+        marca = ObjectId()
+        self.sketches.update_one(
+            {"_id": id_sketch},
+            {
+                "$set": {"construcao": marca, "delta_construcao": SpaceSaving(self.capacidade).para_documento()},
+                "$inc": {"versao": 1},
+                "$setOnInsert": {"colecao": colecao, "dimensao": dimensao, "pronto": False,
+                                 **SpaceSaving(self.capacidade).para_documento()}
+            },
+            upsert=True
+        )
+
+        cursor = self.db[colecao].find({}, {dimensao: 1, "_id": 0}, batch_size=10000)
+        resumo = SpaceSaving.de_valores((doc.get(dimensao) for doc in cursor), self.capacidade)
+
+        for _ in range(5):
+            documento = self.sketches.find_one({"_id": id_sketch})
+            if documento is None or documento.get("construcao") != marca:
+                print(f"Construção do resumo {id_sketch} descartada: substituída ou resumo removido")
+                return None
+
+            final = resumo.mesclar(SpaceSaving.de_documento(documento["delta_construcao"]))
+            versao = documento.get("versao", 1)
+            resultado = self.sketches.replace_one(
+                {"_id": id_sketch, "versao": versao},
+                {"colecao": colecao, "dimensao": dimensao, "versao": versao + 1,
+                 "atualizado_em": datetime.now(), **final.para_documento()}
+            )
+            if resultado.matched_count:
+                tempo = (datetime.now() - inicio).total_seconds()
+                print(f"Resumo heavy hitters construído: {colecao}.{dimensao} ({final.total} valores) em {tempo:.2f}s")
+                return final
+
+        print(f"Não foi possível publicar o resumo {id_sketch} após várias tentativas")
+        return None
+
+    def construir_em_segundo_plano(self, colecao: str, dimensao: str) -> threading.Thread:
+        """
+        Inicia (ou reaproveita) a construção do resumo de uma dimensão em uma thread.
+        Usado nas coleções importadas antes de existirem resumos, que não são
+        cobertas por atualizar_importacao.
+
+        Returns:
+            Thread da construção em andamento
+        """
+        chave = self._id_sketch(colecao, dimensao)
+        with self._lock:
+            thread = self._construcoes.get(chave)
+            if thread is not None and thread.is_alive():
+                return thread
+
+            def executar():
+                try:
+                    self.construir(colecao, dimensao)
+                except Exception as e:
+                    print(f"Erro ao construir resumo heavy hitters {chave}: {e}")
+                finally:
+                    with self._lock:
+                        self._construcoes.pop(chave, None)
+
+            thread = threading.Thread(target=executar, name=f"sketch-{chave}", daemon=True)
+            self._construcoes[chave] = thread
+            thread.start()
+            return thread
+
+    def mesclar_lote(self, colecao: str, dimensao: str, registros: List[Dict[str, Any]], criar: bool = False):
+        """
+        Mescla o resumo de um lote importado ao resumo persistido.
+        Usa controle otimista de versão para suportar vários workers.
+
+        Args:
+            colecao: Nome da coleção
+            dimensao: Campo resumido
+            registros: Registros inseridos no lote
+            criar: Se True, cria o resumo quando ainda não existir
+        """
+        self.conectar()
+        lote = SpaceSaving.de_contagem(Counter(registro.get(dimensao) for registro in registros), self.capacidade)
+        id_sketch = self._id_sketch(colecao, dimensao)
+
+        for _ in range(5):
+            documento = self.sketches.find_one({"_id": id_sketch})
+            if documento is None:
+                if not criar:
+                    return
+                novo = {"_id": id_sketch, "colecao": colecao, "dimensao": dimensao, "versao": 1,
+                        "atualizado_em": datetime.now(), **lote.para_documento()}
+                try:
+                    self.sketches.insert_one(novo)
+                    return
+                except DuplicateKeyError:
+                    continue  # Outro worker criou o resumo: tentar mesclar
+
+            resumo = SpaceSaving.de_documento(documento).mesclar(lote)
+            versao = documento.get("versao", 1)
+            substituto = {"colecao": colecao, "dimensao": dimensao, "versao": versao + 1,
+                          "atualizado_em": datetime.now(), **resumo.para_documento()}
+            if "construcao" in documento:
+                # Construção em andamento: o lote também entra no delta que ela vai mesclar
+                delta = SpaceSaving.de_documento(documento["delta_construcao"]).mesclar(lote)
+                substituto.update({"construcao": documento["construcao"], "delta_construcao": delta.para_documento()})
+                if documento.get("pronto") is False:
+                    substituto["pronto"] = False
+            resultado = self.sketches.replace_one({"_id": id_sketch, "versao": versao}, substituto)
+            if resultado.matched_count:
+                return
+
+        print(f"Não foi possível mesclar o resumo {id_sketch} após várias tentativas")
+
+    def atualizar_importacao(self, colecao: str, registros: List[Dict[str, Any]]):
+        """
+        Atualiza os resumos de uma coleção com os registros de uma importação.
+        Coleções novas ganham resumos das dimensões padrão; nas demais, apenas
+        resumos já existentes são mesclados (um resumo parcial seria incorreto).
+        """
+        if not registros:
+            return
+
+        self.conectar()
+        existentes = {doc["dimensao"] for doc in self.sketches.find({"colecao": colecao}, {"dimensao": 1})}
+        colecao_nova = self.db[colecao].estimated_document_count() <= len(registros)
+        campos = set(registros[0].keys())
+
+        dimensoes = set(existentes)
+        if colecao_nova:
+            dimensoes.update(dim for dim in DIMENSOES_PADRAO if dim in campos)
+
+        for dimensao in dimensoes:
+            self.mesclar_lote(colecao, dimensao, registros, criar=colecao_nova)
+
+    def remover_colecao(self, colecao: str):
+        """Remove os resumos de uma coleção."""
+        self.conectar()
+        self.sketches.delete_many({"colecao": colecao})
+
+
+# Instância global dos resumos
+sketches_heavy_hitters = SketchesHeavyHitters()
+
+
+def _ao_alterar_colecao(colecao: str, evento: str, registros=None):
+    """Mantém os resumos sincronizados com importações e exclusões."""
+    if evento == EVENTO_IMPORTACAO:
+        sketches_heavy_hitters.atualizar_importacao(colecao, registros)
+    elif evento == EVENTO_EXCLUSAO:
+        sketches_heavy_hitters.remover_colecao(colecao)
+
+
+registrar_ouvinte(_ao_alterar_colecao, PRIORIDADE_DERIVADOS)
+
+
+def obter_sketches() -> SketchesHeavyHitters:
+    """Retorna a instância global dos resumos heavy hitters."""
+    return sketches_heavy_hitters
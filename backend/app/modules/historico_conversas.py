@@ -4,10 +4,13 @@ Salva e carrega conversas do MongoDB para manter o histórico entre sessões.
 """
 
 import json
+import uuid
 from datetime import datetime
 from typing import List, Dict, Any
 from pymongo import MongoClient
 from database import db_config
+from modules.renderizacao_respostas import renderizar_resposta
+from modules.respostas_estruturadas import contem_marcadores
 
 
 class GerenciadorHistorico:
@@ -45,10 +48,11 @@ class GerenciadorHistorico:
             raise
     
     def gerar_id_sessao(self) -> str:
-        """Gera um ID único para a sessão atual."""
-        return f"session_{datetime.now().strftime('%Y%m%d_%H%M%S')}"
+        """Gera um ID único para uma nova sessão."""
+        return f"session_{datetime.now().strftime('%Y%m%d_%H%M%S')}_{uuid.uuid4().hex[:8]}"
     
-    def salvar_mensagem(self, sessao_id: str, tipo: str, conteudo: str, timestamp: datetime = None) -> str:
+    def salvar_mensagem(self, sessao_id: str, tipo: str, conteudo: str, timestamp: datetime = None,
+                        caminho: str = None, estruturada: Dict[str, Any] = None) -> str:
         """
         Salva uma mensagem no histórico.
         
@@ -57,6 +61,9 @@ class GerenciadorHistorico:
             tipo: 'usuario' ou 'agente'
             conteudo: Conteúdo da mensagem
             timestamp: Timestamp da mensagem (opcional)
+            caminho: Caminho que produziu a resposta do agente ("llm", "consulta_direta"...)
+            estruturada: Resposta estruturada; guardada quando o conteúdo tem marcadores
+                de tabela, cujo HTML só é gerado ao carregar a sessão
             
         Returns:
             ID da mensagem salva
@@ -74,6 +81,10 @@ class GerenciadorHistorico:
             "timestamp": timestamp,
             "criado_em": datetime.now()
         }
+        if caminho:
+            mensagem["caminho"] = caminho
+        if estruturada and contem_marcadores(conteudo):
+            mensagem["estruturada"] = estruturada
         
         try:
             resultado = self.colecao_historico.insert_one(mensagem)
@@ -83,12 +94,13 @@ class GerenciadorHistorico:
             print(f"Erro ao salvar mensagem: {e}")
             return None
     
-    def carregar_historico_sessao(self, sessao_id: str) -> List[Dict[str, Any]]:
+    def carregar_historico_sessao(self, sessao_id: str, renderizar: bool = True) -> List[Dict[str, Any]]:
         """
         Carrega o histórico de uma sessão específica.
         
         Args:
             sessao_id: ID da sessão
+            renderizar: Se True, gera o HTML das tabelas guardadas na forma estruturada
             
         Returns:
             Lista de mensagens ordenadas por timestamp
@@ -106,6 +118,8 @@ class GerenciadorHistorico:
             # Converter ObjectId para string
             for msg in mensagens:
                 msg['_id'] = str(msg['_id'])
+                if renderizar and 'estruturada' in msg:
+                    msg['conteudo'] = renderizar_resposta(msg['conteudo'], msg.pop('estruturada'))
                 if 'timestamp' in msg and isinstance(msg['timestamp'], datetime):
                     msg['timestamp'] = msg['timestamp'].isoformat()
                 if 'criado_em' in msg and isinstance(msg['criado_em'], datetime):
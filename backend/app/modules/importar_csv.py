@@ -4,6 +4,10 @@ from pymongo import MongoClient, errors
 from database import db_config
 from utils.utils import carregar_csv, corrigir_encoding_dataframe
 from errors.error_handler import ImportErrorHandler
+from modules.eventos_colecoes import notificar_alteracao, EVENTO_IMPORTACAO
+from modules.dimensao_datas import adicionar_datas_tipadas
+from modules.rankings_materializados import obter_rankings
+from modules.rastreamento import rastrear, span, COMPONENTE_IMPORTACAO
 
 
 def normalizar_dataframe(df, nome_arquivo):
@@ -29,32 +33,59 @@ def gerar_hash_colunas(df):
 
 
 def importar_csv_para_mongo(caminho, nome_arquivo=None):
-    try:
-        df, nome_base = carregar_csv(caminho)
-        if not nome_arquivo:
-            nome_arquivo = nome_base
+    with rastrear(COMPONENTE_IMPORTACAO, "importacao", arquivo=nome_arquivo or str(caminho)) as rastro:
+        try:
+            with span(COMPONENTE_IMPORTACAO, "ler_csv") as estagio:
+                df, nome_base = carregar_csv(caminho)
+                estagio.definir(linhas=len(df))
+            if not nome_arquivo:
+                nome_arquivo = nome_base
+            rastro.definir(colecao=nome_arquivo)
 
-        df = normalizar_dataframe(df, nome_arquivo)
-        df["_hash"] = gerar_hash_colunas(df)
+            with span(COMPONENTE_IMPORTACAO, "normalizar"):
+                df = normalizar_dataframe(df, nome_arquivo)
+            with span(COMPONENTE_IMPORTACAO, "hash"):
+                df["_hash"] = gerar_hash_colunas(df)
+            # Depois do hash, para que as colunas derivadas não alterem a deduplicação
+            with span(COMPONENTE_IMPORTACAO, "datas_tipadas"):
+                df = adicionar_datas_tipadas(df)
 
-        client = MongoClient(db_config.MONGO_URI)
-        db = client[db_config.DB_NAME]
-        colecao = db[nome_arquivo]
+            client = MongoClient(db_config.MONGO_URI)
+            db = client[db_config.DB_NAME]
+            colecao = db[nome_arquivo]
 
-        try:
-            colecao.create_index("_hash", unique=True)
-        except errors.OperationFailure:
-            pass
+            try:
+                colecao.create_index("_hash", unique=True)
+            except errors.OperationFailure:
+                pass
 
-        registros = df.to_dict(orient="records")
+            registros = df.to_dict(orient="records")
 
-        try:
-            result = colecao.insert_many(registros, ordered=False)
-            inseridos = len(result.inserted_ids)
-        except errors.BulkWriteError as bwe:
-            inseridos = bwe.details["nInserted"]
+            # Inserção e notificação registradas: uma reconstrução de ranking aguarda ou conta estes registros
+            with obter_rankings().registrar_importacao(nome_arquivo) as marcas:
+                if marcas:
+                    for registro in registros:
+                        registro.update(marcas)
+
+                with span(COMPONENTE_IMPORTACAO, "inserir") as estagio:
+                    try:
+                        result = colecao.insert_many(registros, ordered=False)
+                        inseridos = len(result.inserted_ids)
+                        registros_inseridos = registros
+                    except errors.BulkWriteError as bwe:
+                        inseridos = bwe.details["nInserted"]
+                        # Com ordered=False, apenas as linhas com erro (duplicadas) não foram inseridas
+                        indices_erro = {erro["index"] for erro in bwe.details.get("writeErrors", [])}
+                        registros_inseridos = [r for i, r in enumerate(registros) if i not in indices_erro]
+                    estagio.definir(registros=len(registros), inseridos=inseridos, duplicados=len(registros) - inseridos)
+
+                print(f"Inseridos {inseridos} novos registros na coleção '{nome_arquivo}'")
 
-        print(f"Inseridos {inseridos} novos registros na coleção '{nome_arquivo}'")
+                if inseridos:
+                    # Caches, rankings, sketches e índices derivados
+                    with span(COMPONENTE_IMPORTACAO, "notificar"):
+                        notificar_alteracao(nome_arquivo, EVENTO_IMPORTACAO, registros_inseridos)
 
-    except Exception as e:
-        ImportErrorHandler.erro_generico(e)
+        except Exception as e:
+            rastro.definir(erro=str(e))
+            ImportErrorHandler.erro_generico(e)
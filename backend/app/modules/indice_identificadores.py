@@ -0,0 +1,261 @@
+"""
+Busca de identificadores (SKU, IDUSUARIO, LOJA, ID_DEVOLUCAO) em todas as coleções.
+Para cada coleção, guarda em memória apenas quais campos identificadores ela
+tem e se o índice de cada um já foi garantido no MongoDB. Uma busca por
+"SKU 123456" consulta só as coleções que têm o campo, com uma igualdade sobre
+o índice dele (um $match indexado seguido da contagem das variantes do valor).
+
+Não há lista de valores em memória: campos como ID_DEVOLUCAO são únicos por
+registro, e manter um dicionário por valor em cada worker custaria uma
+agregação completa por campo e memória proporcional à coleção. Os índices do
+MongoDB são garantidos de forma preguiçosa, na primeira busca em cada
+coleção (e a cada importação de uma coleção já preparada com campos novos);
+até lá a busca na coleção é feita sem a garantia do índice.
+"""
+
+import re
+import threading
+import time
+from typing import Any, Dict, List, Tuple
+from pymongo import MongoClient
+from database import db_config
+from modules.catalogo_colecoes import obter_catalogo
+from modules.eventos_colecoes import registrar_ouvinte, PRIORIDADE_DERIVADOS, EVENTO_EXCLUSAO
+
+
+# Campo identificador -> palavras que o antecedem na pergunta
+CAMPOS_IDENTIFICADORES = {
+    "SKU": r"sku|produto|item|c[óo]digo",
+    "IDUSUARIO": r"idusuario|usu[áa]rio|cliente",
+    "LOJA": r"loja|filial",
+    "ID_DEVOLUCAO": r"id[_\s]?devolu[çc][ãa]o|devolu[çc][ãa]o"
+}
+
+# Valor logo após a palavra: "sku 123456", "usuário nº 987", "loja: 12", "devolução #555"
+PADRAO_VALOR = r"\s*(?:n[º°o]\.?\s*|#\s*|:\s*)?([a-z0-9\-]*\d[a-z0-9\-]*)\b(?!/)"
+
+_padroes = {
+    campo: re.compile(rf"\b(?:{palavras}){PADRAO_VALOR}", re.IGNORECASE)
+    for campo, palavras in CAMPOS_IDENTIFICADORES.items()
+}
+
+
+def normalizar_identificador(valor: Any) -> str:
+    """Forma usada como chave do índice (texto sem espaços, em maiúsculas)."""
+    return str(valor).strip().upper()
+
+
+def extrair_identificadores(texto: str) -> Dict[str, List[str]]:
+    """
+    Extrai os identificadores mencionados em um texto.
+
+    Returns:
+        Dicionário campo -> valores normalizados (vazio se não houver)
+    """
+    identificadores = {}
+    for campo, padrao in _padroes.items():
+        valores = []
+        for encontrado in padrao.finditer(texto):
+            valor = normalizar_identificador(encontrado.group(1))
+            if valor not in valores:
+                valores.append(valor)
+        if valores:
+            identificadores[campo] = valores
+    return identificadores
+
+
+class IndiceIdentificadores:
+    """Campos identificadores de cada coleção, com o índice do MongoDB garantido."""
+
+    def __init__(self, db=None, limite_documentos: int = None):
+        """
+        Args:
+            db: Banco MongoDB (conecta ao banco configurado se omitido)
+            limite_documentos: Registros devolvidos por coleção em cada busca
+        """
+        self.db = db
+        self.catalogo = obter_catalogo()
+        self.limite_documentos = limite_documentos or db_config.BUSCA_IDENTIFICADOR_LIMITE
+        self._lock = threading.Lock()
+        self._colecoes: Dict[str, List[str]] = {}
+        self._em_preparo = {}
+        self.buscas = 0
+        self.buscas_diretas = 0
+
+    def _obter_db(self):
+        if self.db is None:
+            self.db = MongoClient(db_config.MONGO_URI)[db_config.DB_NAME]
+        return self.db
+
+    def campos_colecao(self, colecao: str) -> List[str]:
+        """Campos identificadores presentes na coleção."""
+        esquema = self.catalogo.esquema(colecao)
+        return [campo for campo in CAMPOS_IDENTIFICADORES if campo in esquema]
+
+    def preparar(self, colecao: str, campos: List[str] = None) -> bool:
+        """
+        Garante o índice de cada campo identificador da coleção no MongoDB.
+
+        Args:
+            colecao: Nome da coleção
+            campos: Campos a garantir (padrão: os do esquema da coleção)
+
+        Returns:
+            True se a coleção ficou preparada
+        """
+        inicio = time.perf_counter()
+        colecao_mongo = self._obter_db()[colecao]
+        campos = campos or self.campos_colecao(colecao)
+        try:
+            for campo in campos:
+                colecao_mongo.create_index(campo, background=True)
+        except Exception as e:
+            print(f" Erro ao indexar identificadores de {colecao}: {e}")
+            return False
+
+        with self._lock:
+            preparados = self._colecoes.setdefault(colecao, [])
+            preparados.extend(campo for campo in campos if campo not in preparados)
+        print(f" Identificadores de {colecao} indexados: {', '.join(campos) or 'nenhum campo'} "
+              f"em {time.perf_counter() - inicio:.2f}s")
+        return True
+
+    def preparar_em_segundo_plano(self, colecoes: List[str], campos: List[str] = None) -> threading.Thread:
+        """Garante os índices das coleções em uma thread, evitando preparos duplicados."""
+        chave = tuple(sorted(colecoes))
+        with self._lock:
+            thread = self._em_preparo.get(chave)
+            if thread is not None and thread.is_alive():
+                return thread
+
+            def executar():
+                try:
+                    for colecao in colecoes:
+                        self.preparar(colecao, campos)
+                finally:
+                    with self._lock:
+                        self._em_preparo.pop(chave, None)
+
+            thread = threading.Thread(target=executar, name="indice-identificadores", daemon=True)
+            self._em_preparo[chave] = thread
+            thread.start()
+            return thread
+
+    def indexada(self, colecao: str) -> bool:
+        """Indica se os índices da coleção já foram garantidos."""
+        with self._lock:
+            return colecao in self._colecoes
+
+    def campos_novos(self, colecao: str, registros: List[Dict[str, Any]]) -> List[str]:
+        """Campos identificadores dos registros importados ainda sem índice garantido."""
+        with self._lock:
+            preparados = self._colecoes.get(colecao, [])
+        presentes = set().union(*(registro.keys() for registro in registros))
+        return [campo for campo in CAMPOS_IDENTIFICADORES if campo in presentes and campo not in preparados]
+
+    def remover_colecao(self, colecao: str):
+        """Descarta a coleção excluída."""
+        with self._lock:
+            self._colecoes.pop(colecao, None)
+
+    def _buscar(self, colecao: str, campo: str, valor: str) -> List[Tuple[Any, int]]:
+        """
+        Valores gravados que correspondem ao identificador e o total de cada um
+        (igualdade sobre o índice do campo; o valor pode estar como texto ou número).
+        """
+        variantes = [valor, valor.lower()]
+        if valor.isdigit():
+            variantes.extend([int(valor), float(valor)])
+        pipeline = [
+            {"$match": {campo: {"$in": variantes}}},
+            {"$group": {"_id": f"${campo}", "total": {"$sum": 1}}}
+        ]
+        return [(item["_id"], item["total"]) for item in self._obter_db()[colecao].aggregate(pipeline)]
+
+    def localizar(self, campo: str, valor: str) -> List[Dict[str, Any]]:
+        """
+        Coleções em que o identificador aparece.
+
+        Returns:
+            Lista {"colecao", "campo", "valor", "total"} (valor como gravado no banco)
+        """
+        chave = normalizar_identificador(valor)
+        encontrados = []
+        pendentes = []
+        for colecao in self.catalogo.nomes():
+            if campo not in self.campos_colecao(colecao):
+                continue
+            if not self.indexada(colecao):
+                # Primeira busca na coleção: o índice é garantido em segundo plano
+                pendentes.append(colecao)
+                with self._lock:
+                    self.buscas_diretas += 1
+            for original, total in self._buscar(colecao, campo, chave):
+                encontrados.append({"colecao": colecao, "campo": campo, "valor": original, "total": total})
+
+        if pendentes:
+            self.preparar_em_segundo_plano(pendentes)
+        return encontrados
+
+    def consultar(self, identificadores: Dict[str, List[str]], limite: int = None) -> Dict[str, Any]:
+        """
+        Busca os registros dos identificadores em todas as coleções.
+
+        Args:
+            identificadores: Campo -> valores (ver extrair_identificadores)
+            limite: Registros devolvidos por coleção (padrão da configuração)
+
+        Returns:
+            Dicionário com "resultados" (colecao, campo, valor, total, documentos)
+            e "tempo_segundos"
+        """
+        inicio = time.perf_counter()
+        limite = limite or self.limite_documentos
+        with self._lock:
+            self.buscas += 1
+
+        resultados = []
+        for campo, valores in identificadores.items():
+            for valor in valores:
+                for posting in self.localizar(campo, valor):
+                    cursor = self._obter_db()[posting["colecao"]].find(
+                        {campo: posting["valor"]}, {"_id": 0}
+                    ).limit(limite)
+                    documentos = [
+                        {chave: dado for chave, dado in documento.items() if not chave.startswith("_")}
+                        for documento in cursor
+                    ]
+                    resultados.append(dict(posting, documentos=documentos))
+
+        return {"resultados": resultados, "tempo_segundos": round(time.perf_counter() - inicio, 4)}
+
+    def estatisticas(self) -> Dict[str, Any]:
+        """Coleções preparadas e seus campos indexados."""
+        with self._lock:
+            return {
+                "colecoes": {colecao: list(campos) for colecao, campos in self._colecoes.items()},
+                "buscas": self.buscas,
+                "buscas_diretas": self.buscas_diretas
+            }
+
+
+# Instância global do índice
+indice_identificadores = IndiceIdentificadores()
+
+
+def _ao_alterar_colecao(colecao: str, evento: str, registros=None):
+    """Garante o índice dos campos novos de coleções já preparadas ou descarta a coleção excluída."""
+    if evento == EVENTO_EXCLUSAO:
+        indice_identificadores.remover_colecao(colecao)
+    elif registros and indice_identificadores.indexada(colecao):
+        campos = indice_identificadores.campos_novos(colecao, registros)
+        if campos:
+            indice_identificadores.preparar_em_segundo_plano([colecao], campos)
+
+
+registrar_ouvinte(_ao_alterar_colecao, PRIORIDADE_DERIVADOS)
+
+
+def obter_indice_identificadores() -> IndiceIdentificadores:
+    """Retorna a instância global do índice de identificadores."""
+    return indice_identificadores
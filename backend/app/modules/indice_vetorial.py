@@ -0,0 +1,231 @@
+"""
+Índice vetorial configurável (FAISS).
+Em vez de sempre criar um índice plano exato (memória e tempo de busca
+crescem em linha reta com o corpus), o tipo de índice é escolhido pela
+configuração ou pelo tamanho do corpus:
+
+- "flat": busca exata, para corpus pequenos;
+- "hnsw": grafo navegável, busca sublinear com recall alto;
+- "ivf": listas invertidas (k-means), exige treino; com PQ cabe em memória
+  mesmo com milhões de vetores.
+
+O armazenamento dos vetores pode ser comprimido com quantização por produto
+("pq") ou float16 ("fp16"). Os índices que precisam de treino são treinados
+com uma amostra dos próprios vetores antes da inserção.
+
+faiss e numpy são importados só na construção do índice.
+"""
+
+import math
+import time
+from typing import Any, Dict, List, Tuple
+from database import db_config
+
+
+TIPO_AUTOMATICO = "auto"
+TIPO_FLAT = "flat"
+TIPO_IVF = "ivf"
+TIPO_HNSW = "hnsw"
+TIPOS_INDICE = [TIPO_FLAT, TIPO_IVF, TIPO_HNSW]
+
+COMPRESSAO_NENHUMA = "nenhuma"
+COMPRESSAO_PQ = "pq"
+COMPRESSAO_FP16 = "fp16"
+COMPRESSOES = [COMPRESSAO_NENHUMA, COMPRESSAO_PQ, COMPRESSAO_FP16]
+
+# Pontos por centroide recomendados pelo FAISS no treino do k-means
+PONTOS_POR_CENTROIDE = 39
+# Centroides de cada subquantizador do PQ (8 bits)
+CENTROIDES_PQ = 256
+
+
+def escolher_configuracao(quantidade: int) -> Tuple[str, str]:
+    """
+    Escolhe o tipo de índice e a compressão pelo tamanho do corpus.
+
+    Returns:
+        (tipo, compressao)
+    """
+    if quantidade < db_config.VETOR_LIMITE_FLAT:
+        return TIPO_FLAT, COMPRESSAO_NENHUMA
+    if quantidade < db_config.VETOR_LIMITE_HNSW:
+        return TIPO_HNSW, COMPRESSAO_FP16
+    return TIPO_IVF, COMPRESSAO_PQ
+
+
+def resolver_configuracao(quantidade: int, tipo: str = None, compressao: str = None) -> Tuple[str, str]:
+    """
+    Aplica a configuração (ou a escolha automática) e ajusta combinações
+    inviáveis para o tamanho do corpus.
+
+    Returns:
+        (tipo, compressao)
+    """
+    tipo = (tipo or db_config.VETOR_TIPO_INDICE).lower()
+    compressao = (compressao or db_config.VETOR_COMPRESSAO).lower()
+    if tipo == TIPO_AUTOMATICO:
+        tipo_auto, compressao_auto = escolher_configuracao(quantidade)
+        tipo = tipo_auto
+        if compressao == TIPO_AUTOMATICO:
+            compressao = compressao_auto
+    if compressao == TIPO_AUTOMATICO:
+        compressao = COMPRESSAO_NENHUMA
+    if tipo not in TIPOS_INDICE:
+        raise ValueError(f"Tipo de índice vetorial desconhecido: {tipo} (use {', '.join(TIPOS_INDICE)} ou auto)")
+    if compressao not in COMPRESSOES:
+        raise ValueError(f"Compressão desconhecida: {compressao} (use {', '.join(COMPRESSOES)} ou auto)")
+
+    # O PQ precisa de pontos suficientes para treinar seus centroides
+    if compressao == COMPRESSAO_PQ and quantidade < CENTROIDES_PQ * PONTOS_POR_CENTROIDE:
+        compressao = COMPRESSAO_FP16
+    # Poucos vetores para formar listas invertidas
+    if tipo == TIPO_IVF and quantidade < PONTOS_POR_CENTROIDE * 16:
+        tipo = TIPO_FLAT
+    return tipo, compressao
+
+
+def quantidade_listas(quantidade: int) -> int:
+    """Listas do IVF: ~4·√n, limitadas pelos pontos disponíveis para o treino."""
+    return max(1, min(int(4 * math.sqrt(quantidade)), quantidade // PONTOS_POR_CENTROIDE, 65536))
+
+
+def subquantizadores_pq(dimensao: int) -> int:
+    """Maior número de subquantizadores (≤ 64) que divide a dimensão."""
+    for quantidade in (64, 48, 32, 24, 16, 12, 8, 4, 2, 1):
+        if dimensao % quantidade == 0:
+            return quantidade
+    return 1
+
+
+def descricao_fabrica(tipo: str, compressao: str, dimensao: int, quantidade: int) -> str:
+    """
+    Descrição do índice no formato do faiss.index_factory (também usada como
+    rótulo do HNSW, criado direto).
+
+    Exemplos: "Flat", "SQfp16", "IVF400,PQ64", "HNSW32_SQfp16"
+    """
+    armazenamento = {
+        COMPRESSAO_NENHUMA: "Flat",
+        COMPRESSAO_FP16: "SQfp16",
+        COMPRESSAO_PQ: f"PQ{subquantizadores_pq(dimensao)}"
+    }[compressao]
+    if tipo == TIPO_IVF:
+        return f"IVF{quantidade_listas(quantidade)},{armazenamento}"
+    if tipo == TIPO_HNSW:
+        sufixo = "" if compressao == COMPRESSAO_NENHUMA else f"_{armazenamento}"
+        return f"HNSW{db_config.VETOR_HNSW_M}{sufixo}"
+    return armazenamento
+
+
+def _criar_indice(tipo: str, compressao: str, dimensao: int, fabrica: str):
+    """Instancia o índice vazio (o HNSW é criado direto, com o armazenamento escolhido)."""
+    import faiss
+
+    if tipo != TIPO_HNSW:
+        return faiss.index_factory(dimensao, fabrica, faiss.METRIC_L2)
+    if compressao == COMPRESSAO_FP16:
+        indice = faiss.IndexHNSWSQ(dimensao, faiss.ScalarQuantizer.QT_fp16, db_config.VETOR_HNSW_M)
+    elif compressao == COMPRESSAO_PQ:
+        indice = faiss.IndexHNSWPQ(dimensao, subquantizadores_pq(dimensao), db_config.VETOR_HNSW_M)
+    else:
+        indice = faiss.IndexHNSWFlat(dimensao, db_config.VETOR_HNSW_M)
+    indice.hnsw.efConstruction = db_config.VETOR_HNSW_EF_CONSTRUCTION
+    return indice
+
+
+def construir_indice(vetores, tipo: str = None, compressao: str = None) -> Tuple[Any, Dict[str, Any]]:
+    """
+    Cria, treina (quando necessário) e preenche o índice FAISS.
+
+    Args:
+        vetores: Matriz (n, dimensão) de float32
+        tipo: flat, ivf, hnsw ou auto (padrão da configuração)
+        compressao: nenhuma, pq, fp16 ou auto (padrão da configuração)
+
+    Returns:
+        (índice, informações: tipo, compressao, fabrica, vetores, tempos e bytes)
+    """
+    import faiss
+    import numpy as np
+
+    vetores = np.ascontiguousarray(vetores, dtype="float32")
+    quantidade, dimensao = vetores.shape
+    tipo, compressao = resolver_configuracao(quantidade, tipo, compressao)
+    fabrica = descricao_fabrica(tipo, compressao, dimensao, quantidade)
+    indice = _criar_indice(tipo, compressao, dimensao, fabrica)
+
+    # Treino com uma amostra dos próprios vetores
+    inicio = time.perf_counter()
+    if not indice.is_trained:
+        if quantidade > db_config.VETOR_MAX_TREINO:
+            amostra = np.random.default_rng(0).choice(quantidade, db_config.VETOR_MAX_TREINO, replace=False)
+            indice.train(vetores[amostra])
+        else:
+            indice.train(vetores)
+    tempo_treino = time.perf_counter() - inicio
+
+    inicio = time.perf_counter()
+    indice.add(vetores)
+    tempo_adicao = time.perf_counter() - inicio
+
+    configurar_busca(indice, tipo)
+    info = {
+        "tipo": tipo,
+        "compressao": compressao,
+        "fabrica": fabrica,
+        "vetores": quantidade,
+        "dimensao": dimensao,
+        "tempo_treino_segundos": round(tempo_treino, 3),
+        "tempo_adicao_segundos": round(tempo_adicao, 3),
+        "bytes": int(faiss.serialize_index(indice).nbytes)
+    }
+    print(f" Índice vetorial {fabrica}: {quantidade} vetores, {info['bytes'] / 1024 / 1024:.1f} MB, "
+          f"treino {tempo_treino:.2f}s, inserção {tempo_adicao:.2f}s")
+    return indice, info
+
+
+def configurar_busca(indice, tipo: str, nprobe: int = None, ef_search: int = None):
+    """Ajusta os parâmetros de busca (listas visitadas no IVF, candidatos no HNSW)."""
+    import faiss
+
+    parametros = faiss.ParameterSpace()
+    if tipo == TIPO_IVF:
+        parametros.set_index_parameter(indice, "nprobe", nprobe or db_config.VETOR_IVF_NPROBE)
+    elif tipo == TIPO_HNSW:
+        parametros.set_index_parameter(indice, "efSearch", ef_search or db_config.VETOR_HNSW_EF_SEARCH)
+
+
+def criar_vectorstore(documentos: List[Any], embeddings, tipo: str = None,
+                      compressao: str = None) -> Tuple[Any, Dict[str, Any]]:
+    """
+    Gera os embeddings dos documentos e monta o vectorstore FAISS do LangChain
+    sobre o índice configurado.
+
+    Args:
+        documentos: Documentos LangChain
+        embeddings: Modelo de embeddings
+        tipo: Tipo de índice (padrão da configuração)
+        compressao: Compressão dos vetores (padrão da configuração)
+
+    Returns:
+        (vectorstore, informações do índice)
+    """
+    import numpy as np
+    from langchain_community.docstore.in_memory import InMemoryDocstore
+    from langchain_community.vectorstores import FAISS
+
+    inicio = time.perf_counter()
+    vetores = np.array(embeddings.embed_documents([doc.page_content for doc in documentos]), dtype="float32")
+    tempo_embeddings = time.perf_counter() - inicio
+
+    indice, info = construir_indice(vetores, tipo, compressao)
+    info["tempo_embeddings_segundos"] = round(tempo_embeddings, 3)
+
+    ids = [str(posicao) for posicao in range(len(documentos))]
+    vectorstore = FAISS(
+        embedding_function=embeddings,
+        index=indice,
+        docstore=InMemoryDocstore(dict(zip(ids, documentos))),
+        index_to_docstore_id=dict(enumerate(ids))
+    )
+    return vectorstore, info
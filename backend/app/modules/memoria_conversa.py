@@ -0,0 +1,159 @@
+"""
+Memória de conversa com orçamento de tokens.
+Mantém os últimos K turnos literalmente e comprime os turnos mais antigos
+em um resumo incremental, respeitando um limite rígido de tokens do
+histórico enviado a cada pergunta.
+
+O resumo é gerado em segundo plano, em lotes de turnos, depois que a
+resposta já foi entregue: a chamada ao LLM não fica no caminho da pergunta
+(nem segura o lock da sessão). Até o novo resumo ficar pronto, os turnos
+pendentes continuam sendo enviados literalmente, dentro do orçamento.
+"""
+
+import threading
+from typing import Any, Dict, List
+
+from langchain.memory.chat_memory import BaseChatMemory
+from langchain_core.messages import BaseMessage, SystemMessage, get_buffer_string
+# Métricas em módulo próprio, sem dependência do LangChain (lidas pelas estatísticas)
+from modules.metricas_memoria import metricas_memoria
+
+
+PROMPT_RESUMO = """Atualize o resumo da conversa entre um usuário e um assistente de dados,
+incorporando os novos trechos. Mantenha em português, de forma concisa, os fatos,
+coleções, filtros e números citados que possam ser úteis nas próximas perguntas.
+
+Resumo atual:
+{resumo}
+
+Novos trechos:
+{trechos}
+
+Novo resumo:"""
+
+# Protege a troca do resumo pelas threads de resumo (operação curta, sem chamadas ao LLM)
+_lock_resumos = threading.Lock()
+
+
+class MemoriaResumida(BaseChatMemory):
+    """
+    Memória que envia o resumo dos turnos antigos + os últimos K turnos.
+
+    Os turnos que saem da janela ficam pendentes e, a cada lote_resumo
+    turnos, são resumidos pelo LLM em uma thread. Se o histórico montado
+    ainda ultrapassar o orçamento, os turnos literais mais antigos são
+    omitidos da requisição e, por último, o resumo é truncado.
+    """
+
+    llm: Any
+    memory_key: str = "chat_history"
+    max_turnos: int = 4
+    orcamento_tokens: int = 1500
+    lote_resumo: int = 2
+    resumo: str = ""
+    # Turnos que saíram da janela e ainda não entraram no resumo
+    pendentes: List[BaseMessage] = []
+    resumindo: bool = False
+    # Incrementada em clear(): um resumo em andamento de antes da limpeza é descartado
+    geracao_resumo: int = 0
+    # Tamanho que o histórico completo (sem resumo) teria nesta sessão
+    tokens_historico_completo: int = 0
+
+    @property
+    def memory_variables(self) -> List[str]:
+        return [self.memory_key]
+
+    def _contar_tokens(self, mensagens: List[BaseMessage]) -> int:
+        """Conta os tokens das mensagens com o tokenizador do modelo."""
+        if not mensagens:
+            return 0
+        try:
+            return self.llm.get_num_tokens_from_messages(mensagens)
+        except Exception:
+            # Aproximação de ~4 caracteres por token
+            return sum(len(str(m.content)) for m in mensagens) // 4
+
+    def _mensagem_resumo(self, texto: str) -> SystemMessage:
+        return SystemMessage(content=f"Resumo da conversa anterior: {texto}")
+
+    def load_memory_variables(self, inputs: Dict[str, Any]) -> Dict[str, Any]:
+        with _lock_resumos:
+            mensagens = list(self.pendentes) + list(self.chat_memory.messages)
+            resumo = self.resumo
+        prefixo = [self._mensagem_resumo(resumo)] if resumo else []
+
+        # Orçamento rígido: omitir turnos literais mais antigos (pares usuário/agente)
+        descartados = 0
+        while mensagens and self._contar_tokens(prefixo + mensagens) > self.orcamento_tokens:
+            mensagens = mensagens[2:]
+            descartados += 1
+
+        # Se só o resumo já excede o orçamento, truncá-lo proporcionalmente
+        if prefixo and self._contar_tokens(prefixo) > self.orcamento_tokens:
+            tokens_resumo = self._contar_tokens(prefixo)
+            limite = int(len(resumo) * self.orcamento_tokens / tokens_resumo * 0.9)
+            prefixo = [self._mensagem_resumo(resumo[-limite:] if limite > 0 else "")]
+
+        historico = prefixo + mensagens
+        tokens_enviados = self._contar_tokens(historico)
+        metricas_memoria.registrar_envio(max(self.tokens_historico_completo, tokens_enviados), tokens_enviados)
+        if descartados:
+            metricas_memoria.registrar_descarte(descartados)
+
+        if self.return_messages:
+            return {self.memory_key: historico}
+        return {self.memory_key: get_buffer_string(historico)}
+
+    def save_context(self, inputs: Dict[str, Any], outputs: Dict[str, str]) -> None:
+        quantidade_anterior = len(self.chat_memory.messages)
+        super().save_context(inputs, outputs)
+        self.tokens_historico_completo += self._contar_tokens(self.chat_memory.messages[quantidade_anterior:])
+
+        # Os turnos que saíram da janela dos últimos K aguardam o próximo lote de resumo
+        excedentes = len(self.chat_memory.messages) - 2 * self.max_turnos
+        with _lock_resumos:
+            if excedentes > 0:
+                self.pendentes = self.pendentes + self.chat_memory.messages[:excedentes]
+                self.chat_memory.messages = self.chat_memory.messages[excedentes:]
+            if self.resumindo or len(self.pendentes) < 2 * self.lote_resumo:
+                return
+            self.resumindo = True
+            lote, resumo, geracao = list(self.pendentes), self.resumo, self.geracao_resumo
+
+        threading.Thread(
+            target=self._resumir_em_segundo_plano, args=(lote, resumo, geracao),
+            name="resumo-memoria", daemon=True
+        ).start()
+
+    def _resumir_em_segundo_plano(self, lote: List[BaseMessage], resumo: str, geracao: int):
+        """Gera o novo resumo fora da requisição e o publica no lugar dos turnos resumidos."""
+        novo = None
+        try:
+            novo = self._resumir(lote, resumo)
+        finally:
+            with _lock_resumos:
+                self.resumindo = False
+                if novo is not None and geracao == self.geracao_resumo:
+                    self.resumo = novo
+                    # Turnos que saíram da janela durante o resumo ficam para o próximo lote
+                    self.pendentes = self.pendentes[len(lote):]
+
+    def _resumir(self, mensagens: List[BaseMessage], resumo: str) -> str:
+        """Incorpora as mensagens ao resumo usando o LLM."""
+        trechos = get_buffer_string(mensagens, human_prefix="Usuário", ai_prefix="Assistente")
+        try:
+            resposta = self.llm.invoke(PROMPT_RESUMO.format(resumo=resumo or "(vazio)", trechos=trechos))
+            metricas_memoria.registrar_resumo()
+            return str(resposta.content).strip()
+        except Exception as e:
+            print(f" Erro ao resumir conversa: {e}")
+            # Sem LLM, mantém o texto mais recente dentro do orçamento
+            return (f"{resumo}\n{trechos}".strip())[-self.orcamento_tokens * 2:]
+
+    def clear(self) -> None:
+        super().clear()
+        with _lock_resumos:
+            self.resumo = ""
+            self.pendentes = []
+            self.geracao_resumo += 1
+        self.tokens_historico_completo = 0
@@ -0,0 +1,55 @@
+"""
+Métricas agregadas da memória de conversa (tokens enviados, resumos e
+descartes). Ficam fora de modules.memoria_conversa para que as estatísticas
+possam ser lidas sem carregar o LangChain.
+"""
+
+import threading
+from typing import Any, Dict
+
+
+class MetricasMemoria:
+    """Contadores agregados de todas as sessões (thread-safe)."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.requisicoes = 0
+        self.tokens_historico = 0
+        self.tokens_enviados = 0
+        self.resumos_gerados = 0
+        self.turnos_descartados = 0
+
+    def registrar_envio(self, tokens_historico: int, tokens_enviados: int):
+        with self._lock:
+            self.requisicoes += 1
+            self.tokens_historico += tokens_historico
+            self.tokens_enviados += tokens_enviados
+
+    def registrar_resumo(self):
+        with self._lock:
+            self.resumos_gerados += 1
+
+    def registrar_descarte(self, turnos: int):
+        with self._lock:
+            self.turnos_descartados += turnos
+
+    def estatisticas(self) -> Dict[str, Any]:
+        with self._lock:
+            economizados = max(self.tokens_historico - self.tokens_enviados, 0)
+            return {
+                "requisicoes": self.requisicoes,
+                "tokens_historico_completo": self.tokens_historico,
+                "tokens_enviados": self.tokens_enviados,
+                "tokens_economizados": economizados,
+                "percentual_economizado": round(economizados / self.tokens_historico * 100, 1) if self.tokens_historico else 0.0,
+                "resumos_gerados": self.resumos_gerados,
+                "turnos_descartados_orcamento": self.turnos_descartados
+            }
+
+
+metricas_memoria = MetricasMemoria()
+
+
+def obter_metricas_memoria() -> MetricasMemoria:
+    """Retorna as métricas agregadas de memória das sessões."""
+    return metricas_memoria
@@ -0,0 +1,166 @@
+"""
+Compressão e cabeçalhos de cache das respostas HTTP da aplicação Flask.
+
+Depois de cada requisição:
+- respostas textuais (HTML, JSON, CSS, JS) acima de um tamanho mínimo são
+  comprimidas com brotli (se o pacote estiver instalado) ou gzip, conforme o
+  Accept-Encoding do cliente;
+- respostas GET recebem ETag (por codificação) e são respondidas com 304 quando
+  o cliente já tem a mesma versão;
+- o Cache-Control segue a política da rota (decorador politica_cache) ou o
+  padrão: revalidar páginas/JSON privados e não armazenar respostas de POST.
+
+Respostas em streaming (SSE) e arquivos binários passam sem alteração.
+"""
+
+import gzip
+from functools import wraps
+from typing import Callable, Optional
+from flask import Flask, request
+from database import db_config
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+CODIFICACAO_BROTLI = "br"
+CODIFICACAO_GZIP = "gzip"
+
+TIPOS_COMPRESSIVEIS = (
+    "text/",
+    "application/json",
+    "application/javascript",
+    "application/xml",
+    "image/svg+xml",
+)
+
+CACHE_PADRAO_GET = "private, no-cache"
+CACHE_PADRAO_ESCRITA = "no-store"
+
+
+def politica_cache(cache_control: str):
+    """
+    Define o Cache-Control de uma rota.
+
+    Exemplo:
+        @app.route("/inconsistencias")
+        @politica_cache("private, max-age=30")
+        def relatorio_inconsistencias(): ...
+    """
+    def decorador(funcao: Callable) -> Callable:
+        @wraps(funcao)
+        def envolvida(*args, **kwargs):
+            return funcao(*args, **kwargs)
+        envolvida.cache_control = cache_control
+        return envolvida
+    return decorador
+
+
+def _codificacoes_aceitas(cabecalho: str) -> dict:
+    """Interpreta o Accept-Encoding em {codificação: q}."""
+    aceitas = {}
+    for parte in cabecalho.split(","):
+        itens = parte.strip().split(";")
+        nome = itens[0].strip().lower()
+        if not nome:
+            continue
+        q = 1.0
+        for parametro in itens[1:]:
+            chave, _, valor = parametro.strip().partition("=")
+            if chave == "q":
+                try:
+                    q = float(valor)
+                except ValueError:
+                    q = 0.0
+        aceitas[nome] = q
+    return aceitas
+
+
+def escolher_codificacao(cabecalho: str) -> Optional[str]:
+    """
+    Escolhe a codificação a partir do Accept-Encoding (brotli antes de gzip).
+
+    Returns:
+        "br", "gzip" ou None se o cliente não aceitar nenhuma delas
+    """
+    aceitas = _codificacoes_aceitas(cabecalho or "")
+    curinga = aceitas.get("*", 0.0)
+    candidatas = [CODIFICACAO_GZIP]
+    if brotli is not None:
+        candidatas.insert(0, CODIFICACAO_BROTLI)
+    for codificacao in candidatas:
+        if aceitas.get(codificacao, curinga) > 0:
+            return codificacao
+    return None
+
+
+def comprimir(dados: bytes, codificacao: str) -> bytes:
+    """Comprime os dados com a codificação escolhida."""
+    if codificacao == CODIFICACAO_BROTLI:
+        return brotli.compress(dados, quality=db_config.COMPRESSAO_NIVEL_BROTLI)
+    return gzip.compress(dados, compresslevel=db_config.COMPRESSAO_NIVEL_GZIP)
+
+
+def _compressivel(resposta) -> bool:
+    return resposta.mimetype is not None and resposta.mimetype.startswith(TIPOS_COMPRESSIVEIS)
+
+
+def registrar_middleware_http(app: Flask):
+    """Registra a compressão e os cabeçalhos de cache na aplicação."""
+
+    @app.after_request
+    def processar_resposta(resposta):
+        # SSE e respostas já codificadas passam direto
+        if resposta.mimetype == "text/event-stream" or "Content-Encoding" in resposta.headers:
+            return resposta
+
+        # Arquivos estáticos textuais (CSS/JS) são lidos para poder comprimir;
+        # os demais arquivos e respostas em streaming seguem sem alteração
+        if request.endpoint == "static" and _compressivel(resposta) and resposta.status_code == 200:
+            resposta.direct_passthrough = False
+        elif resposta.direct_passthrough or resposta.is_streamed:
+            return resposta
+
+        # Política de cache da rota
+        if "Cache-Control" not in resposta.headers or request.endpoint == "static":
+            view = app.view_functions.get(request.endpoint)
+            politica = getattr(view, "cache_control", None)
+            if politica:
+                resposta.headers["Cache-Control"] = politica
+            elif request.endpoint == "static":
+                resposta.headers["Cache-Control"] = f"public, max-age={db_config.CACHE_ESTATICOS_SEGUNDOS}"
+            elif request.method in ("GET", "HEAD"):
+                resposta.headers["Cache-Control"] = CACHE_PADRAO_GET
+            else:
+                resposta.headers["Cache-Control"] = CACHE_PADRAO_ESCRITA
+
+        if resposta.status_code != 200 or not _compressivel(resposta):
+            return resposta
+
+        dados = resposta.get_data()
+        codificacao = None
+        if db_config.COMPRESSAO_ATIVA and len(dados) >= db_config.COMPRESSAO_MIN_BYTES:
+            codificacao = escolher_codificacao(request.headers.get("Accept-Encoding", ""))
+        resposta.vary.add("Accept-Encoding")
+
+        # ETag da representação (o conteúdo comprimido é outra representação)
+        if request.method in ("GET", "HEAD"):
+            resposta.add_etag()
+            if codificacao:
+                etag, fraca = resposta.get_etag()
+                resposta.set_etag(f"{etag}-{codificacao}", weak=fraca)
+            resposta.make_conditional(request)
+            if resposta.status_code == 304:
+                return resposta
+
+        if codificacao:
+            comprimido = comprimir(dados, codificacao)
+            if len(comprimido) < len(dados):
+                resposta.set_data(comprimido)
+                resposta.headers["Content-Encoding"] = codificacao
+        return resposta
+
+    print(f"Compressão HTTP: {'ativa' if db_config.COMPRESSAO_ATIVA else 'desativada'} "
+          f"({'brotli e gzip' if brotli is not None else 'gzip'}, mínimo {db_config.COMPRESSAO_MIN_BYTES} bytes)")
@@ -0,0 +1,206 @@
+"""
+Perfilamento sob demanda de requisições (sem reimplantar a aplicação).
+
+Nas rotas marcadas com o decorador perfilavel, um administrador pode pedir
+que uma única requisição rode sob um profiler, pelo cabeçalho ou pela query:
+
+    X-Perfil: cprofile | amostragem        ?perfil=cprofile
+    X-Perfil-Token: <PERFIL_TOKEN>         (só no cabeçalho)
+    X-Perfil-Formato: pstats | texto       &perfil_formato=texto   (só cprofile)
+
+O token só é aceito no cabeçalho: na query ele ficaria nos logs de acesso,
+no histórico do navegador e no Referer. Um modo desconhecido ou um token
+ausente/inválido recebem 403 (a rota não é executada).
+
+A rota é executada normalmente, mas a resposta é o arquivo do perfil para
+download, no lugar do corpo original (o status original vai no cabeçalho
+X-Perfil-Status):
+
+- "cprofile": arquivo .pstats (pstats.Stats, snakeviz) ou resumo em texto
+  ordenado pelo tempo acumulado;
+- "amostragem": pilhas da thread da requisição amostradas a intervalos
+  fixos, no formato "collapsed" (.folded) do flamegraph.pl e do speedscope.
+
+Sem PERFIL_TOKEN configurado o recurso fica desativado e os pedidos de perfil
+são ignorados. Um perfil por vez:
+pedidos simultâneos recebem 409.
+"""
+
+import cProfile
+import hmac
+import io
+import marshal
+import os
+import pstats
+import sys
+import threading
+import time
+from collections import Counter
+from datetime import datetime
+from functools import wraps
+from typing import Callable, Optional
+from flask import request, jsonify, make_response, Response
+from database import db_config
+
+
+MODO_CPROFILE = "cprofile"
+MODO_AMOSTRAGEM = "amostragem"
+MODOS_PERFIL = [MODO_CPROFILE, MODO_AMOSTRAGEM]
+
+FORMATO_PSTATS = "pstats"
+FORMATO_TEXTO = "texto"
+
+CABECALHO_MODO = "X-Perfil"
+CABECALHO_TOKEN = "X-Perfil-Token"
+CABECALHO_FORMATO = "X-Perfil-Formato"
+PARAMETRO_MODO = "perfil"
+PARAMETRO_FORMATO = "perfil_formato"
+
+# cProfile não permite dois perfis ativos ao mesmo tempo (Python 3.12+)
+_perfil_em_andamento = threading.Lock()
+
+
+def _valor_solicitado(cabecalho: str, parametro: str) -> str:
+    return (request.headers.get(cabecalho) or request.args.get(parametro) or "").strip()
+
+
+def modo_solicitado() -> Optional[str]:
+    """
+    Modo de perfilamento pedido na requisição atual.
+
+    Returns:
+        "cprofile", "amostragem" ou None (não pedido ou recurso desativado)
+
+    Raises:
+        PermissionError: Token ausente/inválido ou modo desconhecido
+    """
+    modo = _valor_solicitado(CABECALHO_MODO, PARAMETRO_MODO).lower()
+    if not modo:
+        return None
+    if not db_config.PERFIL_TOKEN:
+        return None
+    token = (request.headers.get(CABECALHO_TOKEN) or "").strip()
+    if not hmac.compare_digest(token.encode("utf-8"), db_config.PERFIL_TOKEN.encode("utf-8")):
+        print(f" Perfilamento negado em {request.path}: token inválido")
+        raise PermissionError("Token de perfilamento inválido")
+    if modo not in MODOS_PERFIL:
+        raise PermissionError(f"Modo de perfilamento desconhecido: {modo} (use {', '.join(MODOS_PERFIL)})")
+    return modo
+
+
+class AmostradorPilhas:
+    """Amostra a pilha de uma thread a intervalos fixos e conta as pilhas repetidas."""
+
+    def __init__(self, ident: int, intervalo_ms: float = None):
+        """
+        Args:
+            ident: Identificador da thread amostrada
+            intervalo_ms: Intervalo entre amostras (padrão da configuração)
+        """
+        self.ident = ident
+        self.intervalo = (intervalo_ms or db_config.PERFIL_INTERVALO_AMOSTRAGEM_MS) / 1000
+        self.pilhas = Counter()
+        self.amostras = 0
+        self._parar = threading.Event()
+        self._thread = None
+
+    def iniciar(self):
+        self._thread = threading.Thread(target=self._executar, name="perfil-amostragem", daemon=True)
+        self._thread.start()
+
+    def parar(self):
+        self._parar.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def _executar(self):
+        while not self._parar.wait(self.intervalo):
+            quadro = sys._current_frames().get(self.ident)
+            if quadro is None:
+                continue
+            pilha = []
+            while quadro is not None:
+                codigo = quadro.f_code
+                pilha.append(f"{codigo.co_name} ({os.path.basename(codigo.co_filename)}:{codigo.co_firstlineno})")
+                quadro = quadro.f_back
+            self.pilhas[";".join(reversed(pilha))] += 1
+            self.amostras += 1
+
+    def collapsed(self) -> str:
+        """Pilhas no formato "raiz;...;folha contagem", uma por linha."""
+        return "".join(f"{pilha} {contagem}\n" for pilha, contagem in self.pilhas.most_common())
+
+
+def _resposta_perfil(dados: bytes, mimetype: str, extensao: str, resposta_original, duracao: float,
+                     **cabecalhos) -> Response:
+    """Arquivo do perfil para download, com o status e a duração da requisição original."""
+    nome = f"perfil-{request.endpoint}-{datetime.now().strftime('%Y%m%d-%H%M%S')}.{extensao}"
+    resposta = Response(dados, mimetype=mimetype)
+    resposta.headers["Content-Disposition"] = f'attachment; filename="{nome}"'
+    resposta.headers["Cache-Control"] = "no-store"
+    resposta.headers["X-Perfil-Status"] = str(resposta_original.status_code)
+    resposta.headers["X-Perfil-Duracao-Ms"] = f"{duracao * 1000:.1f}"
+    for cabecalho, valor in cabecalhos.items():
+        resposta.headers[cabecalho] = str(valor)
+    return resposta
+
+
+def _perfilar_cprofile(funcao: Callable, args, kwargs) -> Response:
+    perfil = cProfile.Profile()
+    inicio = time.perf_counter()
+    resposta_original = make_response(perfil.runcall(funcao, *args, **kwargs))
+    duracao = time.perf_counter() - inicio
+    estatisticas = pstats.Stats(perfil)
+    print(f" Perfil (cProfile) de {request.path}: {duracao * 1000:.1f}ms, "
+          f"{estatisticas.total_calls} chamadas")
+
+    formato = _valor_solicitado(CABECALHO_FORMATO, PARAMETRO_FORMATO).lower() or FORMATO_PSTATS
+    if formato == FORMATO_TEXTO:
+        saida = io.StringIO()
+        pstats.Stats(perfil, stream=saida).sort_stats("cumulative").print_stats(db_config.PERFIL_LINHAS_TEXTO)
+        return _resposta_perfil(saida.getvalue().encode("utf-8"), "text/plain", "txt", resposta_original, duracao)
+    # Mesmo conteúdo de Stats.dump_stats: pstats.Stats("arquivo.pstats") lê de volta
+    return _resposta_perfil(marshal.dumps(estatisticas.stats), "application/octet-stream", "pstats",
+                            resposta_original, duracao)
+
+
+def _perfilar_amostragem(funcao: Callable, args, kwargs) -> Response:
+    amostrador = AmostradorPilhas(threading.get_ident())
+    inicio = time.perf_counter()
+    amostrador.iniciar()
+    try:
+        resposta_original = make_response(funcao(*args, **kwargs))
+    finally:
+        amostrador.parar()
+    duracao = time.perf_counter() - inicio
+    print(f" Perfil (amostragem) de {request.path}: {duracao * 1000:.1f}ms, {amostrador.amostras} amostras")
+    return _resposta_perfil(amostrador.collapsed().encode("utf-8"), "text/plain", "folded",
+                            resposta_original, duracao, **{"X-Perfil-Amostras": amostrador.amostras})
+
+
+def perfilavel(funcao: Callable) -> Callable:
+    """
+    Permite perfilar a rota sob demanda (ver o cabeçalho do módulo).
+
+    Exemplo:
+        @app.route("/chat", methods=["POST"])
+        @perfilavel
+        def chat(): ...
+    """
+    @wraps(funcao)
+    def envolvida(*args, **kwargs):
+        try:
+            modo = modo_solicitado()
+        except PermissionError as e:
+            return jsonify({"error": str(e)}), 403
+        if modo is None:
+            return funcao(*args, **kwargs)
+        if not _perfil_em_andamento.acquire(blocking=False):
+            return jsonify({"error": "Já existe um perfilamento em andamento"}), 409
+        try:
+            if modo == MODO_CPROFILE:
+                return _perfilar_cprofile(funcao, args, kwargs)
+            return _perfilar_amostragem(funcao, args, kwargs)
+        finally:
+            _perfil_em_andamento.release()
+    return envolvida
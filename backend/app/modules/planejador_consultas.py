@@ -0,0 +1,440 @@
+"""
+Planejador de consultas estruturadas.
+Uma pergunta interpretada vira uma árvore de consulta (coleção, filtros,
+intervalo de datas, agrupamento, métrica, ordenação e limite) que é compilada
+em um único pipeline de agregação: $match primeiro (usando índices), projeção
+apenas dos campos necessários, $group, $sort e $limit.
+
+Os planos são compilados uma vez por forma da consulta (mesmos campos, valores
+diferentes) e reutilizados com os novos valores. Perguntas sobre várias
+coleções executam uma agregação por coleção em paralelo, compartilhando o pool
+de conexões de um único MongoClient, e os resultados são mesclados.
+"""
+
+import contextvars
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional, Tuple
+from pymongo import MongoClient
+from database import db_config
+from modules.eventos_colecoes import registrar_ouvinte, PRIORIDADE_CACHES
+from modules.dimensao_datas import obter_dimensao_datas, campo_tipado, GRANULARIDADES
+from modules.rastreamento import span, COMPONENTE_AGENTE
+
+
+METRICA_CONTAGEM = "contagem"
+METRICA_SOMA = "soma"
+
+# Posição do filtro de intervalo no $match compilado
+CHAVE_INTERVALO = "__intervalo__"
+
+
+class ConsultaAST:
+    """Árvore de uma consulta estruturada sobre uma coleção."""
+
+    def __init__(self, colecao: str, filtros: Dict[str, Any] = None, campo_data: str = None,
+                 data_inicio: str = None, data_fim: str = None, agrupar_por: str = None,
+                 metrica: str = METRICA_CONTAGEM, campo_metrica: str = None,
+                 ordem: int = -1, limite: int = None, granularidade: str = None):
+        """
+        Args:
+            colecao: Nome da coleção
+            filtros: Igualdades campo -> valor
+            campo_data: Campo de data original (texto DD/MM/AAAA) usado no intervalo
+            data_inicio: Início do intervalo (DD/MM/AAAA, inclusivo)
+            data_fim: Fim do intervalo (DD/MM/AAAA, inclusivo)
+            agrupar_por: Campo de agrupamento (None para um total)
+            metrica: "contagem" ou "soma"
+            campo_metrica: Campo somado quando a métrica é "soma"
+            ordem: -1 para decrescente, 1 para crescente
+            limite: Quantidade máxima de grupos
+            granularidade: Agrupa o intervalo por "dia", "semana" ou "mes"
+        """
+        self.colecao = colecao
+        self.filtros = dict(filtros or {})
+        self.campo_data = campo_data
+        self.data_inicio = data_inicio
+        self.data_fim = data_fim
+        self.agrupar_por = agrupar_por
+        self.metrica = metrica
+        self.campo_metrica = campo_metrica
+        self.ordem = ordem
+        self.limite = limite
+        self.granularidade = granularidade if granularidade in GRANULARIDADES else None
+
+    @property
+    def tem_intervalo(self) -> bool:
+        return bool(self.campo_data and self.data_inicio and self.data_fim)
+
+    def forma(self) -> Tuple:
+        """Estrutura da consulta sem os valores (chave do cache de planos)."""
+        return (
+            self.colecao,
+            tuple(sorted(self.filtros)),
+            self.campo_data if self.tem_intervalo else None,
+            self.agrupar_por,
+            self.metrica,
+            self.campo_metrica,
+            self.ordem,
+            self.limite is not None,
+            self.granularidade
+        )
+
+    def para_dict(self) -> Dict[str, Any]:
+        """Representação determinística (usada na chave do cache de resultados)."""
+        return {
+            "colecao": self.colecao,
+            "filtros": {campo: self.filtros[campo] for campo in sorted(self.filtros)},
+            "campo_data": self.campo_data,
+            "data_inicio": self.data_inicio,
+            "data_fim": self.data_fim,
+            "agrupar_por": self.agrupar_por,
+            "metrica": self.metrica,
+            "campo_metrica": self.campo_metrica,
+            "ordem": self.ordem,
+            "limite": self.limite,
+            "granularidade": self.granularidade
+        }
+
+    def para_colecao(self, colecao: str, campo_data: str = None, limitar: bool = True) -> "ConsultaAST":
+        """
+        Cópia da consulta sobre outra coleção (com o campo de data dela).
+
+        Args:
+            colecao: Coleção da cópia
+            campo_data: Campo de data da coleção
+            limitar: Se False, a cópia traz todos os grupos (o corte fica para depois da mescla)
+        """
+        return ConsultaAST(
+            colecao,
+            filtros=self.filtros,
+            campo_data=campo_data if self.tem_intervalo else None,
+            data_inicio=self.data_inicio,
+            data_fim=self.data_fim,
+            agrupar_por=self.agrupar_por,
+            metrica=self.metrica,
+            campo_metrica=self.campo_metrica,
+            ordem=self.ordem,
+            limite=self.limite if limitar else None,
+            granularidade=self.granularidade
+        )
+
+    def para_total(self) -> "ConsultaAST":
+        """Cópia da consulta sem agrupamento: o total da coleção com os mesmos filtros e período."""
+        return ConsultaAST(
+            self.colecao,
+            filtros=self.filtros,
+            campo_data=self.campo_data,
+            data_inicio=self.data_inicio,
+            data_fim=self.data_fim,
+            metrica=self.metrica,
+            campo_metrica=self.campo_metrica
+        )
+
+
+class Parametro:
+    """Posição de um valor no pipeline compilado."""
+
+    def __init__(self, nome: str):
+        self.nome = nome
+
+
+class PlanoConsulta:
+    """Pipeline compilado para uma forma de consulta."""
+
+    def __init__(self, colecao: str, pipeline: List[Dict[str, Any]], indice: Optional[str]):
+        self.colecao = colecao
+        self.pipeline = pipeline
+        self.indice = indice
+        self.usos = 0
+
+
+def _valores_equivalentes(valor: Any) -> Any:
+    """Condição que aceita o valor como número ou texto (CSV importado pelo pandas)."""
+    texto = str(valor).strip()
+    candidatos = [texto]
+    try:
+        numero = int(texto)
+        candidatos.extend([numero, float(numero)])
+    except ValueError:
+        pass
+    return {"$in": candidatos} if len(candidatos) > 1 else texto
+
+
+def mesclar_resultados(execucoes: List[Dict[str, Any]], consulta: ConsultaAST) -> List[Dict[str, Any]]:
+    """
+    Mescla os resultados de várias coleções somando os valores de cada grupo.
+    Em rankings, as execuções precisam trazer todos os grupos (consultas sem
+    limite): um grupo fora do top N de cada coleção pode entrar no top N da
+    soma. O corte no limite da consulta é feito aqui, depois da soma.
+
+    Args:
+        execucoes: Retorno de PlanejadorConsultas.executar_varias
+        consulta: Consulta de referência (agrupamento, ordem e limite)
+
+    Returns:
+        Lista {"_id": grupo, "count": valor} na ordem da consulta
+    """
+    totais = {}
+    for execucao in execucoes:
+        for item in execucao["resultado"]:
+            totais[item["_id"]] = totais.get(item["_id"], 0) + item["count"]
+
+    mesclado = [{"_id": grupo, "count": valor} for grupo, valor in totais.items()]
+    if consulta.granularidade and consulta.tem_intervalo:
+        return sorted(mesclado, key=lambda item: (item["_id"] is None, str(item["_id"])))
+
+    mesclado.sort(key=lambda item: (consulta.ordem * item["count"], str(item["_id"])))
+    if consulta.agrupar_por and consulta.limite is not None:
+        mesclado = mesclado[:consulta.limite]
+    return mesclado
+
+
+class PlanejadorConsultas:
+    """Compila consultas estruturadas em pipelines e mantém o cache de planos."""
+
+    def __init__(self, db=None, max_planos: int = 128, max_workers: int = None):
+        self.db = db
+        self.dimensao_datas = obter_dimensao_datas()
+        self.max_planos = max_planos
+        self.max_workers = max_workers or db_config.MAX_WORKERS_CONSULTAS
+        self._planos = OrderedDict()
+        self._lock = threading.Lock()
+        self._executor = None
+        self.compilacoes = 0
+        self.reutilizacoes = 0
+        self.execucoes_paralelas = 0
+
+    def _obter_db(self):
+        # Um único MongoClient (thread-safe) atende todas as threads pelo seu pool
+        with self._lock:
+            if self.db is None:
+                self.db = MongoClient(db_config.MONGO_URI, maxPoolSize=db_config.MONGO_MAX_POOL_SIZE)[db_config.DB_NAME]
+            return self.db
+
+    def _obter_executor(self) -> ThreadPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="consulta")
+            return self._executor
+
+    def _escolher_indice(self, colecao: str, campos_igualdade: List[str], campo_intervalo: Optional[str]) -> Optional[str]:
+        """
+        Escolhe o índice cujo prefixo cobre mais campos do $match
+        (igualdades antes do intervalo).
+        """
+        try:
+            indices = self._obter_db()[colecao].index_information()
+        except Exception as e:
+            print(f" Erro ao ler índices de {colecao}: {e}")
+            return None
+
+        melhor, melhor_cobertura = None, 0
+        for nome, info in indices.items():
+            if nome == "_id_":
+                continue
+            campos = [campo for campo, _ in info.get("key", [])]
+            cobertura = 0
+            for campo in campos:
+                if campo in campos_igualdade:
+                    cobertura += 2
+                elif campo == campo_intervalo:
+                    cobertura += 1
+                    break
+                else:
+                    break
+            if cobertura > melhor_cobertura:
+                melhor, melhor_cobertura = nome, cobertura
+        return melhor
+
+    def _compilar(self, ast: ConsultaAST) -> PlanoConsulta:
+        """Compila a forma da consulta em um pipeline com parâmetros."""
+        pipeline = []
+
+        # 1. $match com todos os filtros (primeiro estágio, pode usar índice).
+        # O intervalo usa o campo de data tipado quando ele já existe.
+        filtro = {campo: Parametro(f"filtro:{campo}") for campo in sorted(ast.filtros)}
+        if ast.tem_intervalo:
+            filtro[CHAVE_INTERVALO] = Parametro("intervalo")
+        if ast.agrupar_por:
+            # Valores ausentes não formam grupo
+            filtro.setdefault(ast.agrupar_por, {"$exists": True, "$ne": None})
+        if filtro:
+            pipeline.append({"$match": filtro})
+
+        # 2. Projeção apenas dos campos usados depois do $match
+        campos_necessarios = [campo for campo in (ast.agrupar_por, ast.campo_metrica) if campo]
+        if ast.granularidade and ast.tem_intervalo:
+            campos_necessarios.extend([ast.campo_data, campo_tipado(ast.campo_data)])
+        if campos_necessarios:
+            projecao = {"_id": 0}
+            projecao.update({campo: 1 for campo in campos_necessarios})
+            pipeline.append({"$project": projecao})
+
+        # 3. Agrupamento e métrica
+        acumulador = {"$sum": f"${ast.campo_metrica}"} if ast.metrica == METRICA_SOMA else {"$sum": 1}
+        if ast.granularidade and ast.tem_intervalo:
+            grupo = Parametro("periodo")
+        else:
+            grupo = f"${ast.agrupar_por}" if ast.agrupar_por else None
+        pipeline.append({"$group": {"_id": grupo, "count": acumulador}})
+
+        # 4. Ordenação e limite (períodos em ordem cronológica)
+        if ast.granularidade and ast.tem_intervalo:
+            pipeline.append({"$sort": {"_id": 1}})
+        elif ast.agrupar_por:
+            pipeline.append({"$sort": {"count": ast.ordem, "_id": 1}})
+            if ast.limite is not None:
+                pipeline.append({"$limit": Parametro("limite")})
+
+        campo_intervalo = None
+        if ast.tem_intervalo:
+            campo_intervalo = self.dimensao_datas.campo_tipado_pronto(ast.colecao, ast.campo_data) or ast.campo_data
+        indice = self._escolher_indice(ast.colecao, sorted(ast.filtros), campo_intervalo)
+        return PlanoConsulta(ast.colecao, pipeline, indice)
+
+    def _vincular(self, valor: Any, ast: ConsultaAST) -> Any:
+        """Substitui os parâmetros do pipeline pelos valores da consulta."""
+        if isinstance(valor, Parametro):
+            if valor.nome == "intervalo":
+                return self.dimensao_datas.filtro_intervalo(ast.colecao, ast.campo_data, ast.data_inicio, ast.data_fim)
+            if valor.nome == "periodo":
+                return self.dimensao_datas.expressao_periodo(ast.colecao, ast.campo_data, ast.granularidade)
+            if valor.nome == "limite":
+                return ast.limite
+            return _valores_equivalentes(ast.filtros[valor.nome.split(":", 1)[1]])
+        if isinstance(valor, dict):
+            vinculado = {}
+            for chave, item in valor.items():
+                if chave == CHAVE_INTERVALO:
+                    # O filtro do intervalo pode usar outro campo ou $expr
+                    vinculado.update(self._vincular(item, ast))
+                else:
+                    vinculado[chave] = self._vincular(item, ast)
+            return vinculado
+        if isinstance(valor, list):
+            return [self._vincular(item, ast) for item in valor]
+        return valor
+
+    def planejar(self, ast: ConsultaAST) -> Tuple[PlanoConsulta, List[Dict[str, Any]]]:
+        """
+        Obtém o plano da forma da consulta (compilando se necessário) e o
+        pipeline com os valores da consulta.
+
+        Returns:
+            Tupla (plano, pipeline pronto para execução)
+        """
+        forma = ast.forma()
+        with self._lock:
+            plano = self._planos.get(forma)
+            if plano is not None:
+                self._planos.move_to_end(forma)
+                self.reutilizacoes += 1
+
+        if plano is None:
+            plano = self._compilar(ast)
+            with self._lock:
+                self._planos[forma] = plano
+                self.compilacoes += 1
+                while len(self._planos) > self.max_planos:
+                    self._planos.popitem(last=False)
+
+        plano.usos += 1
+        return plano, self._vincular(plano.pipeline, ast)
+
+    def executar(self, ast: ConsultaAST) -> List[Dict[str, Any]]:
+        """
+        Executa a consulta.
+
+        Returns:
+            Lista no formato {"_id": grupo, "count": valor}
+        """
+        plano, pipeline = self.planejar(ast)
+        colecao = self._obter_db()[ast.colecao]
+        print(f" Plano ({'índice ' + plano.indice if plano.indice else 'sem índice'}): {pipeline}")
+
+        with span(COMPONENTE_AGENTE, "agregacao", colecao=ast.colecao, indice=plano.indice or "") as estagio:
+            resultado = None
+            if plano.indice:
+                try:
+                    resultado = list(colecao.aggregate(pipeline, hint=plano.indice, allowDiskUse=True))
+                except Exception as e:
+                    # O índice pode ter sido removido desde a compilação
+                    print(f" Erro ao usar o índice {plano.indice}, executando sem hint: {e}")
+                    self.invalidar_colecao(ast.colecao)
+            if resultado is None:
+                resultado = list(colecao.aggregate(pipeline, allowDiskUse=True))
+            estagio.definir(grupos=len(resultado))
+        return resultado
+
+    def executar_varias(self, consultas: List[ConsultaAST]) -> List[Dict[str, Any]]:
+        """
+        Executa uma consulta por coleção em paralelo.
+
+        Args:
+            consultas: Consultas (uma por coleção)
+
+        Returns:
+            Lista, na ordem das consultas, de {"colecao", "resultado", "tempo_segundos", "erro"}
+        """
+        def executar_uma(consulta: ConsultaAST) -> Dict[str, Any]:
+            inicio = time.perf_counter()
+            try:
+                resultado, erro = self.executar(consulta), None
+            except Exception as e:
+                print(f" Erro ao consultar {consulta.colecao}: {e}")
+                resultado, erro = [], str(e)
+            return {
+                "colecao": consulta.colecao,
+                "resultado": resultado,
+                "tempo_segundos": round(time.perf_counter() - inicio, 3),
+                "erro": erro
+            }
+
+        if len(consultas) < 2:
+            return [executar_uma(consulta) for consulta in consultas]
+
+        self._obter_db()
+        with self._lock:
+            self.execucoes_paralelas += 1
+        # Cada thread roda em uma cópia do contexto, para os spans entrarem no rastro da pergunta
+        contextos = [contextvars.copy_context() for _ in consultas]
+        return list(self._obter_executor().map(
+            lambda contexto, consulta: contexto.run(executar_uma, consulta), contextos, consultas
+        ))
+
+    def invalidar_colecao(self, colecao: str):
+        """Descarta os planos de uma coleção (os índices podem ter mudado)."""
+        with self._lock:
+            for forma in [forma for forma in self._planos if forma[0] == colecao]:
+                del self._planos[forma]
+
+    def estatisticas(self) -> Dict[str, Any]:
+        """Retorna contadores do cache de planos."""
+        with self._lock:
+            return {
+                "planos": len(self._planos),
+                "compilacoes": self.compilacoes,
+                "reutilizacoes": self.reutilizacoes,
+                "execucoes_paralelas": self.execucoes_paralelas,
+                "max_workers": self.max_workers
+            }
+
+
+# Instância global do planejador
+planejador = PlanejadorConsultas()
+
+
+def _ao_alterar_colecao(colecao: str, evento: str, registros=None):
+    """Descarta os planos de coleções importadas ou excluídas."""
+    planejador.invalidar_colecao(colecao)
+
+
+registrar_ouvinte(_ao_alterar_colecao, PRIORIDADE_CACHES)
+
+
+def obter_planejador() -> PlanejadorConsultas:
+    """Retorna a instância global do planejador de consultas."""
+    return planejador
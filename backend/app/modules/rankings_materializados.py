@@ -0,0 +1,420 @@
+"""
+Rankings materializados.
+Mantém tabelas de contagem por coleção e dimensão (LOJA, SKU, IDUSUARIO,
+campos de data) atualizadas incrementalmente a cada importação, para que
+perguntas de "top N" sejam respondidas com uma leitura indexada em vez de
+um $group sobre a coleção inteira.
+
+A reconstrução de uma dimensão (a primeira materialização) roda em um só
+worker, sob um lock no documento de meta renovado por uma thread enquanto a
+agregação roda, e grava as contagens em uma chave própria da geração
+("LOJA@<geração>"). A divisão entre a agregação e as importações concorrentes
+não depende da ordem dos _id: cada importação se registra antes de ler o meta
+e marca os registros com as gerações em reconstrução que encontrou
+(CAMPO_GERACOES). A agregação ignora os registros marcados com a sua geração,
+que são somados pela própria importação, e só começa depois que as
+importações registradas antes do lock terminam (os registros delas, sem
+marca, entram na agregação). Ao terminar, o meta passa a apontar para a chave
+nova em uma única escrita; as marcas e as linhas de gerações anteriores são
+apagadas.
+"""
+
+import re
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from typing import Any, Dict, Iterator, List, Optional
+from bson import ObjectId
+from pymongo import MongoClient, ReturnDocument, UpdateOne, DESCENDING, ASCENDING
+from pymongo.errors import DuplicateKeyError
+from database import db_config
+from modules.eventos_colecoes import registrar_ouvinte, EVENTO_IMPORTACAO, EVENTO_EXCLUSAO, PRIORIDADE_DERIVADOS
+
+
+ESTADO_RECONSTRUINDO = "reconstruindo"
+ESTADO_PRONTO = "pronto"
+
+# Intervalo entre verificações enquanto outro worker reconstrói a dimensão
+INTERVALO_ESPERA_SEGUNDOS = 0.5
+
+# Gerações em reconstrução vistas pela importação que inseriu o registro
+CAMPO_GERACOES = "_geracoes_ranking"
+
+# Validade do registro de uma importação em andamento (libera a reconstrução se o worker cair)
+PRAZO_IMPORTACAO_SEGUNDOS = 3600
+
+
+class RankingsMaterializados:
+    """Contagens por valor de dimensão, mantidas em uma coleção interna do MongoDB."""
+
+    def __init__(self, mongo_uri: str = None, database_name: str = None):
+        """
+        Inicializa o gerenciador de rankings.
+
+        Args:
+            mongo_uri: URI de conexão MongoDB
+            database_name: Nome do banco de dados
+        """
+        self.mongo_uri = mongo_uri or db_config.MONGO_URI
+        self.database_name = database_name or db_config.DB_NAME
+        self.db = None
+        self.contagens = None
+        self.meta = None
+        self.importacoes = None
+        self.tamanho_lote = 5000
+        self._reconstrucoes = {}
+        self._lock = threading.Lock()
+
+    def conectar(self):
+        """Conecta ao MongoDB e cria os índices das tabelas de contagem."""
+        if self.db is not None:
+            return
+
+        with self._lock:
+            if self.db is not None:
+                return
+
+            db = MongoClient(self.mongo_uri)[self.database_name]
+            self.contagens = db[db_config.COLECAO_RANKINGS]
+            self.meta = db[db_config.COLECAO_RANKINGS_META]
+            self.importacoes = db[db_config.COLECAO_RANKINGS_IMPORTACOES]
+
+            # Chave única para o $inc incremental
+            self.contagens.create_index(
+                [("colecao", ASCENDING), ("dimensao", ASCENDING), ("valor", ASCENDING)],
+                unique=True
+            )
+            # Índice usado pela leitura do top N
+            self.contagens.create_index(
+                [("colecao", ASCENDING), ("dimensao", ASCENDING), ("count", DESCENDING)]
+            )
+            self.meta.create_index("colecao")
+            self.importacoes.create_index("colecao")
+            self.importacoes.create_index("expira_em", expireAfterSeconds=0)
+            self.db = db
+
+    @staticmethod
+    def _id_meta(colecao: str, dimensao: str) -> str:
+        return f"{colecao}|{dimensao}"
+
+    def _chave_publicada(self, colecao: str, dimensao: str) -> Optional[str]:
+        """Chave das contagens publicadas da dimensão (None se ainda não materializada)."""
+        self.conectar()
+        meta = self.meta.find_one(
+            {"_id": self._id_meta(colecao, dimensao), "estado": {"$ne": ESTADO_RECONSTRUINDO}},
+            {"chave": 1}
+        )
+        if meta is None:
+            return None
+        # Rankings materializados antes das gerações usam a própria dimensão como chave
+        return meta.get("chave", dimensao)
+
+    def disponivel(self, colecao: str, dimensao: str) -> bool:
+        """Indica se o ranking da dimensão já foi materializado."""
+        return self._chave_publicada(colecao, dimensao) is not None
+
+    def _adquirir(self, colecao: str, dimensao: str) -> Optional[Dict[str, Any]]:
+        """
+        Tenta obter o lock de reconstrução da dimensão (também assume um lock vencido).
+
+        Returns:
+            Documento de meta da nova geração, ou None se a dimensão já está
+            materializada ou outro worker a está reconstruindo
+        """
+        geracao = ObjectId()
+        agora = datetime.now()
+        reconstrucao = {
+            "colecao": colecao,
+            "dimensao": dimensao,
+            "estado": ESTADO_RECONSTRUINDO,
+            "chave": f"{dimensao}@{geracao}",
+            "expira_em": agora + timedelta(seconds=db_config.RANKING_RECONSTRUCAO_PRAZO_SEGUNDOS),
+            "atualizado_em": agora
+        }
+        id_meta = self._id_meta(colecao, dimensao)
+        try:
+            self.meta.insert_one({"_id": id_meta, **reconstrucao})
+            return reconstrucao
+        except DuplicateKeyError:
+            return self.meta.find_one_and_update(
+                {"_id": id_meta, "estado": ESTADO_RECONSTRUINDO, "expira_em": {"$lt": agora}},
+                {"$set": reconstrucao},
+                return_document=ReturnDocument.AFTER
+            )
+
+    def _renovar(self, id_meta: str, chave: str) -> bool:
+        """Prorroga o lock da geração; False se ele foi perdido (vencido ou coleção removida)."""
+        prazo = datetime.now() + timedelta(seconds=db_config.RANKING_RECONSTRUCAO_PRAZO_SEGUNDOS)
+        resultado = self.meta.update_one(
+            {"_id": id_meta, "chave": chave, "estado": ESTADO_RECONSTRUINDO},
+            {"$set": {"expira_em": prazo}}
+        )
+        return resultado.matched_count == 1
+
+    def _gravar_lote(self, colecao: str, chave: str, lote: List[Dict[str, Any]]):
+        # $inc: as importações concorrentes já podem ter criado a linha do valor
+        self.contagens.bulk_write([
+            UpdateOne({"colecao": colecao, "dimensao": chave, "valor": grupo["_id"]},
+                      {"$inc": {"count": grupo["count"]}}, upsert=True)
+            for grupo in lote
+        ], ordered=False)
+
+    def _remover_marcas(self, colecao: str, chave: str):
+        """Retira a geração das marcas dos registros importados durante a reconstrução."""
+        colecao_origem = self.db[colecao]
+        colecao_origem.update_many({CAMPO_GERACOES: chave}, {"$pull": {CAMPO_GERACOES: chave}})
+        colecao_origem.update_many({CAMPO_GERACOES: {"$size": 0}}, {"$unset": {CAMPO_GERACOES: ""}})
+
+    def _manter_lock(self, id_meta: str, chave: str, parar: threading.Event, perdido: threading.Event):
+        """Renova o lock enquanto a reconstrução roda (o $group só devolve o primeiro lote no fim da leitura)."""
+        intervalo = db_config.RANKING_RECONSTRUCAO_PRAZO_SEGUNDOS / 3
+        while not parar.wait(intervalo):
+            try:
+                if not self._renovar(id_meta, chave):
+                    perdido.set()
+                    return
+            except Exception as e:
+                print(f"Erro ao renovar o lock do ranking {id_meta}: {e}")
+
+    def _aguardar_importacoes(self, colecao: str, perdido: threading.Event):
+        """
+        Aguarda as importações em andamento na coleção. As registradas antes do
+        lock podem ter lido o meta sem a reconstrução e inserido registros sem
+        marca, que precisam estar na coleção antes da agregação.
+        """
+        while not perdido.is_set() and self.importacoes.count_documents(
+            {"colecao": colecao, "expira_em": {"$gt": datetime.now()}}, limit=1
+        ):
+            time.sleep(INTERVALO_ESPERA_SEGUNDOS)
+
+    @contextmanager
+    def registrar_importacao(self, colecao: str) -> Iterator[Dict[str, Any]]:
+        """
+        Registra uma importação em andamento e indica como marcar os registros.
+        A inserção e a notificação devem ocorrer dentro do bloco.
+
+        Args:
+            colecao: Nome da coleção importada
+
+        Yields:
+            Campos a acrescentar em cada registro (vazio sem reconstrução em andamento)
+        """
+        self.conectar()
+        registro = self.importacoes.insert_one({
+            "colecao": colecao,
+            "expira_em": datetime.now() + timedelta(seconds=PRAZO_IMPORTACAO_SEGUNDOS)
+        }).inserted_id
+        try:
+            # Lido depois do registro: um lock criado depois disso aguarda esta importação
+            geracoes = [
+                meta["chave"] for meta in
+                self.meta.find({"colecao": colecao, "estado": ESTADO_RECONSTRUINDO}, {"chave": 1})
+            ]
+            yield {CAMPO_GERACOES: geracoes} if geracoes else {}
+        finally:
+            self.importacoes.delete_one({"_id": registro})
+
+    def reconstruir(self, colecao: str, dimensao: str):
+        """
+        Reconstrói as contagens de uma dimensão a partir da coleção de origem.
+        Executado uma única vez por dimensão (entre todos os workers); depois
+        disso as importações mantêm as contagens atualizadas. Se outro worker
+        estiver reconstruindo, aguarda a conclusão dele.
+
+        Args:
+            colecao: Nome da coleção de origem
+            dimensao: Campo agrupado
+        """
+        self.conectar()
+        id_meta = self._id_meta(colecao, dimensao)
+
+        while True:
+            meta = self._adquirir(colecao, dimensao)
+            if meta is not None:
+                break
+            atual = self.meta.find_one({"_id": id_meta}, {"estado": 1})
+            if atual is not None and atual.get("estado") != ESTADO_RECONSTRUINDO:
+                return
+            time.sleep(INTERVALO_ESPERA_SEGUNDOS)
+
+        inicio = datetime.now()
+        chave = meta["chave"]
+        parar = threading.Event()
+        perdido = threading.Event()
+        renovacao = threading.Thread(
+            target=self._manter_lock, args=(id_meta, chave, parar, perdido),
+            name=f"ranking-lock-{id_meta}", daemon=True
+        )
+        renovacao.start()
+
+        # Registros marcados com esta geração são somados pelas importações
+        pipeline = [
+            {"$match": {CAMPO_GERACOES: {"$ne": chave}}},
+            {"$group": {"_id": f"${dimensao}", "count": {"$sum": 1}}}
+        ]
+
+        try:
+            self._aguardar_importacoes(colecao, perdido)
+            lote = []
+            for grupo in self.db[colecao].aggregate(pipeline, allowDiskUse=True):
+                lote.append(grupo)
+                if len(lote) >= self.tamanho_lote:
+                    if perdido.is_set():
+                        break
+                    self._gravar_lote(colecao, chave, lote)
+                    lote = []
+            if lote and not perdido.is_set():
+                self._gravar_lote(colecao, chave, lote)
+        except Exception:
+            # Libera o lock sem esperar o prazo: a próxima consulta tenta de novo
+            parar.set()
+            self.meta.delete_one({"_id": id_meta, "chave": chave, "estado": ESTADO_RECONSTRUINDO})
+            self.contagens.delete_many({"colecao": colecao, "dimensao": chave})
+            self._remover_marcas(colecao, chave)
+            raise
+        finally:
+            parar.set()
+            renovacao.join()
+
+        # Publicação: uma única escrita troca a chave lida pelo top N
+        publicado = not perdido.is_set() and self.meta.update_one(
+            {"_id": id_meta, "chave": chave, "estado": ESTADO_RECONSTRUINDO},
+            {"$set": {"estado": ESTADO_PRONTO, "atualizado_em": datetime.now()}, "$unset": {"expira_em": ""}}
+        ).matched_count == 1
+        self._remover_marcas(colecao, chave)
+        if not publicado:
+            # Lock vencido (outro worker assumiu) ou coleção removida: descartar esta geração
+            self.contagens.delete_many({"colecao": colecao, "dimensao": chave})
+            print(f"Reconstrução do ranking {colecao}.{dimensao} abandonada: lock perdido")
+            return
+
+        # Linhas de gerações abandonadas por workers interrompidos
+        self.contagens.delete_many({
+            "colecao": colecao,
+            "dimensao": {"$regex": f"^{re.escape(dimensao)}(@|$)", "$ne": chave}
+        })
+
+        tempo = (datetime.now() - inicio).total_seconds()
+        print(f"Ranking materializado: {colecao}.{dimensao} em {tempo:.2f}s")
+
+    def reconstruir_em_segundo_plano(self, colecao: str, dimensao: str) -> threading.Thread:
+        """
+        Inicia (ou reaproveita) a reconstrução de uma dimensão em uma thread.
+
+        Returns:
+            Thread da reconstrução em andamento
+        """
+        chave = self._id_meta(colecao, dimensao)
+        with self._lock:
+            thread = self._reconstrucoes.get(chave)
+            if thread is not None and thread.is_alive():
+                return thread
+
+            def executar():
+                try:
+                    self.reconstruir(colecao, dimensao)
+                except Exception as e:
+                    print(f"Erro ao materializar ranking {chave}: {e}")
+                finally:
+                    with self._lock:
+                        self._reconstrucoes.pop(chave, None)
+
+            thread = threading.Thread(target=executar, name=f"ranking-{chave}", daemon=True)
+            self._reconstrucoes[chave] = thread
+            thread.start()
+            return thread
+
+    def atualizar_incremental(self, colecao: str, registros: List[Dict[str, Any]]):
+        """
+        Soma às contagens materializadas os registros efetivamente inseridos.
+
+        Args:
+            colecao: Nome da coleção importada
+            registros: Registros inseridos na importação
+        """
+        if not registros:
+            return
+
+        self.conectar()
+        metas = list(self.meta.find({"colecao": colecao}, {"dimensao": 1, "chave": 1, "estado": 1}))
+        dimensoes = [meta["dimensao"] for meta in metas]
+
+        for meta in metas:
+            dimensao = meta["dimensao"]
+            if meta.get("estado") == ESTADO_RECONSTRUINDO:
+                # Durante a reconstrução, só os registros marcados com a geração; os demais entram na agregação
+                selecionados = [r for r in registros if meta["chave"] in r.get(CAMPO_GERACOES, ())]
+            else:
+                selecionados = registros
+            contagem = Counter(registro.get(dimensao) for registro in selecionados)
+            if not contagem:
+                continue
+            operacoes = [
+                UpdateOne(
+                    {"colecao": colecao, "dimensao": meta.get("chave", dimensao), "valor": valor},
+                    {"$inc": {"count": quantidade}},
+                    upsert=True
+                )
+                for valor, quantidade in contagem.items()
+            ]
+            self.contagens.bulk_write(operacoes, ordered=False)
+            self.meta.update_one(
+                {"_id": self._id_meta(colecao, dimensao)},
+                {"$set": {"atualizado_em": datetime.now()}}
+            )
+
+        if dimensoes:
+            print(f"Rankings de '{colecao}' atualizados com {len(registros)} registros: {dimensoes}")
+
+    def remover_colecao(self, colecao: str):
+        """Remove os rankings materializados de uma coleção."""
+        self.conectar()
+        self.contagens.delete_many({"colecao": colecao})
+        self.meta.delete_many({"colecao": colecao})
+
+    def top_n(self, colecao: str, dimensao: str, limite: int, ignorar_nulos: bool = False) -> Optional[List[Dict[str, Any]]]:
+        """
+        Lê os N valores mais frequentes de uma dimensão materializada.
+
+        Args:
+            colecao: Nome da coleção
+            dimensao: Campo agrupado
+            limite: Quantidade de itens
+            ignorar_nulos: Se True, descarta valores ausentes
+
+        Returns:
+            Lista no formato do $group ({"_id": valor, "count": n}) ou None
+            se a dimensão ainda não foi materializada
+        """
+        chave = self._chave_publicada(colecao, dimensao)
+        if chave is None:
+            return None
+
+        filtro = {"colecao": colecao, "dimensao": chave}
+        if ignorar_nulos:
+            filtro["valor"] = {"$ne": None}
+
+        cursor = self.contagens.find(filtro, {"_id": 0, "valor": 1, "count": 1}).sort("count", DESCENDING).limit(limite)
+        return [{"_id": doc.get("valor"), "count": doc["count"]} for doc in cursor]
+
+
+# Instância global dos rankings
+rankings_materializados = RankingsMaterializados()
+
+
+def _ao_alterar_colecao(colecao: str, evento: str, registros=None):
+    """Mantém os rankings sincronizados com importações e exclusões."""
+    if evento == EVENTO_IMPORTACAO:
+        rankings_materializados.atualizar_incremental(colecao, registros)
+    elif evento == EVENTO_EXCLUSAO:
+        rankings_materializados.remover_colecao(colecao)
+
+
+registrar_ouvinte(_ao_alterar_colecao, PRIORIDADE_DERIVADOS)
+
+
+def obter_rankings() -> RankingsMaterializados:
+    """Retorna a instância global dos rankings materializados."""
+    return rankings_materializados
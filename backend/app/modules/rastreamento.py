@@ -0,0 +1,306 @@
+"""
+Rastreamento por estágios e métricas no formato do Prometheus.
+
+Cada operação rastreada (uma pergunta ao agente, uma importação, uma análise
+de fraude) abre um rastro; os estágios dentro dela abrem spans aninhados, com
+duração e contagens (registros, documentos, suspeitas...). Ao fechar o rastro,
+ele é impresso como uma linha JSON, em vez dos prints soltos de cada etapa.
+
+As durações dos spans também alimentam histogramas por componente e estágio,
+e as contagens alimentam contadores; /metrics exporta tudo no formato texto
+do Prometheus, junto com os valores dos coletores registrados (ex.: taxas de
+acerto dos caches). As métricas são do processo (um conjunto por worker).
+"""
+
+import json
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+from database import db_config
+
+
+COMPONENTE_AGENTE = "agente"
+COMPONENTE_IMPORTACAO = "importacao"
+COMPONENTE_FRAUDE = "fraude"
+
+# Histograma de todos os spans: componente e estágio como rótulos
+METRICA_ESTAGIO = "estagio_duracao_segundos"
+# Contagens registradas nos spans: componente, estágio e item como rótulos
+METRICA_ITENS = "estagio_itens_total"
+# Duração total de cada pergunta ao agente: intenção e caminho da resposta como rótulos
+METRICA_PERGUNTA = "agente_pergunta_duracao_segundos"
+
+TIPO_HISTOGRAMA = "histogram"
+TIPO_CONTADOR = "counter"
+TIPO_GAUGE = "gauge"
+
+Rotulos = Tuple[Tuple[str, str], ...]
+
+
+class Span:
+    """Estágio rastreado: nome, início relativo ao rastro, duração e atributos."""
+
+    def __init__(self, componente: str, nome: str, atributos: Dict[str, Any], profundidade: int):
+        self.componente = componente
+        self.nome = nome
+        self.atributos = dict(atributos)
+        self.profundidade = profundidade
+        self.inicio = time.perf_counter()
+        self.duracao = None
+
+    def definir(self, **atributos):
+        """Acrescenta atributos ao span (contagens numéricas viram contadores)."""
+        self.atributos.update(atributos)
+
+    def para_dict(self, inicio_rastro: float) -> Dict[str, Any]:
+        return {
+            "estagio": self.nome,
+            "inicio_ms": round((self.inicio - inicio_rastro) * 1000, 2),
+            "duracao_ms": round((self.duracao or 0.0) * 1000, 2),
+            "profundidade": self.profundidade,
+            **self.atributos
+        }
+
+
+class Rastro:
+    """Spans de uma operação, na ordem em que terminaram."""
+
+    def __init__(self, componente: str, nome: str, atributos: Dict[str, Any]):
+        self.componente = componente
+        self.nome = nome
+        self.atributos = dict(atributos)
+        self.inicio = time.perf_counter()
+        self.duracao = None
+        self.spans: List[Span] = []
+        self.abertos = 0
+        self._lock = threading.Lock()
+
+    def definir(self, **atributos):
+        """Acrescenta atributos à operação (ex.: intenção interpretada)."""
+        self.atributos.update(atributos)
+
+    def adicionar(self, span: Span):
+        with self._lock:
+            self.spans.append(span)
+
+    def para_dict(self) -> Dict[str, Any]:
+        with self._lock:
+            spans = sorted(self.spans, key=lambda span: span.inicio)
+        return {
+            "rastro": self.nome,
+            "componente": self.componente,
+            "duracao_ms": round((self.duracao or time.perf_counter() - self.inicio) * 1000, 2),
+            **self.atributos,
+            "spans": [span.para_dict(self.inicio) for span in spans]
+        }
+
+
+_rastro_atual: ContextVar[Optional[Rastro]] = ContextVar("rastro_atual", default=None)
+
+
+def _escapar(valor: Any) -> str:
+    return str(valor).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+
+def _formatar_rotulos(rotulos: Rotulos, extra: Tuple[str, str] = None) -> str:
+    pares = list(rotulos) + ([extra] if extra else [])
+    if not pares:
+        return ""
+    return "{" + ",".join(f'{nome}="{_escapar(valor)}"' for nome, valor in pares) + "}"
+
+
+def _formatar_numero(valor: float) -> str:
+    if valor == float("inf"):
+        return "+Inf"
+    return repr(float(valor)) if isinstance(valor, float) else str(valor)
+
+
+class RegistroMetricas:
+    """Histogramas, contadores e coletores exportados no formato do Prometheus."""
+
+    def __init__(self, buckets: List[float] = None):
+        """
+        Args:
+            buckets: Limites dos histogramas em segundos (padrão da configuração)
+        """
+        self.buckets = sorted(buckets or db_config.RASTREAMENTO_BUCKETS)
+        self._lock = threading.Lock()
+        self._descricoes: Dict[str, Tuple[str, str]] = {}
+        # nome -> rótulos -> [contagens por bucket..., soma, total]
+        self._histogramas: Dict[str, Dict[Rotulos, List[float]]] = {}
+        self._contadores: Dict[str, Dict[Rotulos, float]] = {}
+        self._coletores: List[Callable[[], List[Tuple[str, str, str, List[Tuple[Dict[str, str], float]]]]]] = []
+
+    def descrever(self, nome: str, tipo: str, descricao: str):
+        """Registra o tipo e o texto de ajuda da métrica."""
+        with self._lock:
+            self._descricoes[nome] = (tipo, descricao)
+
+    def observar(self, nome: str, valor: float, **rotulos):
+        """Registra uma observação no histograma."""
+        chave = tuple(sorted((rotulo, str(dado)) for rotulo, dado in rotulos.items()))
+        with self._lock:
+            series = self._histogramas.setdefault(nome, {})
+            contagens = series.get(chave)
+            if contagens is None:
+                contagens = series[chave] = [0] * len(self.buckets) + [0.0, 0]
+            for posicao, limite in enumerate(self.buckets):
+                if valor <= limite:
+                    contagens[posicao] += 1
+            contagens[-2] += valor
+            contagens[-1] += 1
+
+    def incrementar(self, nome: str, valor: float = 1, **rotulos):
+        """Soma ao contador."""
+        chave = tuple(sorted((rotulo, str(dado)) for rotulo, dado in rotulos.items()))
+        with self._lock:
+            series = self._contadores.setdefault(nome, {})
+            series[chave] = series.get(chave, 0) + valor
+
+    def registrar_coletor(self, coletor: Callable[[], List[Tuple[str, str, str, List[Tuple[Dict[str, str], float]]]]]):
+        """
+        Registra uma função chamada a cada exportação.
+
+        Args:
+            coletor: Retorna uma lista de (nome, tipo, descrição, [(rótulos, valor)])
+        """
+        with self._lock:
+            self._coletores.append(coletor)
+
+    def exportar(self) -> str:
+        """Métricas no formato texto do Prometheus (versão 0.0.4)."""
+        linhas = []
+        with self._lock:
+            histogramas = {nome: {chave: list(valores) for chave, valores in series.items()}
+                           for nome, series in self._histogramas.items()}
+            contadores = {nome: dict(series) for nome, series in self._contadores.items()}
+            descricoes = dict(self._descricoes)
+            coletores = list(self._coletores)
+
+        def cabecalho(nome: str, tipo: str):
+            descricao = descricoes.get(nome, (tipo, nome))[1]
+            linhas.append(f"# HELP {nome} {descricao}")
+            linhas.append(f"# TYPE {nome} {tipo}")
+
+        for nome, series in sorted(histogramas.items()):
+            cabecalho(nome, TIPO_HISTOGRAMA)
+            for rotulos, valores in sorted(series.items()):
+                # Os buckets já são cumulativos (cada observação conta em todos os limites acima dela)
+                for limite, contagem in zip(self.buckets + [float("inf")], valores[:-2] + [valores[-1]]):
+                    linhas.append(f"{nome}_bucket{_formatar_rotulos(rotulos, ('le', _formatar_numero(limite)))} {contagem}")
+                linhas.append(f"{nome}_sum{_formatar_rotulos(rotulos)} {_formatar_numero(valores[-2])}")
+                linhas.append(f"{nome}_count{_formatar_rotulos(rotulos)} {valores[-1]}")
+
+        for nome, series in sorted(contadores.items()):
+            cabecalho(nome, TIPO_CONTADOR)
+            for rotulos, valor in sorted(series.items()):
+                linhas.append(f"{nome}{_formatar_rotulos(rotulos)} {_formatar_numero(valor)}")
+
+        for coletor in coletores:
+            try:
+                metricas = coletor()
+            except Exception as e:
+                print(f" Erro no coletor de métricas {getattr(coletor, '__name__', coletor)}: {e}")
+                continue
+            for nome, tipo, descricao, amostras in metricas:
+                linhas.append(f"# HELP {nome} {descricao}")
+                linhas.append(f"# TYPE {nome} {tipo}")
+                for rotulos, valor in amostras:
+                    chave = tuple(sorted((rotulo, str(dado)) for rotulo, dado in rotulos.items()))
+                    linhas.append(f"{nome}{_formatar_rotulos(chave)} {_formatar_numero(valor)}")
+
+        return "\n".join(linhas) + "\n"
+
+
+# Instância global do registro
+registro_metricas = RegistroMetricas()
+registro_metricas.descrever(METRICA_ESTAGIO, TIPO_HISTOGRAMA, "Duração de cada estágio rastreado, em segundos")
+registro_metricas.descrever(METRICA_ITENS, TIPO_CONTADOR, "Itens processados pelos estágios rastreados")
+registro_metricas.descrever(METRICA_PERGUNTA, TIPO_HISTOGRAMA,
+                            "Duração das perguntas ao agente por intenção e caminho da resposta, em segundos")
+
+
+def obter_registro_metricas() -> RegistroMetricas:
+    """Retorna a instância global do registro de métricas."""
+    return registro_metricas
+
+
+def rastro_atual() -> Optional[Rastro]:
+    """Rastro da operação em andamento no contexto atual (None fora de um rastro)."""
+    return _rastro_atual.get()
+
+
+@contextmanager
+def rastrear(componente: str, nome: str, **atributos) -> Iterator[Rastro]:
+    """
+    Abre o rastro de uma operação; os spans abertos dentro dela são anexados a ele.
+    Dentro de um rastro já aberto, apenas reaproveita o existente.
+
+    Args:
+        componente: Subsistema (agente, importacao, fraude)
+        nome: Operação (ex.: "pergunta")
+        atributos: Atributos iniciais da operação
+    """
+    existente = _rastro_atual.get()
+    if existente is not None:
+        existente.definir(**atributos)
+        yield existente
+        return
+
+    rastro = Rastro(componente, nome, atributos)
+    token = _rastro_atual.set(rastro)
+    try:
+        yield rastro
+    except Exception as e:
+        rastro.definir(erro=str(e))
+        raise
+    finally:
+        _rastro_atual.reset(token)
+        rastro.duracao = time.perf_counter() - rastro.inicio
+        if db_config.RASTREAMENTO_LOG:
+            print(f" Rastro: {json.dumps(rastro.para_dict(), ensure_ascii=False, default=str)}")
+
+
+@contextmanager
+def span(componente: str, nome: str, **atributos) -> Iterator[Span]:
+    """
+    Mede um estágio: duração no histograma do componente/estágio, contagens
+    numéricas nos contadores e o span no rastro atual (se houver).
+
+    Args:
+        componente: Subsistema (agente, importacao, fraude)
+        nome: Estágio (ex.: "interpretar", "cache", "llm")
+        atributos: Atributos iniciais; use span.definir() para as contagens
+    """
+    rastro = _rastro_atual.get()
+    atual = Span(componente, nome, atributos, rastro.abertos if rastro is not None else 0)
+    if rastro is not None:
+        rastro.abertos += 1
+    try:
+        yield atual
+    except Exception as e:
+        atual.definir(erro=str(e))
+        raise
+    finally:
+        atual.duracao = time.perf_counter() - atual.inicio
+        if rastro is not None:
+            rastro.abertos -= 1
+        registrar_span(atual, rastro)
+
+
+def registrar_span(atual: Span, rastro: Optional[Rastro] = None):
+    """
+    Registra um span já medido (também usado pelos callbacks do LangChain,
+    que medem início e fim em eventos separados).
+    """
+    if atual.duracao is None:
+        atual.duracao = time.perf_counter() - atual.inicio
+    registro_metricas.observar(METRICA_ESTAGIO, atual.duracao, componente=atual.componente, estagio=atual.nome)
+    for chave, valor in atual.atributos.items():
+        if isinstance(valor, (int, float)) and not isinstance(valor, bool):
+            registro_metricas.incrementar(METRICA_ITENS, valor, componente=atual.componente,
+                                          estagio=atual.nome, item=chave)
+    if rastro is not None:
+        rastro.adicionar(atual)
@@ -0,0 +1,113 @@
+"""
+Renderização das respostas HTML do agente.
+As respostas (tabelas, lista de coleções, inconsistências, relatório de fraude
+e avisos) vêm de templates Jinja em frontend/templates/respostas, compilados
+uma única vez na importação do módulo. A renderização gera os trechos em
+sequência e os junta no final, sem concatenar strings dentro de laços, e os
+estilos ficam em classes CSS (static/style.css) em vez de repetidos por linha.
+"""
+
+import os
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Sequence
+from jinja2 import Environment, FileSystemLoader, select_autoescape
+from markupsafe import Markup
+from modules.respostas_estruturadas import PADRAO_MARCADOR_TABELA, contem_marcadores, tabelas_da_resposta
+
+
+DIRETORIO_TEMPLATES = os.path.normpath(os.path.join(
+    os.path.dirname(__file__), '..', '..', '..', 'frontend', 'templates', 'respostas'
+))
+
+TEMPLATES_RESPOSTA = [
+    'tabela.html', 'aviso.html', 'colecoes.html', 'ranking.html',
+    'inconsistencias.html', 'relatorio_fraude.html'
+]
+
+# Tipos de aviso (classes aviso-<tipo>)
+AVISO_ERRO = "erro"
+AVISO_ALERTA = "alerta"
+AVISO_SUCESSO = "sucesso"
+
+ambiente = Environment(
+    loader=FileSystemLoader(DIRETORIO_TEMPLATES),
+    autoescape=select_autoescape(['html']),
+    trim_blocks=True,
+    lstrip_blocks=True,
+    # Os templates não mudam com a aplicação em execução
+    auto_reload=False
+)
+
+# Compilados na importação e reutilizados em todas as respostas
+_templates = {nome: ambiente.get_template(nome) for nome in TEMPLATES_RESPOSTA}
+
+
+def renderizar_stream(nome: str, **contexto: Any) -> Iterator[str]:
+    """
+    Renderiza um template em trechos, sem montar a resposta inteira.
+
+    Args:
+        nome: Nome do template (ex.: "tabela.html")
+        **contexto: Variáveis do template
+
+    Returns:
+        Iterador com os trechos de HTML
+    """
+    return _templates[nome].generate(**contexto)
+
+
+def renderizar(nome: str, **contexto: Any) -> str:
+    """Renderiza um template e junta os trechos uma única vez."""
+    return "".join(renderizar_stream(nome, **contexto))
+
+
+def renderizar_tabela(titulo: str, colunas: Sequence[str], linhas: Iterable[Sequence[Any]]) -> str:
+    """
+    Renderiza uma tabela. As células são escapadas pelo Jinja.
+
+    Args:
+        titulo: Título exibido acima da tabela
+        colunas: Cabeçalhos das colunas
+        linhas: Valores de cada linha (pode ser um gerador)
+
+    Returns:
+        HTML da tabela
+    """
+    return renderizar('tabela.html', titulo=titulo, colunas=colunas, linhas=linhas)
+
+
+def renderizar_resposta(conteudo: str, estruturada: Optional[Dict[str, Any]]) -> str:
+    """
+    HTML final de uma resposta: troca os marcadores de tabela pelas tabelas
+    renderizadas a partir das linhas da resposta estruturada.
+
+    Args:
+        conteudo: Texto da resposta (com ou sem marcadores)
+        estruturada: Resposta estruturada com as tabelas registradas
+
+    Returns:
+        Resposta em HTML/texto
+    """
+    if not contem_marcadores(conteudo):
+        return conteudo
+    tabelas = tabelas_da_resposta(estruturada)
+
+    def tabela(marcador) -> str:
+        dados = tabelas[int(marcador.group(1))]
+        return renderizar_tabela(dados["titulo"], dados["colunas"], iter(dados["linhas"]))
+
+    return PADRAO_MARCADOR_TABELA.sub(tabela, conteudo)
+
+
+def renderizar_nota(texto: str) -> str:
+    """Renderiza uma nota de alerta curta (ex.: aviso de ranking aproximado)."""
+    return str(Markup('<p class="resposta-aviso">{}</p>').format(texto))
+
+
+def renderizar_aviso(tipo: str, titulo: str, mensagem: str) -> str:
+    """Renderiza uma caixa de aviso (erro, alerta ou sucesso)."""
+    return renderizar('aviso.html', tipo=tipo, titulo=titulo, mensagem=mensagem)
+
+
+def templates_carregados() -> List[str]:
+    """Nomes dos templates compilados."""
+    return list(_templates)
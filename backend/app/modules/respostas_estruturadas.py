@@ -0,0 +1,148 @@
+"""
+Respostas estruturadas do agente.
+Além do HTML/texto, cada resposta direta pode ser devolvida como dados
+(tipo, título, colunas, linhas, resumo e links) para o navegador renderizar a
+tabela com rolagem virtual, sem trafegar a marcação de cada linha.
+
+As funções de formatação do agente registram as tabelas, resumos e links no
+coletor ativo (ContextVar) enquanto montam o HTML; fora de uma coleta os
+registros são ignorados.
+
+Dentro de uma coleta, as tabelas simples entram no HTML apenas como um
+marcador que aponta para a tabela registrada: a resposta guardada (e
+cacheada) leva as linhas uma única vez, na forma estruturada, e o HTML da
+tabela só é gerado quando alguém pede a resposta em HTML
+(renderizacao_respostas.renderizar_resposta).
+"""
+
+import re
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Sequence
+
+
+TIPO_TEXTO = "texto"
+TIPO_TABELA = "tabela"
+TIPO_HTML = "html"
+
+# Posição de uma tabela registrada dentro do texto da resposta
+MARCADOR_TABELA = "\x00tabela:{}\x00"
+PADRAO_MARCADOR_TABELA = re.compile("\x00tabela:(\\d+)\x00")
+
+
+class ColetorResposta:
+    """Partes estruturadas registradas durante a montagem de uma resposta."""
+
+    def __init__(self):
+        self.tabelas: List[Dict[str, Any]] = []
+        self.resumos: List[str] = []
+        self.links: List[Dict[str, str]] = []
+
+
+_coletor_atual: ContextVar[Optional[ColetorResposta]] = ContextVar("coletor_resposta", default=None)
+
+
+@contextmanager
+def coletar_resposta() -> Iterator[ColetorResposta]:
+    """Ativa um coletor para as partes estruturadas da resposta em montagem."""
+    coletor = ColetorResposta()
+    token = _coletor_atual.set(coletor)
+    try:
+        yield coletor
+    finally:
+        _coletor_atual.reset(token)
+
+
+def coletor_ativo() -> Optional[ColetorResposta]:
+    """Retorna o coletor da resposta em montagem (None fora de uma coleta)."""
+    return _coletor_atual.get()
+
+
+def _valor_json(valor: Any) -> Any:
+    """Mantém números, textos e nulos; o restante vira texto."""
+    if valor is None or isinstance(valor, (str, int, float, bool)):
+        return valor
+    return str(valor)
+
+
+def registrar_tabela(titulo: str, colunas: Sequence[str], linhas: Iterable[Sequence[Any]]) -> Optional[str]:
+    """
+    Registra uma tabela da resposta.
+
+    Args:
+        linhas: Valores de cada linha (pode ser um gerador, percorrido uma vez)
+
+    Returns:
+        Marcador da tabela para o texto da resposta, ou None fora de uma coleta
+    """
+    coletor = _coletor_atual.get()
+    if coletor is None:
+        return None
+    coletor.tabelas.append({
+        "titulo": titulo,
+        "colunas": [str(coluna) for coluna in colunas],
+        "linhas": [[_valor_json(valor) for valor in linha] for linha in linhas]
+    })
+    return MARCADOR_TABELA.format(len(coletor.tabelas) - 1)
+
+
+def registrar_resumo(texto: str):
+    """Registra um texto de resumo (totais, avisos, tempos)."""
+    coletor = _coletor_atual.get()
+    if coletor is not None and texto:
+        coletor.resumos.append(texto)
+
+
+def registrar_link(rotulo: str, url: str):
+    """Registra um link relacionado à resposta (relatórios, downloads)."""
+    coletor = _coletor_atual.get()
+    if coletor is not None:
+        coletor.links.append({"rotulo": rotulo, "url": url})
+
+
+def montar_resposta(conteudo: str, coletor: Optional[ColetorResposta] = None) -> Dict[str, Any]:
+    """
+    Monta a resposta estruturada.
+
+    Args:
+        conteudo: Resposta em HTML ou texto
+        coletor: Partes registradas durante a montagem (None para texto puro)
+
+    Returns:
+        Dicionário com tipo, titulo, colunas, linhas, resumo, links e secoes
+        (tabelas adicionais). Respostas em HTML sem tabela levam o HTML em "conteudo".
+    """
+    conteudo = conteudo or ""
+    tabelas = coletor.tabelas if coletor else []
+    links = coletor.links if coletor else []
+    resumo = "\n".join(coletor.resumos) if coletor and coletor.resumos else None
+
+    if tabelas:
+        principal = tabelas[0]
+        return {
+            "tipo": TIPO_TABELA,
+            "titulo": principal["titulo"],
+            "colunas": principal["colunas"],
+            "linhas": principal["linhas"],
+            "resumo": resumo,
+            "links": links,
+            "secoes": tabelas[1:]
+        }
+
+    if conteudo.lstrip().startswith("<"):
+        return {"tipo": TIPO_HTML, "conteudo": conteudo, "resumo": resumo, "links": links}
+
+    return {"tipo": TIPO_TEXTO, "resumo": conteudo, "links": links}
+
+
+def contem_marcadores(conteudo: Optional[str]) -> bool:
+    """Indica se o texto da resposta ainda tem tabelas a renderizar."""
+    return bool(conteudo) and PADRAO_MARCADOR_TABELA.search(conteudo) is not None
+
+
+def tabelas_da_resposta(estruturada: Optional[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Tabelas da resposta estruturada na ordem em que foram registradas (a dos marcadores)."""
+    if not estruturada or estruturada.get("tipo") != TIPO_TABELA:
+        return []
+    principal = {chave: estruturada[chave] for chave in ("titulo", "colunas", "linhas")}
+    return [principal] + list(estruturada.get("secoes", []))
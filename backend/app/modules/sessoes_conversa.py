@@ -0,0 +1,105 @@
+"""
+Pool de sessões de conversa do agente.
+Cada sessão tem sua própria memória e chain conversacional, enquanto o
+vectorstore e o cliente do LLM continuam compartilhados pelo agente.
+Sessões ociosas são despejadas por LRU quando o limite é atingido.
+"""
+
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict
+
+
+class SessaoConversa:
+    """Estado de conversa de uma sessão: memória, chain e lock próprio."""
+
+    def __init__(self, sessao_id: str, chain: Any, memoria: Any):
+        self.sessao_id = sessao_id
+        self.chain = chain
+        self.memoria = memoria
+        # Serializa apenas as perguntas da mesma sessão
+        self.lock = threading.Lock()
+        self.criada_em = time.time()
+        self.ultimo_acesso = self.criada_em
+
+
+class PoolSessoes:
+    """
+    Mantém as sessões de conversa ativas com despejo LRU.
+    Seguro para uso concorrente: o dicionário de sessões é protegido por um
+    lock do pool e cada sessão tem o seu lock para a execução da chain.
+    """
+
+    def __init__(self, fabrica_sessao: Callable[[str], SessaoConversa], max_sessoes: int):
+        """
+        Args:
+            fabrica_sessao: Função que cria a sessão (memória + chain) para um ID
+            max_sessoes: Quantidade máxima de sessões mantidas em memória
+        """
+        self.fabrica_sessao = fabrica_sessao
+        self.max_sessoes = max_sessoes
+        self._sessoes = OrderedDict()
+        self._lock = threading.Lock()
+        self.criadas = 0
+        self.despejadas = 0
+
+    def obter(self, sessao_id: str) -> SessaoConversa:
+        """
+        Retorna a sessão do ID informado, criando-a se necessário.
+
+        Args:
+            sessao_id: ID da sessão de conversa
+
+        Returns:
+            Sessão marcada como a mais recentemente usada
+        """
+        with self._lock:
+            sessao = self._sessoes.get(sessao_id)
+            if sessao is not None:
+                self._sessoes.move_to_end(sessao_id)
+                sessao.ultimo_acesso = time.time()
+                return sessao
+
+        # A criação pode ser lenta (ex.: carregar histórico), então ocorre fora do lock
+        nova = self.fabrica_sessao(sessao_id)
+
+        with self._lock:
+            sessao = self._sessoes.get(sessao_id)
+            if sessao is None:
+                sessao = nova
+                self._sessoes[sessao_id] = sessao
+                self.criadas += 1
+                while len(self._sessoes) > self.max_sessoes:
+                    despejada_id, _ = self._sessoes.popitem(last=False)
+                    self.despejadas += 1
+                    print(f" Sessão despejada do pool (LRU): {despejada_id}")
+            else:
+                self._sessoes.move_to_end(sessao_id)
+            sessao.ultimo_acesso = time.time()
+            return sessao
+
+    def remover(self, sessao_id: str) -> bool:
+        """Remove a sessão do pool. Retorna True se ela existia."""
+        with self._lock:
+            return self._sessoes.pop(sessao_id, None) is not None
+
+    def limpar(self):
+        """Remove todas as sessões."""
+        with self._lock:
+            self._sessoes.clear()
+
+    def tamanho(self) -> int:
+        """Retorna a quantidade de sessões ativas."""
+        with self._lock:
+            return len(self._sessoes)
+
+    def estatisticas(self) -> Dict[str, Any]:
+        """Retorna contadores de uso do pool."""
+        with self._lock:
+            return {
+                "sessoes_ativas": len(self._sessoes),
+                "max_sessoes": self.max_sessoes,
+                "criadas": self.criadas,
+                "despejadas": self.despejadas
+            }
@@ -3,7 +3,7 @@
 Sistema de Análise Inteligente de Dados
 Aplicação Flask principal para gerenciamento de dados com IA
 """
-from flask import Flask, request, render_template, redirect, url_for, flash, jsonify, send_file
+from flask import Flask, request, render_template, redirect, url_for, flash, jsonify, send_file, Response, stream_with_context, session
 from pymongo import MongoClient
 from bson import ObjectId
 import sys
@@ -11,6 +11,7 @@ import os
 import tempfile
 import re
 import tempfile
+import json
 from datetime import datetime
 
 # Adiciona o backend ao path do Python
@@ -18,94 +19,180 @@ sys.path.append(os.path.join(os.path.dirname(__file__), 'backend', 'app'))
 
 # Imports dos módulos do backend
 import database.db_config as db_config
-from modules.importar_csv import importar_csv_para_mongo
-from agents.mongodb_agent import MongoDBAgent
+# O agente (LangChain, FAISS) e a importação (pandas) são carregados no primeiro
+# uso: /health e o navegador de coleções não pagam esse custo na subida
 from modules.historico_conversas import obter_gerenciador
+from modules.metricas_memoria import obter_metricas_memoria
+# Importado na subida porque registra a invalidação do cache persistente do LLM
+from modules.armazenamento_cache_llm import obter_armazenamento_cache_llm
+from modules.coalescencia import obter_coalescedor
+from modules.planejador_consultas import obter_planejador
+from modules.catalogo_colecoes import obter_catalogo
+from modules.corpus_vetorial import obter_construtor_corpus
+from modules.codificacao_documentos import obter_codificador_documentos
+# Também registra a atualização do índice de identificadores a cada importação/exclusão
+from modules.indice_identificadores import obter_indice_identificadores
+from modules.analise_inconsistencias import obter_analisador_inconsistencias, CAMPOS_COMPARAVEIS
+from modules.dimensao_datas import obter_dimensao_datas, eh_campo_data, PREFIXO_CAMPO_TIPADO
+from modules.eventos_colecoes import notificar_alteracao, EVENTO_EXCLUSAO
+from modules.middleware_http import registrar_middleware_http, politica_cache
+from modules.aquecimento_agente import AquecimentoAgente
+from modules.rastreamento import obter_registro_metricas, TIPO_CONTADOR, TIPO_GAUGE
+from modules.renderizacao_respostas import renderizar_resposta
+from modules.perfilamento import perfilavel
+# Registra os ouvintes dos eventos de coleção (rankings, resumos e cache compartilhado)
+from modules.rankings_materializados import CAMPO_GERACOES
+import modules.heavy_hitters
+import modules.cache_consultas
 
 # Configuração da aplicação Flask
 app = Flask(__name__, template_folder='frontend/templates', static_folder='frontend/static')
 app.secret_key = "supersecret"
+app.config["SEND_FILE_MAX_AGE_DEFAULT"] = db_config.CACHE_ESTATICOS_SEGUNDOS
+# Compressão (gzip/brotli), ETag e Cache-Control das respostas
+registrar_middleware_http(app)
 
 # Conexão com o banco de dados MongoDB
 client = MongoClient(db_config.MONGO_URI)
 db = client[db_config.DB_NAME]
 
-# Agente IA será inicializado quando necessário (lazy loading)
-mongodb_agent = None
+def criar_agente():
+    """Cria o agente; o módulo do agente (LangChain) é importado aqui."""
+    from agents.mongodb_agent import MongoDBAgent
+    return MongoDBAgent(
+        mongo_uri=db_config.MONGO_URI,
+        database_name=db_config.DB_NAME
+    )
+
+
+# Agente IA inicializado em segundo plano, por estágios: consultas diretas
+# assim que o MongoDB conecta, fallback para o LLM quando o índice vetorial fica pronto
+aquecimento = AquecimentoAgente(criar_agente)
 
 # Gerenciador de histórico de conversas
 gerenciador_historico = obter_gerenciador()
-sessao_atual = None
-historico_atual = []
+
+# Catálogo de coleções (nomes e contagens em cache)
+catalogo = obter_catalogo()
+dimensao_datas = obter_dimensao_datas()
 
 def get_mongodb_agent():
-    """Obtém ou cria o agente MongoDB para consultas com IA"""
-    global mongodb_agent
-    if mongodb_agent is None:
-        try:
-            print("Inicializando agente MongoDB...")
-            mongodb_agent = MongoDBAgent(
-                mongo_uri=db_config.MONGO_URI,
-                database_name=db_config.DB_NAME
-            )
-            mongodb_agent.conectar_mongodb()
-            mongodb_agent.criar_agente()
-            print("Agente MongoDB inicializado com sucesso!")
-        except Exception as e:
-            print(f"Erro ao inicializar agente: {e}")
-            print("Verifique se o MongoDB está rodando e se a chave da OpenAI está configurada.")
-            return None
-    return mongodb_agent
+    """
+    Obtém o agente MongoDB para consultas com IA.
+    Aguarda apenas a conexão com o MongoDB; o índice vetorial continua
+    sendo criado em segundo plano.
+    """
+    agente = aquecimento.obter_agente()
+    if agente is None:
+        print("Agente ainda não disponível. Verifique se o MongoDB está rodando.")
+    return agente
+
+
+# Cada processo (inclusive cada worker) começa a aquecer o agente ao importar a aplicação
+if db_config.AQUECIMENTO_AUTOMATICO:
+    aquecimento.iniciar()
 
 
 def inicializar_historico():
-    """Inicializa o histórico de conversas."""
-    global sessao_atual, historico_atual
-    
+    """Conecta o gerenciador de histórico de conversas."""
     try:
         gerenciador_historico.conectar()
-        sessao_atual, historico_atual = gerenciador_historico.carregar_ultima_sessao()
-        print(f"Histórico inicializado - Sessão: {sessao_atual}")
-        print(f"{len(historico_atual)} mensagens carregadas")
+        print("Histórico de conversas inicializado")
     except Exception as e:
         print(f"Erro ao inicializar histórico: {e}")
-        # Criar nova sessão mesmo com erro
-        sessao_atual = gerenciador_historico.gerar_id_sessao()
-        historico_atual = []
-        print(f"Nova sessão criada: {sessao_atual}")
 
 
-def salvar_mensagem_historico(tipo: str, conteudo: str):
-    """Salva uma mensagem no histórico."""
-    global sessao_atual, historico_atual
-    
+def obter_sessao_id() -> str:
+    """
+    Obtém o ID da sessão de conversa do usuário atual.
+    O ID fica no cookie de sessão do Flask; cada navegador tem sua própria
+    conversa (memória do agente e histórico persistido).
+    """
+    sessao_id = session.get("sessao_id")
+    if not sessao_id:
+        sessao_id = gerenciador_historico.gerar_id_sessao()
+        session["sessao_id"] = sessao_id
+        session.permanent = True
+        print(f"Nova sessão criada: {sessao_id}")
+    return sessao_id
+
+
+def salvar_mensagem_historico(sessao_id: str, tipo: str, conteudo: str, caminho: str = None, estruturada=None):
+    """Salva uma mensagem no histórico da sessão."""
     try:
-        if sessao_atual:
-            gerenciador_historico.salvar_mensagem(sessao_atual, tipo, conteudo)
-            
-            # Adicionar à lista local
-            mensagem = {
-                "tipo": tipo,
-                "conteudo": conteudo,
-                "timestamp": datetime.now().isoformat()
-            }
-            historico_atual.append(mensagem)
-            
+        if sessao_id:
+            gerenciador_historico.salvar_mensagem(sessao_id, tipo, conteudo, caminho=caminho, estruturada=estruturada)
     except Exception as e:
         print(f"Erro ao salvar mensagem no histórico: {e}")
 
 
 @app.route("/")
 def index():
-    # Filtrar coleções para não mostrar coleções do sistema
-    todas_colecoes = db.list_collection_names()
-    colecoes = [col for col in todas_colecoes if col not in ['historico_conversas', 'system.indexes']]
-    return render_template("index.html", colecoes=colecoes, historico=historico_atual)
+    # Catálogo em cache (já exclui as coleções do sistema)
+    colecoes = catalogo.nomes()
+    sessao_id = obter_sessao_id()
+    return render_template("index.html", colecoes=colecoes, sessao_id=sessao_id)
 
 @app.route("/health")
+@politica_cache("no-store")
 def health():
-    return jsonify({"status": "ok", "message": "Aplicação funcionando"})
-
+    """Situação da aplicação e dos estágios de aquecimento do agente (com duração de cada um)."""
+    return jsonify({
+        "status": "ok",
+        "message": "Aplicação funcionando",
+        "agente": aquecimento.estado()
+    })
+
+
+
+def coletar_metricas_caches():
+    """Acertos, falhas e taxa de acerto dos caches e execuções coalescidas, para o /metrics."""
+    caches = {"consultas": modules.cache_consultas.obter_cache_consultas().estatisticas()}
+    if obter_armazenamento_cache_llm() is not None:
+        caches["llm"] = obter_armazenamento_cache_llm().estatisticas()
+    coalescencia = obter_coalescedor().estatisticas()
+    return [
+        ("cache_acertos_total", TIPO_CONTADOR, "Acertos dos caches da aplicação",
+         [({"cache": nome}, dados["acertos"]) for nome, dados in caches.items()]),
+        ("cache_falhas_total", TIPO_CONTADOR, "Falhas dos caches da aplicação",
+         [({"cache": nome}, dados["falhas"]) for nome, dados in caches.items()]),
+        ("cache_taxa_acerto", TIPO_GAUGE, "Taxa de acerto dos caches (0 a 1)",
+         [({"cache": nome}, dados["taxa_acerto"]) for nome, dados in caches.items()]),
+        ("coalescencia_requisicoes_total", TIPO_CONTADOR, "Perguntas executadas e coalescidas",
+         [({"resultado": "executada"}, coalescencia["execucoes"]),
+          ({"resultado": "coalescida"}, coalescencia["coalescidas"])]),
+        ("agente_pronto", TIPO_GAUGE, "Agente com o fallback para o LLM disponível (1) ou não (0)",
+         [({}, int(aquecimento.estado()["llm"]))])
+    ]
+
+
+obter_registro_metricas().registrar_coletor(coletar_metricas_caches)
+
+
+@app.route("/metrics")
+@politica_cache("no-store")
+def metricas():
+    """Métricas no formato do Prometheus: latência por estágio e por intenção, contagens e caches."""
+    return Response(obter_registro_metricas().exportar(), mimetype="text/plain; version=0.0.4; charset=utf-8")
+
+@app.route("/agente/estatisticas")
+@politica_cache("no-store")
+def estatisticas_agente():
+    """Retorna estatísticas das sessões do agente, da memória e do cache do LLM."""
+    estatisticas = {"memoria": obter_metricas_memoria().estatisticas()}
+    if obter_armazenamento_cache_llm() is not None:
+        estatisticas["cache_llm"] = obter_armazenamento_cache_llm().estatisticas()
+    estatisticas["coalescencia"] = obter_coalescedor().estatisticas()
+    estatisticas["planejador"] = obter_planejador().estatisticas()
+    estatisticas["corpus_vetorial"] = obter_construtor_corpus().estatisticas()
+    estatisticas["codificacao_documentos"] = obter_codificador_documentos().estatisticas()
+    estatisticas["indice_identificadores"] = obter_indice_identificadores().estatisticas()
+    agente = aquecimento.agente
+    if agente is not None and agente.sessoes is not None:
+        estatisticas["sessoes"] = agente.sessoes.estatisticas()
+    if agente is not None:
+        estatisticas["indice_vetorial"] = agente.info_indice_vetorial
+    return jsonify(estatisticas)
 
 @app.route("/importar", methods=["POST"])
 def importar():
@@ -127,6 +214,7 @@ def importar():
         return redirect(url_for("index"))
 
     try:
+        from modules.importar_csv import importar_csv_para_mongo
         importar_csv_para_mongo(caminho, nome_arquivo=nome_arquivo)
         flash(f"Importação concluída: {nome_arquivo or caminho}")
     except Exception as e:
@@ -139,7 +227,23 @@ from datetime import datetime, time as dt_time
 import re
 from datetime import datetime, time as dt_time
 
+
+def interpretar_data_filtro(texto):
+    """Interpreta a data do formulário (YYYY-MM-DD do input date, DD/MM/YYYY ou livre)."""
+    for formato in ("%Y-%m-%d", "%d/%m/%Y"):
+        try:
+            return datetime.strptime(texto, formato)
+        except ValueError:
+            pass
+    try:
+        from dateutil import parser
+        return parser.parse(texto, dayfirst=True)
+    except Exception:
+        return None
+
+
 @app.route("/colecao/<nome>")
+@perfilavel
 def ver_colecao(nome):
     page = int(request.args.get("page", 1))
     per_page = int(request.args.get("per_page", 20))
@@ -147,6 +251,7 @@ def ver_colecao(nome):
 
     # parâmetros do formulário (campo único de data)
     data_str = request.args.get("data", "").strip()   # aceita YYYY-MM-DD (input date) ou DD/MM/YYYY
+    data_fim_str = request.args.get("data_fim", "").strip()   # opcional: fim do intervalo
     loja_input = request.args.get("loja", "").strip()
     sku_input = request.args.get("sku", "").strip()
 
@@ -163,6 +268,7 @@ def ver_colecao(nome):
                 per_page=per_page,
                 total_pages=0,
                 data=data_str,
+                data_fim=data_fim_str,
                 loja=loja_input,
                 sku=sku_input,
             )
@@ -171,58 +277,36 @@ def ver_colecao(nome):
         key_map = {k.lower(): k for k in sample.keys()}
 
         # detectar colunas que contenham 'data' (case-insensitive)
-        date_fields = [k for k in sample.keys() if "data" in k.lower()]
+        date_fields = [k for k in sample.keys() if eh_campo_data(k)]
 
         filters = []
 
-        # --- FILTRO POR DATA (única data)
+        # --- FILTRO POR DATA (data única ou intervalo data..data_fim)
         if data_str and date_fields:
-            # tentar interpretar input em diferentes formatos
-            parsed_date = None
-            # tenta ISO (YYYY-MM-DD)
-            try:
-                parsed_date = datetime.strptime(data_str, "%Y-%m-%d")
-            except Exception:
-                # tenta DD/MM/YYYY
-                try:
-                    parsed_date = datetime.strptime(data_str, "%d/%m/%Y")
-                except Exception:
-                    # ultima tentativa: dateutil parser, se quiser
-                    try:
-                        from dateutil import parser
-                        parsed_date = parser.parse(data_str, dayfirst=True)
-                    except Exception:
-                        parsed_date = None
+            parsed_date = interpretar_data_filtro(data_str)
+            parsed_date_fim = interpretar_data_filtro(data_fim_str) if data_fim_str else parsed_date
 
             # se conseguiu parse -> construir filtros
             or_clauses = []
-            if parsed_date:
+            if parsed_date and parsed_date_fim:
                 dt_start = datetime.combine(parsed_date.date(), dt_time.min)
-                dt_end = datetime.combine(parsed_date.date(), dt_time.max)
+                dt_end = datetime.combine(parsed_date_fim.date(), dt_time.max)
                 for f in date_fields:
                     example_val = sample.get(f)
+                    sval = str(example_val) if example_val is not None else ""
                     if isinstance(example_val, datetime):
-                        # campo datetime no Mongo: busca por intervalo do dia
+                        # campo datetime no Mongo: busca pelo intervalo
                         or_clauses.append({f: {"$gte": dt_start, "$lte": dt_end}})
+                    elif re.match(r"^\d{2}/\d{2}/\d{4}", sval):
+                        # campo texto DD/MM/YYYY: executor de intervalos (campo tipado indexado)
+                        or_clauses.append(dimensao_datas.filtro_intervalo(
+                            nome, f, dt_start.strftime("%d/%m/%Y"), dt_end.strftime("%d/%m/%Y")
+                        ))
                     else:
-                        # campo string: checar formato do exemplo e comparar string formatada
-                        sval = str(example_val) if example_val is not None else ""
-                        # se exemplo contém '/', supomos dd/mm/YYYY
-                        candidates = []
-                        if "/" in sval:
-                            candidates.append(parsed_date.strftime("%d/%m/%Y"))
-                        # se exemplo contém '-', supomos YYYY-MM-DD
-                        if "-" in sval:
-                            candidates.append(parsed_date.strftime("%Y-%m-%d"))
-                        # sempre tente também ambas representações
-                        candidates.append(parsed_date.strftime("%d/%m/%Y"))
-                        candidates.append(parsed_date.strftime("%Y-%m-%d"))
-
-                        # criar regex que bate qualquer das representações exatas
-                        regex_parts = [re.escape(c) for c in dict.fromkeys(candidates) if c]
-                        if regex_parts:
-                            pattern = r"^(?:" + "|".join(regex_parts) + r")$"
-                            or_clauses.append({f: {"$regex": pattern}})
+                        # outros formatos de texto: comparação exata com a data inicial
+                        candidates = [dt_start.strftime("%Y-%m-%d"), dt_start.strftime("%d/%m/%Y")]
+                        pattern = r"^(?:" + "|".join(re.escape(c) for c in candidates) + r")$"
+                        or_clauses.append({f: {"$regex": pattern}})
                 if or_clauses:
                     filters.append({"$or": or_clauses})
             else:
@@ -261,14 +345,18 @@ def ver_colecao(nome):
             query = {"$and": filters}
 
         # consulta com paginação
-        total_docs = db[nome].count_documents(query)
+        # Sem filtros, a contagem estimada do catálogo evita varrer a coleção
+        total_docs = catalogo.contagem(nome) if not query else db[nome].count_documents(query)
         docs = list(db[nome].find(query).skip(skip).limit(per_page))
 
-        # normalizar docs para template e remover _hash
+        # normalizar docs para template e remover _hash e as datas tipadas derivadas
         for documento in docs:
             if "_id" in documento and isinstance(documento["_id"], ObjectId):
                 documento["_id"] = str(documento["_id"])
             documento.pop("_hash", None)
+            documento.pop(CAMPO_GERACOES, None)
+            for campo in [k for k in documento if k.startswith(PREFIXO_CAMPO_TIPADO)]:
+                documento.pop(campo)
 
         # colunas baseadas nas chaves dos docs retornados (sem _hash)
         colunas = sorted({k for doc in docs for k in doc.keys() if k != "_hash"})
@@ -284,6 +372,7 @@ def ver_colecao(nome):
             per_page=per_page,
             total_pages=total_pages,
             data=data_str,
+            data_fim=data_fim_str,
             loja=loja_input,
             sku=sku_input,
         )
@@ -296,21 +385,45 @@ def ver_colecao(nome):
 @app.route("/colecao/<nome>/excluir", methods=["POST"])
 def excluir_colecao(nome):
     db[nome].drop()
+    notificar_alteracao(nome, EVENTO_EXCLUSAO)
     flash(f"Coleção '{nome}' excluída")
     return redirect(url_for("index"))
 
 
+def montar_resposta_chat(resultado, formato):
+    """
+    Monta o payload das respostas do chat.
+    
+    Com formato "estruturado", envia a resposta estruturada (tipo, colunas,
+    linhas, resumo, links) em "structured" no lugar do HTML, que só é
+    renderizado (a partir das linhas estruturadas) no formato "html".
+    """
+    payload = {"sources": resultado.get("documentos_fonte", [])}
+    if formato == "estruturado" and resultado.get("estruturada"):
+        payload["structured"] = resultado["estruturada"]
+    else:
+        payload["response"] = renderizar_resposta(resultado["resposta"], resultado.get("estruturada"))
+    return payload
+
+
 @app.route("/chat", methods=["POST"])
+@perfilavel
 def chat():
-    """Endpoint para chat com o agente IA"""
+    """
+    Endpoint para chat com o agente IA.
+    
+    Corpo: {"message": ..., "formato": "html" (padrão) ou "estruturado"}
+    """
     try:
         data = request.get_json()
         message = data.get('message', '').strip()
+        formato = data.get('formato', 'html')
         
         if not message:
             return jsonify({"error": "Mensagem vazia"}), 400
         
-        salvar_mensagem_historico("usuario", message)
+        sessao_id = obter_sessao_id()
+        salvar_mensagem_historico(sessao_id, "usuario", message)
         
         agent = get_mongodb_agent()
         if not agent:
@@ -318,13 +431,10 @@ def chat():
                 "error": "Agente não disponível. Verifique se o MongoDB está rodando e se a OPENAI_API_KEY está configurada."
             }), 500
         
-        resultado = agent.perguntar(message)
-        salvar_mensagem_historico("agente", resultado["resposta"])
+        resultado = agent.perguntar(message, sessao_id=sessao_id)
+        salvar_mensagem_historico(sessao_id, "agente", resultado["resposta"], resultado.get("caminho"), resultado.get("estruturada"))
         
-        return jsonify({
-            "response": resultado["resposta"],
-            "sources": resultado.get("documentos_fonte", [])
-        })
+        return jsonify(montar_resposta_chat(resultado, formato))
         
     except Exception as e:
         print(f"Erro no chat: {e}")
@@ -333,19 +443,103 @@ def chat():
         }), 500
 
 
+def formatar_evento_sse(evento: str, dados) -> str:
+    """Formata um evento no padrão Server-Sent Events."""
+    return f"event: {evento}\ndata: {json.dumps(dados, ensure_ascii=False, default=str)}\n\n"
+
+
+@app.route("/chat/stream", methods=["POST"])
+def chat_stream():
+    """
+    Endpoint de chat com resposta em streaming (Server-Sent Events).
+    
+    Emite os eventos "inicio", "progresso" (um por algoritmo de detecção de
+    fraude), "token" (tokens do LLM conforme chegam) e "final" com o mesmo
+    payload do endpoint /chat.
+    """
+    data = request.get_json(silent=True) or {}
+    message = data.get('message', '').strip()
+    formato = data.get('formato', 'html')
+    
+    if not message:
+        return jsonify({"error": "Mensagem vazia"}), 400
+    
+    agent = get_mongodb_agent()
+    if not agent:
+        return jsonify({
+            "error": "Agente não disponível. Verifique se o MongoDB está rodando e se a OPENAI_API_KEY está configurada."
+        }), 500
+    
+    sessao_id = obter_sessao_id()
+    salvar_mensagem_historico(sessao_id, "usuario", message)
+    
+    def gerar():
+        try:
+            for evento, dados in agent.perguntar_stream(message, sessao_id=sessao_id):
+                if evento == "final":
+                    salvar_mensagem_historico(sessao_id, "agente", dados["resposta"], dados.get("caminho"), dados.get("estruturada"))
+                    dados = montar_resposta_chat(dados, formato)
+                yield formatar_evento_sse(evento, dados)
+        except Exception as e:
+            print(f"Erro no chat (stream): {e}")
+            yield formatar_evento_sse("erro", {"erro": f"Erro interno: {str(e)}"})
+    
+    return Response(
+        stream_with_context(gerar()),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@app.route("/inconsistencias")
+@politica_cache("private, max-age=30")
+def relatorio_inconsistencias():
+    """
+    Relatório paginado das inconsistências entre coleções.
+    
+    Parâmetros: campo (padrão SKU), pagina, por_pagina, origem, destino.
+    """
+    campo = request.args.get("campo", "SKU").strip().upper() or "SKU"
+    if campo not in CAMPOS_COMPARAVEIS:
+        return jsonify({"error": f"Campo inválido: use {', '.join(CAMPOS_COMPARAVEIS)}"}), 400
+    try:
+        pagina = max(int(request.args.get("pagina", 1)), 1)
+        por_pagina = min(max(int(request.args.get("por_pagina", 100)), 1), 1000)
+    except ValueError:
+        return jsonify({"error": "pagina e por_pagina devem ser números inteiros"}), 400
+    
+    try:
+        resultado = obter_analisador_inconsistencias().analisar(campo)
+        relatorio = resultado.pagina(
+            pagina, por_pagina,
+            origem=request.args.get("origem") or None,
+            destino=request.args.get("destino") or None
+        )
+        relatorio.update({
+            "colecoes": resultado.colecoes,
+            "valores_distintos": resultado.totais,
+            "pares": resultado.resumo_pares(),
+            "tempo_segundos": resultado.tempo_segundos
+        })
+        return jsonify(relatorio)
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
 @app.route("/historico/limpar", methods=["POST"])
 def limpar_historico():
-    """Limpa todo o histórico de conversas."""
+    """Limpa o histórico de conversas da sessão atual."""
     try:
-        gerenciador_historico.limpar_todo_historico()
-        global historico_atual
-        historico_atual = []
+        sessao_id = obter_sessao_id()
+        gerenciador_historico.limpar_historico_sessao(sessao_id)
+        agente = aquecimento.agente
+        if agente is not None and agente.sessoes is not None:
+            agente.sessoes.remover(sessao_id)
         return jsonify({"success": True, "message": "Histórico limpo com sucesso!"})
     except Exception as e:
         return jsonify({"success": False, "error": str(e)}), 500
 
 
 @app.route("/historico/estatisticas")
+@politica_cache("no-store")
 def estatisticas_historico():
     """Retorna estatísticas do histórico."""
     try:
@@ -356,6 +550,7 @@ def estatisticas_historico():
 
 
 @app.route("/historico/sessoes")
+@politica_cache("no-store")
 def listar_sessoes():
     """Lista todas as sessões de conversa."""
     try:
@@ -366,6 +561,7 @@ def listar_sessoes():
 
 
 @app.route("/historico/sessao/<sessao_id>")
+@politica_cache("no-store")
 def carregar_sessao(sessao_id):
     """Carrega mensagens de uma sessão específica."""
     try:
@@ -376,6 +572,8 @@ def carregar_sessao(sessao_id):
 
 
 @app.route("/download-excel-fraude", methods=["GET", "POST"])
+@politica_cache("no-store")
+@perfilavel
 def download_excel_fraude():
     """Endpoint para download do relatório de fraude em Excel"""
     try:
@@ -395,7 +593,7 @@ def download_excel_fraude():
         print("Gerando relatório de fraude para Excel...")
         
         # Executar análise completa de fraude
-        relatorio = agent.detector_fraude.executar_analise_completa_fraude()
+        relatorio = agent.obter_relatorio_fraude()
         
         # Gerar Excel
         excel_buffer = agent.detector_fraude.gerar_excel_relatorio_fraude(relatorio)
@@ -429,15 +627,8 @@ if __name__ == "__main__":
     print("Inicializando histórico de conversas...")
     inicializar_historico()
     
-    print("Inicializando agente MongoDB...")
-    try:
-        agent = get_mongodb_agent()
-        if agent:
-            print("Agente MongoDB inicializado com sucesso!")
-        else:
-            print("Falha ao inicializar agente MongoDB")
-    except Exception as e:
-        print(f"Erro ao inicializar agente: {e}")
+    # O agente já está aquecendo em segundo plano (ver /health)
+    print("Agente MongoDB inicializando em segundo plano...")
     
     print("Acesse: http://localhost:5000")
     